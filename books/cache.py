@@ -0,0 +1,71 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.http import urlencode
+
+from versioned_cache import bump_version, get_version
+
+CATALOG_VERSION_KEY = "books:catalog:version"
+CATALOG_HITS_KEY = "books:catalog:hits"
+CATALOG_MISSES_KEY = "books:catalog:misses"
+
+
+def _cache():
+    return caches[settings.BOOK_CATALOG_CACHE]
+
+
+def _incr(key: str) -> None:
+    try:
+        _cache().incr(key)
+    except ValueError:
+        # key is missing (first call or evicted)
+        _cache().add(key, 1, timeout=None)
+
+
+def get_catalog_version() -> int:
+    """
+    Return current catalog version, every cached catalog
+    response is stored under the version it was built from
+    """
+    return get_version(_cache(), CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version() -> None:
+    """
+    Invalidate all cached catalog responses after current
+    transaction commits, so no reader caches not committed data
+    """
+    bump_version(_cache(), CATALOG_VERSION_KEY)
+
+
+def catalog_cache_key(request, version: int) -> str:
+    """
+    Key by host, path and sorted query string so
+    ?search=a&ordering=author and ?ordering=author&search=a
+    share one entry (pagination links are absolute urls)
+    """
+    query = urlencode(sorted(request.query_params.lists()), doseq=True)
+    digest = hashlib.md5(
+        f"{request.get_host()}{request.path}?{query}".encode()
+    ).hexdigest()
+    return f"books:catalog:{version}:{digest}"
+
+
+def get_cached_catalog(key: str):
+    data = _cache().get(key)
+    _incr(CATALOG_HITS_KEY if data is not None else CATALOG_MISSES_KEY)
+    return data
+
+
+def set_cached_catalog(key: str, data) -> None:
+    _cache().set(key, data, timeout=settings.BOOK_CATALOG_CACHE_TIMEOUT)
+
+
+def catalog_cache_stats() -> dict:
+    stats = _cache().get_many([CATALOG_HITS_KEY, CATALOG_MISSES_KEY])
+    return {
+        "version": get_catalog_version(),
+        "hits": stats.get(CATALOG_HITS_KEY, 0),
+        "misses": stats.get(CATALOG_MISSES_KEY, 0),
+    }
@@ -0,0 +1,81 @@
+# Generated by Django 4.2.8 on 2026-10-18 18:14
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+SEARCH_VECTOR_SQL = """
+setweight(to_tsvector('simple', coalesce({row}title, '')), 'A') ||
+setweight(to_tsvector('simple', coalesce({row}author, '')), 'B')
+"""
+
+FORWARD_SQL = [
+    f"""
+    CREATE OR REPLACE FUNCTION books_book_search_vector_update()
+    RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := {SEARCH_VECTOR_SQL.format(row="NEW.")};
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+    """,
+    """
+    CREATE TRIGGER books_book_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, author ON books_book
+    FOR EACH ROW EXECUTE FUNCTION books_book_search_vector_update();
+    """,
+    f"UPDATE books_book SET search_vector = {SEARCH_VECTOR_SQL.format(row='')};",
+    """
+    CREATE INDEX books_book_search_vector_idx
+    ON books_book USING gin (search_vector);
+    """,
+    """
+    CREATE INDEX books_book_title_trgm_idx
+    ON books_book USING gin (title gin_trgm_ops);
+    """,
+    """
+    CREATE INDEX books_book_author_trgm_idx
+    ON books_book USING gin (author gin_trgm_ops);
+    """,
+]
+
+REVERSE_SQL = [
+    "DROP INDEX IF EXISTS books_book_author_trgm_idx;",
+    "DROP INDEX IF EXISTS books_book_title_trgm_idx;",
+    "DROP INDEX IF EXISTS books_book_search_vector_idx;",
+    "DROP TRIGGER IF EXISTS books_book_search_vector_trigger ON books_book;",
+    "DROP FUNCTION IF EXISTS books_book_search_vector_update();",
+]
+
+
+def run_postgres_only(statements):
+    """Search trigger and GIN indexes exist only on PostgreSQL"""
+
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != "postgresql":
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("books", "0001_initial"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name="book",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunPython(
+            run_postgres_only(FORWARD_SQL),
+            run_postgres_only(REVERSE_SQL),
+        ),
+    ]
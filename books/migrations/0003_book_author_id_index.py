@@ -0,0 +1,22 @@
+# Generated by Django 4.2.8 on 2026-10-18 18:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("books", "0002_book_search_vector"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="book",
+            name="books_book_author_b941fe_idx",
+        ),
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(
+                fields=["author", "id"], name="books_book_author_d7b22f_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.8 on 2026-10-18 18:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("books", "0003_book_author_id_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="book",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -1,4 +1,28 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import F
+from django.utils import timezone
+
+
+class BookQuerySet(models.QuerySet):
+    def reserve(self, book_id: int) -> bool:
+        """
+        Take one copy of book in single conditional UPDATE,
+        return False if book is out of stock
+        """
+        return bool(
+            self.filter(pk=book_id, inventory__gt=0).update(
+                inventory=F("inventory") - 1, updated_at=timezone.now()
+            )
+        )
+
+    def release(self, book_id: int) -> bool:
+        """Put one copy of book back to inventory"""
+        return bool(
+            self.filter(pk=book_id).update(
+                inventory=F("inventory") + 1, updated_at=timezone.now()
+            )
+        )
 
 
 class Book(models.Model):
@@ -15,11 +39,18 @@ class Book(models.Model):
     )
     inventory = models.PositiveIntegerField()
     daily_fee = models.DecimalField(decimal_places=2, max_digits=20)
+    updated_at = models.DateTimeField(auto_now=True)
+    # maintained by database trigger on PostgreSQL
+    # (see 0002_book_search_vector migration)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = BookQuerySet.as_manager()
 
     class Meta:
         indexes = [
             models.Index(fields=["title"]),
-            models.Index(fields=["author"]),
+            # also serves keyset pagination seek on (author, id)
+            models.Index(fields=["author", "id"]),
         ]
 
     def __str__(self):
@@ -0,0 +1,53 @@
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    TrigramWordSimilarity,
+)
+from django.db import connections
+from django.db.models import F, Q, QuerySet
+from django.db.models.functions import Greatest
+
+from rest_framework.filters import SearchFilter
+
+# text search configuration used by the search_vector trigger,
+# 'simple' doesn't stem words so author names are kept as they are
+SEARCH_CONFIG = "simple"
+
+
+class BookSearchFilter(SearchFilter):
+    """
+    Full text + trigram search over Book title and author.
+    On PostgreSQL the query is served by GIN indexes on
+    Book.search_vector and on title/author trigrams and results
+    are ordered by relevance. On other databases (SQLite in tests)
+    it falls back to the default DRF icontains search.
+    """
+
+    def filter_queryset(self, request, queryset: QuerySet, view):
+        search_terms = self.get_search_terms(request)
+        if not search_terms:
+            return queryset
+
+        if connections[queryset.db].vendor != "postgresql":
+            return super().filter_queryset(request, queryset, view)
+
+        term = " ".join(search_terms)
+        query = SearchQuery(
+            term, config=SEARCH_CONFIG, search_type="websearch"
+        )
+
+        return (
+            queryset.filter(
+                Q(search_vector=query)
+                | Q(title__trigram_word_similar=term)
+                | Q(author__trigram_word_similar=term)
+            )
+            .annotate(
+                rank=SearchRank(F("search_vector"), query)
+                + Greatest(
+                    TrigramWordSimilarity(term, "title"),
+                    TrigramWordSimilarity(term, "author"),
+                )
+            )
+            .order_by("-rank", "id")
+        )
@@ -6,7 +6,7 @@ from .models import Book
 class BookSerializer(ModelSerializer):
     class Meta:
         model = Book
-        fields = "__all__"
+        exclude = ["search_vector", "updated_at"]
 
 
 class BookListSerializer(ModelSerializer):
@@ -18,4 +18,4 @@ class BookListSerializer(ModelSerializer):
 class BookDetailSerializer(ModelSerializer):
     class Meta:
         model = Book
-        fields = "__all__"
+        exclude = ["search_vector", "updated_at"]
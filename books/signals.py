@@ -0,0 +1,18 @@
+from django.dispatch import receiver
+from django.db.models.signals import post_save, post_delete
+
+from conditional_requests import mark_deleted
+from .cache import bump_catalog_version
+from .models import Book
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_book_catalog(sender, instance: Book, **kwargs):
+    """Any change of book makes cached catalog responses stale"""
+    bump_catalog_version()
+
+
+@receiver(post_delete, sender=Book)
+def mark_book_deleted(sender, instance: Book, **kwargs):
+    mark_deleted(Book)
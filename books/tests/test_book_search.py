@@ -0,0 +1,54 @@
+from unittest import skipUnless
+
+from django.core.cache import caches
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from test_utils.book_samples import book_sample
+
+BOOK_LIST_URL = reverse("book:book-list")
+
+
+class BookSearchTests(TestCase):
+    def setUp(self) -> None:
+        # catalog responses of other tests are cached under same version
+        caches[settings.BOOK_CATALOG_CACHE].clear()
+        self.client = APIClient()
+        book_sample("War and Peace", author="Leo Tolstoy")
+        book_sample("Anna Karenina", author="Leo Tolstoy")
+        book_sample("Crime and Punishment", author="Fyodor Dostoevsky")
+
+    def search(self, term: str) -> list:
+        res = self.client.get(BOOK_LIST_URL, {"search": term})
+        return [book["title"] for book in res.data["results"]]
+
+    def test_search_by_title_and_author(self):
+        self.assertEqual(self.search("Crime"), ["Crime and Punishment"])
+        self.assertEqual(
+            sorted(self.search("Tolstoy")), ["Anna Karenina", "War and Peace"]
+        )
+
+    def test_no_match(self):
+        self.assertEqual(self.search("Hemingway"), [])
+
+    @skipUnless(connection.vendor != "postgresql", "SearchFilter fallback")
+    def test_fallback_matches_substrings(self):
+        self.assertEqual(self.search("arenin"), ["Anna Karenina"])
+
+    @skipUnless(connection.vendor == "postgresql", "PostgreSQL search")
+    def test_results_are_ordered_by_rank_and_tolerate_typos(self):
+        book_sample("Peace Talks", author="Anon")
+
+        # both words of websearch query match, ranked above
+        # trigram match of one word
+        self.assertEqual(
+            self.search("war peace"), ["War and Peace", "Peace Talks"]
+        )
+        # trigram word similarity finds misspelled author
+        self.assertEqual(
+            self.search("Dostoevski"), ["Crime and Punishment"]
+        )
@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from books.cache import get_catalog_version
+
+from test_utils.book_samples import book_sample
+
+BOOK_LIST_URL = reverse("book:book-list")
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self) -> None:
+        caches[settings.BOOK_CATALOG_CACHE].clear()
+        self.client = APIClient()
+        self.book = book_sample("Cached Book")
+
+    def list_books(self, **params):
+        res = self.client.get(BOOK_LIST_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res
+
+    def test_second_request_is_served_from_cache(self):
+        self.assertEqual(self.list_books()["X-Cache"], "MISS")
+
+        with self.assertNumQueries(0):
+            res = self.list_books()
+
+        self.assertEqual(res["X-Cache"], "HIT")
+        self.assertEqual(res.data["results"][0]["title"], "Cached Book")
+
+    def test_query_params_order_shares_entry(self):
+        self.list_books(search="Cached", ordering="author")
+
+        res = self.client.get(f"{BOOK_LIST_URL}?ordering=author&search=Cached")
+
+        self.assertEqual(res["X-Cache"], "HIT")
+
+    def test_book_change_bumps_version_after_commit(self):
+        self.list_books()
+        version = get_catalog_version()
+        admin = get_user_model().objects.create_superuser(
+            email="admin@gmail.com", password="rvtquen"
+        )
+        self.client.force_authenticate(admin)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                reverse("book:book-detail", args=[self.book.id]),
+                {"title": "Renamed Book"},
+            )
+
+        self.assertGreater(get_catalog_version(), version)
+        res = self.list_books()
+        self.assertEqual(res["X-Cache"], "MISS")
+        self.assertEqual(res.data["results"][0]["title"], "Renamed Book")
+
+    def test_deleted_book_is_not_served(self):
+        self.list_books()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.delete()
+
+        res = self.list_books()
+        self.assertEqual(res["X-Cache"], "MISS")
+        self.assertEqual(res.data["results"], [])
@@ -1,13 +1,25 @@
 from rest_framework import viewsets
+from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.response import Response
+from rest_framework.filters import OrderingFilter
 
 from drf_spectacular.utils import (
     extend_schema,
     OpenApiParameter,
 )
 
+from conditional_requests import ConditionalGetMixin
+
+from .cache import (
+    catalog_cache_key,
+    catalog_cache_stats,
+    get_cached_catalog,
+    get_catalog_version,
+    set_cached_catalog,
+)
 from .models import Book
+from .search import BookSearchFilter
 from .serializers import (
     BookSerializer,
     BookListSerializer,
@@ -15,12 +27,16 @@ from .serializers import (
 )
 
 
-class BookViewSet(viewsets.ModelViewSet):
+class BookViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     serializer_class = BookSerializer
     queryset = Book.objects.all()
-    filter_backends = [SearchFilter, OrderingFilter]
+    filter_backends = [BookSearchFilter, OrderingFilter]
     search_fields = ["title", "author"]
     ordering_fields = ["author"]
+    # seek columns for ?pagination=cursor, see paginations.KeysetPagination
+    cursor_ordering = ("author", "id")
+
+    catalog_key = None
 
     def get_serializer_class(self):
         self.serializer_class = {
@@ -30,6 +46,19 @@ class BookViewSet(viewsets.ModelViewSet):
 
         return self.serializer_class.get(self.action, BookSerializer)
 
+    def get_conditional_validators(self, request):
+        """
+        Catalog version changes on every book change so list
+        validator is built without querying database
+        """
+        if self.action == "list":
+            self.catalog_key = catalog_cache_key(
+                request, get_catalog_version()
+            )
+            # key is "books:catalog:<version>:<query digest>"
+            return self.catalog_key.split(":", 2)[-1], None
+        return super().get_conditional_validators(request)
+
     def get_permissions(self):
         if self.action in [
             "update",
@@ -52,8 +81,8 @@ class BookViewSet(viewsets.ModelViewSet):
             OpenApiParameter(
                 name="search",
                 description=(
-                    "Search books by title or author,"
-                    " ?search=title/author"
+                    "Search books by title or author, results are"
+                    " ordered by relevance ?search=title/author"
                 ),
                 type=str,
                 required=False,
@@ -67,4 +96,24 @@ class BookViewSet(viewsets.ModelViewSet):
         ]
     )
     def list(self, request, *args, **kwargs):
-        return super().list(request, *args, **kwargs)
+        """
+        Catalog is the same for every user so responses are cached
+        per query string under the current catalog version,
+        cache hit skips database and serializer
+        """
+        key = self.catalog_key or catalog_cache_key(
+            request, get_catalog_version()
+        )
+        data = get_cached_catalog(key)
+        if data is not None:
+            return Response(data, headers={"X-Cache": "HIT"})
+
+        response = super().list(request, *args, **kwargs)
+        set_cached_catalog(key, response.data)
+        response["X-Cache"] = "MISS"
+        return response
+
+    @action(detail=False, methods=["get"], permission_classes=[IsAdminUser])
+    def cache_stats(self, request, *args, **kwargs):
+        """Return catalog cache version and hit/miss counters"""
+        return Response(catalog_cache_stats())
@@ -1,5 +1,15 @@
 from django.contrib import admin
 
-from .models import Borrowing
+from .models import Borrowing, TelegramNotification
+from .telegram_outbox import enqueue_borrowing_notification
 
-admin.site.register(Borrowing)
+
+@admin.register(Borrowing)
+class BorrowingAdmin(admin.ModelAdmin):
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if not change:
+            enqueue_borrowing_notification(obj)
+
+
+admin.site.register(TelegramNotification)
@@ -0,0 +1,143 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+
+from books.models import Book
+
+
+def naive_checkout(book_id: int, session_latency: float) -> bool:
+    """Old checkout: read inventory in Python and save whole row"""
+    with transaction.atomic():
+        book = Book.objects.get(pk=book_id)
+        if book.inventory < 1:
+            return False
+        book.inventory -= 1
+        book.save()
+        # Stripe Session was created inside checkout transaction
+        time.sleep(session_latency)
+        return True
+
+
+def atomic_checkout(book_id: int, session_latency: float) -> bool:
+    """Conditional UPDATE, Stripe call still holds book row lock"""
+    with transaction.atomic():
+        reserved = Book.objects.reserve(book_id)
+        if reserved:
+            time.sleep(session_latency)
+        return reserved
+
+
+def two_phase_checkout(book_id: int, session_latency: float) -> bool:
+    """Current checkout: commit reservation, then call Stripe"""
+    with transaction.atomic():
+        reserved = Book.objects.reserve(book_id)
+    if reserved:
+        time.sleep(session_latency)
+    return reserved
+
+
+class Command(BaseCommand):
+    """
+    Run concurrent checkouts of one hot book and compare
+    throughput, latency and lost updates of naive and atomic
+    reservation and of two phase checkout which creates Stripe
+    Session (simulated by --session-latency) after commit.
+    Use PostgreSQL, SQLite serializes all writers.
+    """
+
+    modes = {
+        "naive": naive_checkout,
+        "atomic": atomic_checkout,
+        "two-phase": two_phase_checkout,
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument("--checkouts", type=int, default=2000)
+        parser.add_argument(
+            "--inventory",
+            type=int,
+            default=None,
+            help="Hot book inventory, defaults to number of checkouts",
+        )
+        parser.add_argument(
+            "--mode", choices=[*self.modes, "all"], default="all"
+        )
+        parser.add_argument(
+            "--session-latency",
+            type=float,
+            default=0,
+            help="Simulated Stripe Session create time in milliseconds",
+        )
+
+    def handle(self, *args, **options):
+        modes = (
+            list(self.modes) if options["mode"] == "all"
+            else [options["mode"]]
+        )
+        inventory = options["inventory"] or options["checkouts"]
+
+        for mode in modes:
+            self.run_mode(
+                mode,
+                options["threads"],
+                options["checkouts"],
+                inventory,
+                options["session_latency"] / 1000,
+            )
+
+    def run_mode(self, mode, threads, checkouts, inventory, latency):
+        book = Book.objects.create(
+            title=f"benchmark-{uuid.uuid4().hex[:16]}",
+            author="benchmark",
+            inventory=inventory,
+            daily_fee=1,
+        )
+        checkout = self.modes[mode]
+
+        def worker(attempts: int) -> tuple:
+            reserved, timings = 0, []
+            try:
+                for _ in range(attempts):
+                    start = time.perf_counter()
+                    reserved += checkout(book.id, latency)
+                    timings.append(time.perf_counter() - start)
+                return reserved, timings
+            finally:
+                # every thread has it's own database connection
+                connection.close()
+
+        per_thread = [checkouts // threads] * threads
+        for index in range(checkouts % threads):
+            per_thread[index] += 1
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            results = list(executor.map(worker, per_thread))
+        elapsed = time.perf_counter() - start
+        reserved = sum(result[0] for result in results)
+        timings = sorted(
+            timing for result in results for timing in result[1]
+        )
+        p50 = timings[len(timings) // 2] * 1000
+        p99 = timings[min(len(timings) - 1, len(timings) * 99 // 100)] * 1000
+
+        book.refresh_from_db()
+        # decrements overwritten by concurrent saves
+        lost_updates = book.inventory - (inventory - reserved)
+        book.delete()
+
+        self.stdout.write(
+            f"{mode}: {checkouts} checkouts by {threads} threads "
+            f"in {elapsed:.2f}s, {checkouts / elapsed:.0f} checkouts/s, "
+            f"p50 {p50:.1f} ms, p99 {p99:.1f} ms, "
+            f"reserved {reserved}, inventory left {book.inventory}, "
+            f"lost updates {lost_updates}"
+        )
+        if lost_updates:
+            self.stdout.write(self.style.ERROR(
+                f"{mode}: inventory is inconsistent")
+            )
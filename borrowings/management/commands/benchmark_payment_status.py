@@ -0,0 +1,222 @@
+import json
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max, Min, OuterRef, Q, Subquery
+
+from books.models import Book
+from borrowings.models import Borrowing
+from payments.models import Payment
+
+BENCHMARK_PREFIX = "benchmark-payment-status"
+
+
+def subqueries(queryset):
+    """Old payment status: two correlated subqueries per row"""
+    payment_subquery = Payment.objects.filter(
+        borrowing=OuterRef("pk"), type="PAYMENT"
+    ).values("status")
+    fine_subquery = Payment.objects.filter(
+        borrowing=OuterRef("pk"), type="FINE"
+    ).values("status")
+    return queryset.annotate(
+        payment_status=Subquery(payment_subquery),
+        fine_status=Subquery(fine_subquery),
+    )
+
+
+def aggregate_join(queryset):
+    """Grouped conditional aggregate joined to every borrowing row"""
+    return queryset.annotate(
+        payment_status=Max(
+            "payments__status", filter=Q(payments__type="PAYMENT")
+        ),
+        fine_status=Max("payments__status", filter=Q(payments__type="FINE")),
+        pending_payment_id=Min(
+            "payments__id", filter=Q(payments__status="PENDING")
+        ),
+    )
+
+
+class Command(BaseCommand):
+    """
+    Compare plan cost and latency of borrowing pages with payment
+    status from correlated subqueries, from grouped aggregate joined
+    to borrowings and from grouped query over page rows payments
+    (what BorrowingViewSet does). Needs PostgreSQL.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--seed",
+            action="store_true",
+            help="Insert benchmark borrowings with payments first",
+        )
+        parser.add_argument("--borrowings", type=int, default=1_000_000)
+        parser.add_argument("--page-size", type=int, default=30)
+        parser.add_argument("--offset", type=int, default=0)
+        parser.add_argument("--runs", type=int, default=5)
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Delete benchmark books, users and their borrowings",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Benchmark needs PostgreSQL database")
+
+        if options["clear"]:
+            self.clear()
+            return
+        if options["seed"]:
+            self.seed(options["borrowings"])
+
+        queryset = (
+            Borrowing.objects.with_prices()
+            .select_related("book", "user")
+            .order_by("-borrow_date", "-id")
+        )
+        page = slice(
+            options["offset"], options["offset"] + options["page_size"]
+        )
+        strategies = {
+            "subqueries": lambda: self.run_annotated(
+                subqueries(queryset), page
+            ),
+            "aggregate join": lambda: self.run_annotated(
+                aggregate_join(queryset), page
+            ),
+            "grouped page": lambda: self.run_grouped(queryset, page),
+        }
+        for name, strategy in strategies.items():
+            timings = []
+            for _ in range(options["runs"]):
+                start = time.perf_counter()
+                cost = strategy()
+                timings.append(time.perf_counter() - start)
+            self.stdout.write(
+                f"{name}: plan cost {cost:.0f}, median "
+                f"{statistics.median(timings) * 1000:.1f} ms "
+                f"over {options['runs']} runs"
+            )
+
+    @staticmethod
+    def explain_cost(queryset) -> float:
+        plan = json.loads(queryset.explain(format="json"))
+        return plan[0]["Plan"]["Total Cost"]
+
+    def run_annotated(self, queryset, page: slice) -> float:
+        list(queryset[page])
+        return self.explain_cost(queryset[page])
+
+    def run_grouped(self, queryset, page: slice) -> float:
+        borrowings = list(queryset[page])
+        summary = Payment.objects.borrowing_summary(
+            [borrowing.id for borrowing in borrowings]
+        )
+        list(summary)
+        return self.explain_cost(queryset[page]) + self.explain_cost(summary)
+
+    @transaction.atomic
+    def seed(self, borrowings: int):
+        users = get_user_model().objects.bulk_create(
+            get_user_model()(
+                email=f"{BENCHMARK_PREFIX}-{index}@example.com",
+                password="!",
+            )
+            for index in range(1000)
+        )
+        books = Book.objects.bulk_create(
+            Book(
+                title=f"{BENCHMARK_PREFIX}-{index}",
+                author=BENCHMARK_PREFIX,
+                inventory=1000,
+                daily_fee=1,
+            )
+            for index in range(1000)
+        )
+        book_ids = [book.id for book in books]
+        with connection.cursor() as cursor:
+            # every 10th borrowing is active and unpaid,
+            # every 20th has a fine
+            cursor.execute(
+                f"""
+                INSERT INTO {Borrowing._meta.db_table} (
+                    borrow_date, expected_return_date, actual_return_date,
+                    updated_at, book_id, user_id
+                )
+                SELECT
+                    CURRENT_DATE - (n %% 3650),
+                    CURRENT_DATE - (n %% 3650) + 14,
+                    CASE WHEN n %% 10 = 0 THEN NULL
+                         ELSE CURRENT_DATE - (n %% 3650) + 7 END,
+                    NOW(),
+                    (%(books)s::int[])[1 + n %% %(books_count)s],
+                    (%(users)s::bigint[])[1 + n %% %(users_count)s]
+                FROM generate_series(1, %(borrowings)s) AS n
+                """,
+                {
+                    "books": book_ids,
+                    "books_count": len(book_ids),
+                    "users": [user.id for user in users],
+                    "users_count": len(users),
+                    "borrowings": borrowings,
+                },
+            )
+            cursor.execute(
+                f"""
+                INSERT INTO {Payment._meta.db_table} (
+                    status, type, borrowing_id, session_url,
+                    session_id, money_to_pay, updated_at
+                )
+                SELECT
+                    CASE WHEN id %% 10 = 0 THEN 'PENDING' ELSE 'PAID' END,
+                    'PAYMENT', id, 'https://checkout.stripe.com/',
+                    %s || '-' || id, 14, NOW()
+                FROM {Borrowing._meta.db_table}
+                WHERE book_id = ANY(%s)
+                UNION ALL
+                SELECT
+                    'PENDING', 'FINE', id, 'https://checkout.stripe.com/',
+                    %s || '-fine-' || id, 7, NOW()
+                FROM {Borrowing._meta.db_table}
+                WHERE book_id = ANY(%s) AND id %% 20 = 0
+                """,
+                [
+                    BENCHMARK_PREFIX, book_ids,
+                    BENCHMARK_PREFIX, book_ids,
+                ],
+            )
+            cursor.execute(f"ANALYZE {Borrowing._meta.db_table}")
+            cursor.execute(f"ANALYZE {Payment._meta.db_table}")
+        self.stdout.write(f"Seeded {borrowings} borrowings")
+
+    @transaction.atomic
+    def clear(self):
+        # raw DELETE, CASCADE of million rows in Python is too slow
+        books = f"""
+            SELECT id FROM {Book._meta.db_table} WHERE author = %s
+        """
+        borrowings = f"""
+            SELECT id FROM {Borrowing._meta.db_table}
+            WHERE book_id IN ({books})
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {Payment._meta.db_table} "
+                f"WHERE borrowing_id IN ({borrowings})",
+                [BENCHMARK_PREFIX],
+            )
+            cursor.execute(
+                f"DELETE FROM {Borrowing._meta.db_table} "
+                f"WHERE book_id IN ({books})",
+                [BENCHMARK_PREFIX],
+            )
+        Book.objects.filter(author=BENCHMARK_PREFIX).delete()
+        get_user_model().objects.filter(
+            email__startswith=BENCHMARK_PREFIX
+        ).delete()
@@ -0,0 +1,109 @@
+import asyncio
+import time
+import urllib.parse
+
+import httpx
+
+from django.core.management import BaseCommand
+
+from borrowings.telegram_notification import TelegramNotifier
+from test_utils.fake_telegram_api import FakeTelegramApi
+
+
+async def send_unpooled(api_url: str, chat_id: str, text: str) -> dict:
+    """Old sender: new client and GET query string per message"""
+    async with httpx.AsyncClient() as client:
+        response = await client.get(
+            f"{api_url}/bottoken/sendMessage?chat_id={chat_id}"
+            f"&text={urllib.parse.quote(text, safe='')}"
+        )
+        return response.json()
+
+
+class Command(BaseCommand):
+    """
+    Send messages to local fake Bot API with one client per
+    message (old sender) and with pooled TelegramNotifier,
+    report messages sent per second and opened connections
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=1000)
+        parser.add_argument("--chats", type=int, default=10)
+        parser.add_argument(
+            "--rate-limit",
+            type=int,
+            default=10000,
+            help="Notifier bot wide limit, messages per second",
+        )
+        parser.add_argument(
+            "--rate-limited",
+            type=int,
+            default=0,
+            help="Number of requests fake API answers with 429",
+        )
+
+    def handle(self, *args, **options):
+        messages = [
+            (f"-{index % options['chats'] + 1}", f"Message {index}")
+            for index in range(options["messages"])
+        ]
+
+        with FakeTelegramApi() as api:
+            api.rate_limit_next = options["rate_limited"]
+            # old sender doesn't retry 429, don't count them for it
+            unpooled = self.run_unpooled(api, messages)
+            self.report("unpooled GET", api, *unpooled)
+
+        with FakeTelegramApi() as api:
+            api.rate_limit_next = options["rate_limited"]
+            notifier = TelegramNotifier(
+                "token",
+                api_url=api.url,
+                rate_limit=options["rate_limit"],
+                chat_rate_limit=(options["rate_limit"], 1),
+            )
+            self.report("pooled notifier", api, *self.run_pooled(
+                notifier, messages
+            ))
+            self.stdout.write(f"notifier stats: {notifier.stats()}")
+
+    @staticmethod
+    def run_unpooled(api: FakeTelegramApi, messages: list) -> tuple:
+        async def send_all():
+            # old sender had no limit on concurrent connections
+            semaphore = asyncio.Semaphore(20)
+
+            async def send(chat_id, text):
+                async with semaphore:
+                    return await send_unpooled(api.url, chat_id, text)
+
+            return await asyncio.gather(
+                *[send(chat_id, text) for chat_id, text in messages]
+            )
+
+        start = time.perf_counter()
+        responses = asyncio.run(send_all())
+        return responses, time.perf_counter() - start
+
+    @staticmethod
+    def run_pooled(notifier: TelegramNotifier, messages: list) -> tuple:
+        async def send_all():
+            return await asyncio.gather(
+                *[
+                    notifier.send_message(chat_id, text)
+                    for chat_id, text in messages
+                ]
+            )
+
+        start = time.perf_counter()
+        responses = notifier.run(send_all())
+        return responses, time.perf_counter() - start
+
+    def report(self, name, api, responses, elapsed):
+        sent = sum(1 for response in responses if response and response["ok"])
+        self.stdout.write(
+            f"{name}: sent {sent}/{len(responses)} in {elapsed:.2f}s, "
+            f"{sent / elapsed:.0f} messages/s, "
+            f"{api.connections} connections, {len(api.requests)} requests"
+        )
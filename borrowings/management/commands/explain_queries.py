@@ -0,0 +1,149 @@
+import re
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.utils import timezone
+
+from borrowings.models import Borrowing
+from borrowings.views import BorrowingViewSet
+from payments.models import Payment
+from payments.views import PaymentViewSet
+
+# "Seq Scan on table" on PostgreSQL, "SCAN table" on SQLite
+SEQ_SCAN = re.compile(r"(?:Seq Scan on|SCAN) \"?(\w+)\"?")
+# tables which grow with every borrowing, small ones may be scanned
+WATCHED_TABLES = {Borrowing._meta.db_table, Payment._meta.db_table}
+
+
+def endpoint_queryset(viewset, user, **params):
+    """Queryset of viewset list action page for given query params"""
+    view = viewset(action_map={"get": "list"}, kwargs={}, format_kwarg=None)
+    request = view.initialize_request(RequestFactory().get("/", params))
+    request.user = user
+    view.request = request
+
+    queryset = view.filter_queryset(view.get_queryset())
+    ordering = view.paginator.keyset_pagination_class().get_ordering(
+        request, queryset, view
+    )
+    return queryset.order_by(*ordering)[:view.paginator.page_size]
+
+
+class Command(BaseCommand):
+    """
+    Print EXPLAIN plan of every hot borrowing and payment query,
+    run it after changing queries or indexes to check that
+    they are still index backed.
+    Plans are only meaningful on a database with production-like data.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--analyze",
+            action="store_true",
+            help="Run EXPLAIN ANALYZE (PostgreSQL only)",
+        )
+        parser.add_argument(
+            "--query",
+            action="append",
+            help="Explain only queries which name contains the value",
+        )
+        parser.add_argument(
+            "--fail-on-seq-scan",
+            action="store_true",
+            help="Exit with error if any plan scans a whole table",
+        )
+
+    def get_queries(self) -> dict:
+        users = get_user_model().objects
+        staff = users.filter(is_staff=True).first()
+        user = users.filter(is_staff=False, borrowings__isnull=False).first()
+        if staff is None or user is None:
+            raise CommandError(
+                "Need staff user and user with borrowings to explain queries"
+            )
+
+        borrowing = Borrowing.objects.filter(user=user).first()
+        page_ids = list(
+            endpoint_queryset(BorrowingViewSet, staff).values_list(
+                "id", flat=True
+            )
+        )
+        tomorrow = timezone.now().date() + timedelta(days=1)
+
+        return {
+            "borrowings: staff list": endpoint_queryset(
+                BorrowingViewSet, staff
+            ),
+            "borrowings: staff ?is_active=True": endpoint_queryset(
+                BorrowingViewSet, staff, is_active="True"
+            ),
+            "borrowings: staff ?is_overdue=True": endpoint_queryset(
+                BorrowingViewSet, staff, is_overdue="True"
+            ),
+            "borrowings: staff ?min_overdue_days=7": endpoint_queryset(
+                BorrowingViewSet, staff, min_overdue_days=7
+            ),
+            "borrowings: staff ?user_id=": endpoint_queryset(
+                BorrowingViewSet, staff, user_id=user.id
+            ),
+            "borrowings: user list": endpoint_queryset(
+                BorrowingViewSet, user
+            ),
+            "borrowings: user ?is_active=True": endpoint_queryset(
+                BorrowingViewSet, user, is_active="True"
+            ),
+            "borrowings: page payment summary": (
+                Payment.objects.borrowing_summary(page_ids)
+            ),
+            "borrowings: overdue scan": Borrowing.objects.due(tomorrow),
+            "borrowings: create pending payments check": (
+                Payment.objects.filter(
+                    borrowing__user=user, status="PENDING"
+                )
+            ),
+            "borrowings: renew expired payments": (
+                borrowing.payments.filter(status="EXPIRED")
+            ),
+            "payments: staff list": endpoint_queryset(PaymentViewSet, staff),
+            "payments: user list": endpoint_queryset(PaymentViewSet, user),
+            "payments: pending sessions": Payment.objects.filter(
+                status="PENDING"
+            ),
+        }
+
+    def handle(self, *args, **options):
+        explain_options = {}
+        if options["analyze"]:
+            if connection.vendor != "postgresql":
+                raise CommandError("--analyze needs PostgreSQL database")
+            explain_options = {"analyze": True, "buffers": True}
+
+        seq_scans = {}
+        for name, queryset in self.get_queries().items():
+            if options["query"] and not any(
+                part in name for part in options["query"]
+            ):
+                continue
+
+            plan = queryset.explain(**explain_options)
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(plan + "\n")
+
+            tables = sorted(set(SEQ_SCAN.findall(plan)) & WATCHED_TABLES)
+            if tables:
+                seq_scans[name] = tables
+                self.stdout.write(self.style.WARNING(
+                    f"Sequential scan on {', '.join(tables)}\n"
+                ))
+
+        if seq_scans and options["fail_on_seq_scan"]:
+            raise CommandError(
+                "Not index backed: " + "; ".join(
+                    f"{name} ({', '.join(tables)})"
+                    for name, tables in seq_scans.items()
+                )
+            )
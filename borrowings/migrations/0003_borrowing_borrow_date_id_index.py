@@ -0,0 +1,18 @@
+# Generated by Django 4.2.8 on 2026-10-18 18:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("borrowings", "0002_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="borrowing",
+            index=models.Index(
+                fields=["borrow_date", "id"], name="borrowings__borrow__0537d6_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.8 on 2026-10-18 18:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("borrowings", "0004_borrowing_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="borrowing",
+            index=models.Index(
+                condition=models.Q(("actual_return_date__isnull", True)),
+                fields=["borrow_date", "id"],
+                name="borrowing_active_date_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="borrowing",
+            index=models.Index(
+                condition=models.Q(("actual_return_date__isnull", True)),
+                fields=["expected_return_date"],
+                name="borrowing_active_due_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="borrowing",
+            index=models.Index(
+                fields=["user", "borrow_date", "id"], name="borrowing_user_date_idx"
+            ),
+        ),
+    ]
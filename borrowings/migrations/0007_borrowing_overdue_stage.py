@@ -0,0 +1,39 @@
+# Generated by Django 4.2.8 on 2026-10-18 19:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("borrowings", "0006_telegramnotification"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OverdueScan",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField(unique=True)),
+                ("notified", models.PositiveIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="borrowing",
+            name="overdue_notified_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="borrowing",
+            name="overdue_stage",
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.8 on 2026-10-18 19:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("borrowings", "0007_borrowing_overdue_stage"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="telegramnotification",
+            name="telegram_pending_idx",
+        ),
+        migrations.AddField(
+            model_name="telegramnotification",
+            name="claimed_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name="telegramnotification",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("PENDING", "pending"),
+                    ("SENDING", "sending"),
+                    ("SENT", "sent"),
+                    ("FAILED", "failed"),
+                ],
+                default="PENDING",
+                max_length=8,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="telegramnotification",
+            index=models.Index(
+                condition=models.Q(("status__in", ["PENDING", "SENDING"])),
+                fields=["id"],
+                name="telegram_unsent_idx",
+            ),
+        ),
+    ]
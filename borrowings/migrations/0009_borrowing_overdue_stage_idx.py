@@ -0,0 +1,20 @@
+# Generated by Django 4.2.8 on 2026-10-18 20:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("borrowings", "0008_telegramnotification_claim"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="borrowing",
+            index=models.Index(
+                condition=models.Q(("actual_return_date__isnull", True)),
+                fields=["overdue_stage", "expected_return_date"],
+                name="borrowing_overdue_stage_idx",
+            ),
+        ),
+    ]
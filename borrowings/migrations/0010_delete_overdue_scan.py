@@ -0,0 +1,15 @@
+# Generated by Django 4.2.8 on 2026-10-18 20:29
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("borrowings", "0009_borrowing_overdue_stage_idx"),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name="OverdueScan",
+        ),
+    ]
@@ -1,11 +1,26 @@
 from datetime import timedelta
 
 from django.utils import timezone
-from django.db import models
+from django.db import models, transaction
+from django.db.models import (
+    BooleanField,
+    Case,
+    DateField,
+    DecimalField,
+    ExpressionWrapper,
+    F,
+    Func,
+    IntegerField,
+    Q,
+    Value,
+    When,
+)
+from django.db.models.functions import Greatest
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.contrib.auth import get_user_model
 
+from books.cache import bump_catalog_version
 from books.models import Book
 
 
@@ -13,10 +28,89 @@ def overdue_day():
     return timezone.now().date() + timedelta(days=1)
 
 
+class DaysBetween(Func):
+    """
+    Number of days from start date to end date,
+    date - date is integer number of days in PostgreSQL
+    """
+
+    arity = 2
+    template = "(%(expressions)s)"
+    arg_joiner = " - "
+    output_field = IntegerField()
+
+    def __init__(self, end, start, **extra):
+        super().__init__(end, start, **extra)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler,
+            connection,
+            template="CAST(julianday(%(expressions)s) AS INTEGER)",
+            arg_joiner=") - julianday(",
+            **extra_context,
+        )
+
+
+class BorrowingQuerySet(models.QuerySet):
+    def due(self, day):
+        """Not returned borrowings expected back by given day"""
+        return self.filter(
+            actual_return_date__isnull=True, expected_return_date__lte=day
+        )
+
+    def with_prices(self):
+        """
+        Annotate the same values as Borrowing.is_overdue,
+        num_of_borrowing_days(), num_of_overdue_days(),
+        price_for_borrowing() and fee_price() computed by
+        database, so they can be filtered and ordered in SQL
+        """
+        today = timezone.now().date()
+        is_overdue = Q(
+            actual_return_date__isnull=True, expected_return_date__lt=today
+        )
+        money = DecimalField(max_digits=20, decimal_places=2)
+
+        return self.annotate(
+            overdue=ExpressionWrapper(is_overdue, output_field=BooleanField()),
+            borrowing_days=Greatest(
+                DaysBetween(F("expected_return_date"), F("borrow_date")),
+                Value(1),
+            ),
+            overdue_days=Case(
+                When(
+                    is_overdue,
+                    then=DaysBetween(
+                        Value(today + timedelta(days=1), DateField()),
+                        F("expected_return_date"),
+                    ),
+                ),
+                default=Value(0),
+            ),
+        ).annotate(
+            borrowing_price=ExpressionWrapper(
+                F("borrowing_days") * F("book__daily_fee"),
+                output_field=money,
+            ),
+            fine_price=ExpressionWrapper(
+                F("overdue_days")
+                * F("book__daily_fee")
+                * Value(settings.FINE_MULTIPLIER),
+                output_field=money,
+            ),
+        )
+
+
 class Borrowing(models.Model):
     borrow_date = models.DateField(auto_now_add=True)
     expected_return_date = models.DateField()
     actual_return_date = models.DateField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # last OVERDUE_ESCALATION_DAYS stage user was notified about,
+    # 0 until first overdue notification
+    overdue_stage = models.PositiveSmallIntegerField(default=0)
+    overdue_notified_at = models.DateTimeField(blank=True, null=True)
     book = models.ForeignKey(
         Book,
         related_name="borrowings",
@@ -28,9 +122,58 @@ class Borrowing(models.Model):
         on_delete=models.CASCADE,
     )
 
+    class Meta:
+        indexes = [
+            # keyset pagination seek on (borrow_date, id)
+            models.Index(fields=["borrow_date", "id"]),
+            # ?is_active=True pages in the same order
+            models.Index(
+                fields=["borrow_date", "id"],
+                condition=Q(actual_return_date__isnull=True),
+                name="borrowing_active_date_idx",
+            ),
+            # overdue scan, ?is_overdue=True and ?min_overdue_days=
+            models.Index(
+                fields=["expected_return_date"],
+                condition=Q(actual_return_date__isnull=True),
+                name="borrowing_active_due_idx",
+            ),
+            # overdue notification, borrowings not notified about
+            # their escalation stage yet
+            models.Index(
+                fields=["overdue_stage", "expected_return_date"],
+                condition=Q(actual_return_date__isnull=True),
+                name="borrowing_overdue_stage_idx",
+            ),
+            # user own borrowings and ?user_id= in page order
+            models.Index(
+                fields=["user", "borrow_date", "id"],
+                name="borrowing_user_date_idx",
+            ),
+        ]
+
+    objects = BorrowingQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # due date as loaded, to reset overdue stage when it changes
+        instance._loaded_return_date = instance.__dict__.get(
+            "expected_return_date"
+        )
+        return instance
+
     def __str__(self):
         return f"{self.user} borrowed {self.book.title}"
 
+    @transaction.atomic
+    def cancel_checkout(self) -> None:
+        """Compensate committed checkout which has no Stripe Session"""
+        # payments are deleted by CASCADE
+        self.delete()
+        Book.objects.release(self.book_id)
+        bump_catalog_version()
+
     @property
     def is_overdue(self) -> bool:
         # check if borrowing was returned
@@ -71,6 +214,22 @@ class Borrowing(models.Model):
     def clean(self):
         self.validate_expected_return_date(ValidationError)
 
+    def reset_overdue_stage(self, update_fields=None):
+        """
+        Start overdue notifications over when due date is changed,
+        QuerySet.update() of expected_return_date bypasses it
+        """
+        loaded = getattr(self, "_loaded_return_date", None)
+        if loaded is None or loaded == self.expected_return_date:
+            return update_fields
+        self.overdue_stage = 0
+        self.overdue_notified_at = None
+        if update_fields is not None:
+            update_fields = {
+                *update_fields, "overdue_stage", "overdue_notified_at"
+            }
+        return update_fields
+
     def save(
         self,
             force_insert=False,
@@ -79,4 +238,51 @@ class Borrowing(models.Model):
             update_fields=None
     ):
         self.full_clean()
-        return super().save(force_insert, force_update, using, update_fields)
+        update_fields = self.reset_overdue_stage(update_fields)
+        result = super().save(
+            force_insert, force_update, using, update_fields
+        )
+        self._loaded_return_date = self.expected_return_date
+        return result
+
+
+class TelegramNotification(models.Model):
+    """
+    Outbox of Telegram messages, rows are inserted in the same
+    transaction as borrowing or payment change and are sent
+    by Celery worker (see borrowings.telegram_outbox)
+    """
+
+    class Status(models.TextChoices):
+        PENDING = "PENDING", "pending"
+        SENDING = "SENDING", "sending"
+        SENT = "SENT", "sent"
+        FAILED = "FAILED", "failed"
+
+    chat_id = models.CharField(max_length=255)
+    text = models.TextField()
+    status = models.CharField(
+        max_length=8,
+        choices=Status.choices,
+        default=Status.PENDING,
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    # when worker claimed SENDING message, claim expires after
+    # TELEGRAM_OUTBOX_LEASE seconds if worker died while sending
+    claimed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # worker picks oldest pending and expired sending messages
+            models.Index(
+                fields=["id"],
+                condition=Q(status__in=["PENDING", "SENDING"]),
+                name="telegram_unsent_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.status} message to {self.chat_id}"
@@ -1,80 +1,87 @@
 import asyncio
+import logging
 import os
 from datetime import timedelta
-import time
-from functools import wraps
-
-from asgiref.sync import sync_to_async, async_to_sync
-
 from django.conf import settings
 from django.utils import timezone
 from django.db.models import QuerySet
 from .models import Borrowing
 
+from tracing import traced
 from .telegram_notification import send_telegram_notification
 
+logger = logging.getLogger(__name__)
 
-def execution_time(func):
-    """
-    Display execution time of asynchronous function
-    :param func:
-    :return:
-    """
 
-    @wraps(func)
-    async def wrapper(*args, **kwargs):
-        start = time.perf_counter()
-        result = await func(*args, **kwargs)
-        end = time.perf_counter()
+async def overdue_day():
+    return timezone.now().date() + timedelta(days=1)
 
-        print(f"Elapsed time for {func.__name__} took {end - start} seconds")
-        return result
 
-    return wrapper
+def escalation_stages() -> list:
+    """
+    Return (stage, days) pairs, borrowing reaches stage when it is
+    `days` days overdue counted from overdue day (tomorrow)
+    """
+    return list(enumerate(settings.OVERDUE_ESCALATION_DAYS, start=1))
 
 
-async def overdue_day():
-    return timezone.now().date() + timedelta(days=1)
+def stage_title(stage: int = None) -> str:
+    if not stage or stage == 1:
+        return "OVERDUE BORROWINGS!!!!\nOr this is the last day to return!"
+    days = settings.OVERDUE_ESCALATION_DAYS[stage - 1]
+    return f"STILL OVERDUE FOR {days}+ DAYS!!!!"
 
 
-@execution_time
-async def get_overdue_borrowings():
-    """
-    Get overdue borrowings where expected_return_date
-    is pass tomorrow date.
-    Or no overdue send to telegram chat message about it
+async def get_overdue_borrowings(day) -> list:
     """
-    tomorrow = await overdue_day()
-    overdue: QuerySet = Borrowing.objects.filter(
-        expected_return_date__lte=tomorrow,
-        actual_return_date__isnull=True,
-    )
+    Return (stage, queryset) of borrowings to notify for each
+    escalation stage, highest stage first, so borrowing which
+    skipped stages is notified once about the latest one.
 
-    if not await overdue.aexists():
-        return await send_telegram_notification(
-            bot_token=settings.TELEGRAM_BOT_TOKEN,
-            chat_id=settings.TELEGRAM_CHAT_ID,
-            text=("No borrowings overdue today!"),
-        )
+    Notified borrowings leave queryset of their stage by
+    overdue_stage, so every run reads only borrowings not notified
+    about their stage yet, including ones created after the previous
+    run or extended since (Borrowing.save() resets overdue_stage when
+    expected_return_date changes, borrowing_overdue_stage_idx)
+    """
+    overdue = []
+    for stage, days in reversed(escalation_stages()):
+        borrowings = Borrowing.objects.due(
+            day - timedelta(days=days)
+        ).filter(overdue_stage__lt=stage)
+        overdue.append((stage, borrowings))
     return overdue
 
 
-@execution_time
-async def notify_overdue_borrowing(borrowing):
+async def mark_notified(ids: list, stage: int) -> None:
+    await Borrowing.objects.filter(
+        id__in=ids, overdue_stage__lt=stage
+    ).aupdate(overdue_stage=stage, overdue_notified_at=timezone.now())
+
+
+def delivered(response) -> bool:
+    return bool(response and response.get("ok"))
+
+
+async def notify_overdue_borrowing(borrowing: Borrowing, stage: int = None):
     """
-    Send notification for a single overdue borrowing
+    Send notification for a single overdue borrowing,
+    book and user are loaded by select_related
     """
-    book = await sync_to_async(getattr)(borrowing, "book")
+    title = "OVERDUE BORROWING!!!!\nOr this is your last day to return book!"
+    if stage and stage > 1:
+        title = stage_title(stage)
+
+    book = borrowing.book
     price_no_fines = borrowing.num_of_borrowing_days() * book.daily_fee
     price_with_fines = price_no_fines + (
         (borrowing.num_of_overdue_days() * book.daily_fee)
         * settings.FINE_MULTIPLIER
     )
 
-    user = await sync_to_async(getattr)(borrowing, "user")
+    user = borrowing.user
     message = f"""
-OVERDUE BORROWING!!!!
-Or this is your last day to return book!
+{title}
 Book daily fee: {book.daily_fee}$
 Borrowed day: {borrowing.borrow_date}
 Days overdue: {borrowing.num_of_overdue_days()} days
@@ -85,7 +92,6 @@ Book author: {book.author}
 Borrower id: {user.id}
     """
 
-    # Schedule the async notification task
     return await send_telegram_notification(
         bot_token=settings.TELEGRAM_BOT_TOKEN,
         chat_id=settings.TELEGRAM_CHAT_ID,
@@ -93,24 +99,204 @@ Borrower id: {user.id}
     )
 
 
-@execution_time
-async def notify_overdue_borrowings(borrowings_overdue: QuerySet[Borrowing]):
+async def run_bounded(items, handler, concurrency: int) -> int:
+    """
+    Pass items of async iterator to `concurrency` workers.
+    Queue is bounded, so producer waits for free worker and
+    at most 2 * concurrency items are in memory at once.
+    Return number of handled items
     """
-    Except Overdue Borrowings and send notification on telegram
-    channel on each borrowing
+    queue = asyncio.Queue(maxsize=concurrency)
+    handled = 0
+
+    async def worker():
+        nonlocal handled
+        while True:
+            item = await queue.get()
+            try:
+                await handler(item)
+                handled += 1
+            except Exception as error:
+                # one failed item must not stop the scan
+                logger.exception("Error handling %s: %s", item, error)
+            finally:
+                queue.task_done()
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        async for item in items:
+            await queue.put(item)
+        await queue.join()
+    finally:
+        for task in workers:
+            task.cancel()
+
+    return handled
+
+
+@traced("overdue.notify_borrowings")
+async def notify_overdue_borrowings(
+    borrowings_overdue: QuerySet[Borrowing],
+    concurrency: int = None,
+    stage: int = None,
+) -> int:
+    """
+    Stream overdue borrowings in chunks and send notification
+    on telegram channel on each borrowing with at most
+    `concurrency` messages in flight
     :param borrowings_overdue:
-    :return:
+    :param concurrency:
+    :param stage: escalation stage to mark delivered borrowings with
+    :return: number of notified borrowings
     """
-    if isinstance(borrowings_overdue, QuerySet):
-        tasks = [
-            notify_overdue_borrowing(borrowing)
-            async for borrowing in borrowings_overdue
-        ]
+    if not isinstance(borrowings_overdue, QuerySet):
+        return 0
+
+    async def notify(borrowing: Borrowing):
+        response = await notify_overdue_borrowing(borrowing, stage)
+        if stage and delivered(response):
+            await mark_notified([borrowing.id], stage)
+
+    borrowings = (
+        borrowings_overdue.select_related("book", "user")
+        .order_by("id")
+        .aiterator(chunk_size=settings.OVERDUE_SCAN_CHUNK_SIZE)
+    )
+    return await run_bounded(
+        borrowings,
+        notify,
+        concurrency or settings.OVERDUE_NOTIFICATION_CONCURRENCY,
+    )
+
+
+# Telegram sendMessage text limit
+TELEGRAM_MESSAGE_LIMIT = 4096
 
-        # Run all the notification tasks concurrently
-        await asyncio.gather(*tasks)
+DIGEST_ORDERING = {
+    "user": ("user_id", "expected_return_date", "id"),
+    "due_date": ("expected_return_date", "user_id", "id"),
+}
 
 
-@execution_time
-async def async_overdue_borrowing_notification():
-    await notify_overdue_borrowings(await get_overdue_borrowings())
+def digest_group(borrowing: Borrowing, group_by: str) -> str:
+    # staff chat gets borrower id only, no personal data
+    if group_by == "user":
+        return f"Borrower id {borrowing.user_id}:"
+    return f"Due {borrowing.expected_return_date}:"
+
+
+def digest_line(borrowing: Borrowing, group_by: str) -> str:
+    book = borrowing.book
+    line = (
+        f"- {book.title} ({book.author}), "
+        f"{borrowing.num_of_overdue_days()} days overdue, "
+        f"fine {borrowing.fee_price()}$"
+    )
+    if group_by == "user":
+        return f"{line}, due {borrowing.expected_return_date}"
+    return f"{line}, borrower id {borrowing.user_id}"
+
+
+async def overdue_digests(
+    borrowings, group_by: str, title: str = "OVERDUE BORROWINGS!!!!"
+):
+    """
+    Pack borrowings ordered by digest group into as few
+    messages as Telegram message limit allows, group header
+    is repeated when group continues in next message.
+    Yield (message, ids of borrowings in it)
+    """
+    message, group, ids = title, None, []
+
+    async for borrowing in borrowings:
+        line = digest_line(borrowing, group_by)
+        header = digest_group(borrowing, group_by)
+        text = f"\n\n{header}\n{line}" if header != group else f"\n{line}"
+
+        if len(message) + len(text) > TELEGRAM_MESSAGE_LIMIT:
+            yield message, ids
+            message, text, ids = title, f"\n\n{header}\n{line}", []
+
+        message += text
+        group = header
+        ids.append(borrowing.id)
+
+    if ids:
+        yield message, ids
+
+
+@traced("overdue.notify_digests")
+async def notify_overdue_digests(
+    borrowings_overdue: QuerySet[Borrowing],
+    group_by: str = None,
+    concurrency: int = None,
+    stage: int = None,
+) -> int:
+    """
+    Send overdue borrowings grouped by user or due date
+    in digest messages instead of message per borrowing
+    :param stage: escalation stage to mark delivered borrowings with
+    :return: number of sent messages
+    """
+    if not isinstance(borrowings_overdue, QuerySet):
+        return 0
+
+    async def send(digest: tuple):
+        message, ids = digest
+        response = await send_telegram_notification(
+            bot_token=settings.TELEGRAM_BOT_TOKEN,
+            chat_id=settings.TELEGRAM_CHAT_ID,
+            text=message,
+        )
+        if stage and delivered(response):
+            await mark_notified(ids, stage)
+
+    group_by = group_by or settings.OVERDUE_DIGEST_GROUP_BY
+    borrowings = (
+        borrowings_overdue.select_related("book")
+        .order_by(*DIGEST_ORDERING[group_by])
+        .aiterator(chunk_size=settings.OVERDUE_SCAN_CHUNK_SIZE)
+    )
+    return await run_bounded(
+        overdue_digests(borrowings, group_by, stage_title(stage)),
+        send,
+        concurrency or settings.OVERDUE_NOTIFICATION_CONCURRENCY,
+    )
+
+
+@traced("overdue.notification")
+async def async_overdue_borrowing_notification(mode: str = None) -> int:
+    """
+    Notify about borrowings which reached next escalation stage
+    and weren't notified about it yet, with digest messages or with
+    message per borrowing (mode="single").
+    Undelivered borrowings keep their stage and are retried by next run
+    :return: number of notified borrowings
+    """
+    mode = mode or settings.OVERDUE_NOTIFICATION_MODE
+    day = await overdue_day()
+
+    notified = 0
+    undelivered = False
+    for stage, borrowings in await get_overdue_borrowings(day):
+        pending = await borrowings.acount()
+        if not pending:
+            continue
+
+        if mode == "single":
+            await notify_overdue_borrowings(borrowings, stage=stage)
+        else:
+            await notify_overdue_digests(borrowings, stage=stage)
+
+        # delivered borrowings left queryset by stage update
+        left = await borrowings.acount()
+        notified += pending - left
+        undelivered = undelivered or bool(left)
+
+    if not notified and not undelivered:
+        await send_telegram_notification(
+            bot_token=settings.TELEGRAM_BOT_TOKEN,
+            chat_id=settings.TELEGRAM_CHAT_ID,
+            text="No new overdue borrowings today!",
+        )
+    return notified
@@ -5,16 +5,54 @@ from rest_framework.serializers import (
 from rest_framework import serializers
 
 from django.db import transaction
+from django.db.models import Manager, QuerySet
 from django.shortcuts import reverse
 
+from books.cache import bump_catalog_version
+from books.models import Book
 from books.serializers import BookDetailSerializer
+from payments.models import Payment
 from .models import Borrowing
 
+EMPTY_PAYMENT_SUMMARY = {
+    "payment_status": None,
+    "fine_status": None,
+    "pending_payment_id": None,
+    "payment_session_url": None,
+    "fine_session_url": None,
+}
+
+
+def attach_payment_summary(borrowings) -> None:
+    """
+    Set `payment_summary` of every borrowing from one grouped
+    query over payments of these borrowings only
+    """
+    summary = Payment.objects.summary_by_borrowing(
+        [borrowing.id for borrowing in borrowings]
+    )
+    for borrowing in borrowings:
+        borrowing.payment_summary = summary.get(
+            borrowing.id, EMPTY_PAYMENT_SUMMARY
+        )
+
+
+class PaymentSummaryListSerializer(serializers.ListSerializer):
+    """Load payment summary for the whole page before serializing it"""
+
+    def to_representation(self, data):
+        if isinstance(data, (Manager, QuerySet)):
+            data = data.all()
+        borrowings = list(data)
+        attach_payment_summary(borrowings)
+        return super().to_representation(borrowings)
+
 
 class BorrowingCreateSerializer(ModelSerializer):
     def validate(self, attrs):
         data = super().validate(attrs)
 
+        # fast fail only, stock is reserved atomically in create()
         if attrs["book"].inventory < 1:
             raise ValidationError({"book": "Book is out of stock"})
 
@@ -33,22 +71,21 @@ class BorrowingCreateSerializer(ModelSerializer):
     @transaction.atomic
     def create(self, validated_data):
         book = validated_data["book"]
+        # conditional UPDATE, no lost updates under concurrent checkouts
+        if not Book.objects.reserve(book.id):
+            raise ValidationError({"book": "Book is out of stock"})
         book.inventory -= 1
-        book.save()
+        bump_catalog_version()
 
         return super().create(validated_data)
 
 
 class BorrowingListSerializer(ModelSerializer):
     book = BookDetailSerializer(read_only=True)
-    is_overdue = serializers.BooleanField()
+    is_overdue = serializers.SerializerMethodField()
     price_for_borrowing = serializers.SerializerMethodField()
     fee_price = serializers.SerializerMethodField()
-    success_url = serializers.HyperlinkedIdentityField(
-        read_only=True,
-        view_name="payments:payment-success",
-        lookup_url_kwarg="pk"
-    )
+    success_url = serializers.SerializerMethodField()
     payment_status = serializers.SerializerMethodField()
     fine_status = serializers.SerializerMethodField()
 
@@ -64,12 +101,37 @@ class BorrowingListSerializer(ModelSerializer):
             "payment_status",
             "fine_status",
         ]
+        list_serializer_class = PaymentSummaryListSerializer
+
+    @staticmethod
+    def _annotated(borrowing: Borrowing, annotation: str, method):
+        """
+        Use value annotated by Borrowing.objects.with_prices()
+        and fall back to the model method on plain instances
+        """
+        if hasattr(borrowing, annotation):
+            return getattr(borrowing, annotation)
+        return method()
+
+    def get_is_overdue(self, borrowing: Borrowing) -> bool:
+        return self._annotated(
+            borrowing, "overdue", lambda: borrowing.is_overdue
+        )
 
     def get_price_for_borrowing(self, borrowing: Borrowing):
-        return borrowing.price_for_borrowing()
+        return self._annotated(
+            borrowing, "borrowing_price", borrowing.price_for_borrowing
+        )
 
     def get_fee_price(self, borrowing: Borrowing):
-        return borrowing.fee_price()
+        return self._annotated(borrowing, "fine_price", borrowing.fee_price)
+
+    @staticmethod
+    def _payment_summary(borrowing: Borrowing) -> dict:
+        if not hasattr(borrowing, "payment_summary"):
+            # single borrowing serialized without list serializer
+            attach_payment_summary([borrowing])
+        return borrowing.payment_summary
 
     def get_success_url(self, borrowing: Borrowing):
         """
@@ -77,26 +139,24 @@ class BorrowingListSerializer(ModelSerializer):
         to check it's Payment Session status
         maybe it was paid
         """
-        unpaid_status = borrowing.payments.filter(
-            status="PENDING",
-        ).first()
-        if unpaid_status:
+        pending_payment_id = self._payment_summary(borrowing)[
+            "pending_payment_id"
+        ]
+        if pending_payment_id:
             return self.context["request"].build_absolute_uri(
-                reverse("payments:payment-success", args=[unpaid_status.id])
+                reverse("payments:payment-success", args=[pending_payment_id])
             )
         return None
 
     def get_payment_status(self, borrowing: Borrowing):
         """Return borrowing payment session status"""
-        return borrowing.payment_status
+        return self._payment_summary(borrowing)["payment_status"]
 
     def get_fine_status(self, borrowing: Borrowing):
         """
         Return borrowing FINE payment session status if it have one
         """
-        if borrowing.fine_status:
-            return borrowing.fine_status
-        return None
+        return self._payment_summary(borrowing)["fine_status"]
 
 
 class BorrowingDetailSerializer(BorrowingListSerializer):
@@ -117,16 +177,17 @@ class BorrowingDetailSerializer(BorrowingListSerializer):
         ]
 
     def get_num_of_borrowing_days(self, borrowing: Borrowing):
-        return borrowing.num_of_borrowing_days()
+        return self._annotated(
+            borrowing, "borrowing_days", borrowing.num_of_borrowing_days
+        )
 
     def get_num_of_overdue_days(self, borrowing: Borrowing):
-        return borrowing.num_of_overdue_days()
+        return self._annotated(
+            borrowing, "overdue_days", borrowing.num_of_overdue_days
+        )
 
     def get_payment_session_link(self, borrowing: Borrowing):
-        return borrowing.payments.filter(type="PAYMENT").first().session_url
+        return self._payment_summary(borrowing)["payment_session_url"]
 
     def get_fine_payment_link(self, borrowing: Borrowing):
-        fine_payment = borrowing.payments.filter(type="FINE").first()
-        if fine_payment:
-            return fine_payment
-        return None
+        return self._payment_summary(borrowing)["fine_session_url"]
@@ -1,8 +1,31 @@
-import asyncio
+import time
+
 from celery import shared_task
+from django.conf import settings
+
 from .overdue_borrowing_scraper import async_overdue_borrowing_notification
+from .telegram_notification import get_notifier
+from .telegram_outbox import send_pending_notifications
 
 
 @shared_task
 def initiate_notify_overdue_borrowings() -> None:
-    asyncio.run(async_overdue_borrowing_notification())
+    if not settings.TELEGRAM_BOT_TOKEN:
+        # Telegram is not configured
+        return
+    get_notifier().run(async_overdue_borrowing_notification())
+
+
+@shared_task
+def send_telegram_outbox() -> dict:
+    if not settings.TELEGRAM_BOT_TOKEN:
+        # Telegram is not configured, messages wait in outbox
+        return {}
+    start = time.perf_counter()
+    sent = send_pending_notifications()
+    elapsed = time.perf_counter() - start
+    return {
+        **get_notifier().stats(),
+        "sent_now": sent,
+        "messages_per_second": sent / elapsed if elapsed else 0,
+    }
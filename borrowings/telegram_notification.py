@@ -1,25 +1,223 @@
-import urllib.parse
+import asyncio
+import logging
+import os
+import time
+
 import httpx
 
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
 
-async def send_telegram_notification(bot_token: str, chat_id: str, text: str):
+from metrics import observe_external_call
+
+logger = logging.getLogger(__name__)
+
+
+class SharedRateLimit:
     """
-    Send notification on telegram chat_id using bot_token
+    Allow `rate` messages per `period` seconds to `key` across all
+    workers, acquire() waits until message fits. Messages are
+    counted in TELEGRAM_RATE_LIMIT_CACHE (Redis shared by workers in
+    production) with atomic incr() per fixed window, rate is
+    estimated like in throttling.SlidingWindowRateThrottle
     """
-    async with httpx.AsyncClient() as client:
+
+    def __init__(self, key: str, rate: int, period: float = 1):
+        self.key = f"telegram:rate:{key}"
+        self.rate = rate
+        self.period = period
+
+    @property
+    def cache(self):
+        return caches[settings.TELEGRAM_RATE_LIMIT_CACHE]
+
+    def try_acquire(self) -> bool:
+        window, offset = divmod(time.time(), self.period)
+        current_key = f"{self.key}:{int(window)}"
+        timeout = int(self.period * 2) + 1
+
+        self.cache.add(current_key, 0, timeout=timeout)
         try:
-            # URL encode the text parameter
-            # because could be symbols that are not supported
-            encoded_text = urllib.parse.quote(text, safe="")
-
-            # make asynchronous https request
-            response = await client.get(
-                f"https://api.telegram.org/bot{bot_token}/"
-                f"sendMessage?chat_id={chat_id}&text={encoded_text}"
+            current = self.cache.incr(current_key)
+        except ValueError:
+            # evicted between add() and incr()
+            self.cache.add(current_key, 1, timeout=timeout)
+            current = 1
+        previous = self.cache.get(f"{self.key}:{int(window) - 1}", 0)
+
+        weight = (self.period - offset) / self.period
+        if previous * weight + current > self.rate:
+            self.cache.decr(current_key)
+            return False
+        return True
+
+    async def acquire(self) -> None:
+        # cache calls are blocking network calls to Redis, run
+        # them in thread so other sends of event loop go on
+        while not await asyncio.to_thread(self.try_acquire):
+            # about time one message takes at the allowed rate
+            await asyncio.sleep(self.period / self.rate)
+
+
+class TelegramNotifier:
+    """
+    Long-lived Telegram Bot API client, one per worker process.
+    Keeps keep-alive connection pool, sends POST JSON bodies,
+    respects bot wide and per chat rate limits shared by all
+    workers, waits `retry_after` on 429 and retries network and
+    server errors with backoff.
+
+    Pooled connections belong to event loop they were opened in,
+    so sync code runs coroutines in notifier loop with run()
+    """
+
+    def __init__(
+        self,
+        bot_token: str,
+        api_url: str = None,
+        rate_limit: int = None,
+        chat_rate_limit: tuple = None,
+        max_retries: int = None,
+        transport: httpx.AsyncBaseTransport = None,
+    ):
+        self.bot_token = bot_token
+        self.api_url = (api_url or settings.TELEGRAM_API_URL).rstrip("/")
+        self.max_retries = (
+            settings.TELEGRAM_MAX_RETRIES
+            if max_retries is None else max_retries
+        )
+        # bot id part of token, token itself is secret
+        self.bot_id = bot_token.split(":")[0]
+        self.rate_limit = SharedRateLimit(
+            f"bot:{self.bot_id}", rate_limit or settings.TELEGRAM_RATE_LIMIT
+        )
+        self.chat_rate_limit = (
+            chat_rate_limit or settings.TELEGRAM_CHAT_RATE_LIMIT
+        )
+        self.chat_rate_limits = {}
+        self.transport = transport
+
+        self.loop = None
+        self.client = None
+        self.client_loop = None
+
+        self.sent = 0
+        self.failed = 0
+        self.rate_limited = 0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self.client is None or self.client_loop is not loop:
+            # client used from another event loop can't reuse
+            # it's connections, open new pool for this loop
+            self.client = httpx.AsyncClient(
+                timeout=httpx.Timeout(10, connect=5),
+                limits=httpx.Limits(
+                    max_connections=20,
+                    max_keepalive_connections=20,
+                    keepalive_expiry=60,
+                ),
+                transport=self.transport,
+            )
+            self.client_loop = loop
+        return self.client
+
+    def _chat_rate_limit(self, chat_id: str) -> SharedRateLimit:
+        if chat_id not in self.chat_rate_limits:
+            self.chat_rate_limits[chat_id] = SharedRateLimit(
+                f"bot:{self.bot_id}:chat:{chat_id}", *self.chat_rate_limit
             )
-            return response.json()
+        return self.chat_rate_limits[chat_id]
+
+    def run(self, coroutine):
+        """Run coroutine in notifier event loop from sync code"""
+        if self.loop is None or self.loop.is_closed():
+            self.loop = asyncio.new_event_loop()
+        return self.loop.run_until_complete(coroutine)
+
+    async def send_message(self, chat_id: str, text: str) -> dict:
+        """
+        Send message and return Telegram response,
+        None if it wasn't sent after all retries
+        """
+        url = f"{self.api_url}/bot{self.bot_token}/sendMessage"
+        payload = {"chat_id": chat_id, "text": text}
+
+        for attempt in range(self.max_retries + 1):
+            await self._chat_rate_limit(chat_id).acquire()
+            await self.rate_limit.acquire()
+            # exponential backoff unless Telegram says how long to wait
+            delay = 2 ** attempt
+
+            start = time.perf_counter()
+            try:
+                response = await self._get_client().post(url, json=payload)
+                data = response.json()
+            except (httpx.HTTPError, ValueError) as error:
+                observe_external_call(
+                    "telegram",
+                    "sendMessage",
+                    time.perf_counter() - start,
+                    error=True,
+                )
+                logger.warning("Telegram notification error: %s", error)
+            else:
+                observe_external_call(
+                    "telegram",
+                    "sendMessage",
+                    time.perf_counter() - start,
+                    error=not data.get("ok"),
+                )
+                if response.status_code == 429:
+                    self.rate_limited += 1
+                    delay = data.get("parameters", {}).get(
+                        "retry_after", delay
+                    )
+                elif response.status_code < 500:
+                    if data.get("ok"):
+                        self.sent += 1
+                    else:
+                        # like wrong chat id, retry won't help
+                        self.failed += 1
+                    return data
+
+            if attempt < self.max_retries:
+                await asyncio.sleep(delay)
+
+        self.failed += 1
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "rate_limited": self.rate_limited,
+        }
 
-        except httpx.HTTPError as e:
-            print("Error handling Borrowing creation"
-                  f"telegram notification: {e}")
-            return None
+    async def aclose(self) -> None:
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+
+_notifiers = {}
+
+
+def get_notifier(bot_token: str = None) -> TelegramNotifier:
+    """Return notifier of current process for bot_token"""
+    bot_token = bot_token or settings.TELEGRAM_BOT_TOKEN
+    if not bot_token:
+        raise ImproperlyConfigured("TELEGRAM_BOT_TOKEN is not set")
+    # Celery prefork children must not share parent connections
+    key = (os.getpid(), bot_token)
+    if key not in _notifiers:
+        _notifiers[key] = TelegramNotifier(bot_token)
+    return _notifiers[key]
+
+
+async def send_telegram_notification(bot_token: str, chat_id: str, text: str):
+    """
+    Send notification on telegram chat_id using bot_token
+    """
+    return await get_notifier(bot_token).send_message(chat_id, text)
@@ -0,0 +1,174 @@
+import asyncio
+from datetime import timedelta
+
+from kombu.exceptions import OperationalError
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from tracing import traced
+from .models import TelegramNotification
+from .telegram_notification import get_notifier, send_telegram_notification
+
+
+def enqueue_telegram_notification(text: str) -> TelegramNotification:
+    """
+    Save message to outbox in current transaction, it's sent
+    by worker only if transaction commits
+    """
+    if not settings.TELEGRAM_CHAT_ID:
+        # Telegram is not configured
+        return None
+
+    notification = TelegramNotification.objects.create(
+        chat_id=settings.TELEGRAM_CHAT_ID, text=text
+    )
+    transaction.on_commit(wake_outbox_worker)
+    return notification
+
+
+def enqueue_borrowing_notification(borrowing) -> TelegramNotification:
+    """
+    Save new borrowing message to outbox. Checkout calls it only
+    after Stripe Session is created, borrowing cancelled because
+    of gateway failure is never announced
+    """
+    return enqueue_telegram_notification(
+        "NEW BORROWING!!!\n"
+        f"Book title: {borrowing.book.title}\n"
+        f"Book author: {borrowing.book.author}\n"
+        f"Borrowing date: {borrowing.borrow_date}\n"
+        f"Expected return date: {borrowing.expected_return_date}\n"
+    )
+
+
+def wake_outbox_worker() -> None:
+    """
+    Ask worker to send new messages now, if broker is down
+    they are sent by periodic send_telegram_outbox task
+    """
+    from .tasks import send_telegram_outbox
+
+    try:
+        send_telegram_outbox.delay()
+    except OperationalError:
+        pass
+
+
+async def send_batch(notifications: list) -> list:
+    """Send messages concurrently, return Telegram responses"""
+    return await asyncio.gather(
+        *[
+            send_telegram_notification(
+                bot_token=settings.TELEGRAM_BOT_TOKEN,
+                chat_id=notification.chat_id,
+                text=notification.text,
+            )
+            for notification in notifications
+        ]
+    )
+
+
+def claim_batch(batch_size: int, last_id: int) -> list:
+    """
+    Mark batch of PENDING messages, and SENDING ones whose lease
+    expired, as SENDING claimed now. Short transaction, rows are
+    locked with SKIP LOCKED only while they are claimed
+    """
+    now = timezone.now()
+    lease_expired = now - timedelta(seconds=settings.TELEGRAM_OUTBOX_LEASE)
+    with transaction.atomic():
+        notifications = list(
+            TelegramNotification.objects.filter(
+                Q(status=TelegramNotification.Status.PENDING)
+                | Q(
+                    status=TelegramNotification.Status.SENDING,
+                    claimed_at__lt=lease_expired,
+                ),
+                id__gt=last_id,
+            )
+            .order_by("id")
+            .select_for_update(skip_locked=True)[:batch_size]
+        )
+        for notification in notifications:
+            notification.status = TelegramNotification.Status.SENDING
+            notification.claimed_at = now
+            # counted at claim, so message of worker which keeps
+            # dying while sending is FAILED after max attempts too
+            notification.attempts += 1
+        TelegramNotification.objects.bulk_update(
+            notifications, ["status", "claimed_at", "attempts"]
+        )
+    return notifications
+
+
+def record_results(notifications: list, responses: list) -> int:
+    """
+    Save SENT or FAILED status of sent batch, messages reclaimed
+    by another worker after lease expired are left to it.
+    Return number of sent messages
+    """
+    now = timezone.now()
+    sent = 0
+    with transaction.atomic():
+        owned = set(
+            TelegramNotification.objects.filter(
+                id__in=[notification.id for notification in notifications],
+                status=TelegramNotification.Status.SENDING,
+                claimed_at=notifications[0].claimed_at,
+            )
+            .select_for_update()
+            .values_list("id", flat=True)
+        )
+        notifications = [
+            (notification, response)
+            for notification, response in zip(notifications, responses)
+            if notification.id in owned
+        ]
+
+        for notification, response in notifications:
+            notification.claimed_at = None
+            if response and response.get("ok"):
+                notification.status = TelegramNotification.Status.SENT
+                notification.sent_at = now
+                sent += 1
+                continue
+
+            notification.last_error = str(response)
+            if notification.attempts >= settings.TELEGRAM_OUTBOX_MAX_ATTEMPTS:
+                notification.status = TelegramNotification.Status.FAILED
+            else:
+                notification.status = TelegramNotification.Status.PENDING
+
+        TelegramNotification.objects.bulk_update(
+            [notification for notification, _ in notifications],
+            ["status", "last_error", "sent_at", "claimed_at"],
+        )
+    return sent
+
+
+@traced("telegram.send_outbox")
+def send_pending_notifications(batch_size: int = None) -> int:
+    """
+    Send PENDING outbox messages in batches, return number of
+    sent messages. Batch is claimed in one short transaction, sent
+    outside of any transaction and results are saved in another
+    one, so no row lock or connection is held during network calls.
+    Message is sent at least once, it's resent if worker dies
+    before results are saved and lease of batch expires
+    """
+    batch_size = batch_size or settings.TELEGRAM_OUTBOX_BATCH_SIZE
+    sent = 0
+    # every message is tried once per run, failed are retried next run
+    last_id = 0
+
+    while True:
+        notifications = claim_batch(batch_size, last_id)
+        if not notifications:
+            return sent
+
+        last_id = notifications[-1].id
+        responses = get_notifier().run(send_batch(notifications))
+        sent += record_results(notifications, responses)
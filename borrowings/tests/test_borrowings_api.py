@@ -1,6 +1,10 @@
-from datetime import date
+import uuid
+from datetime import date, timedelta
+from unittest import mock
 
 from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.core.cache import cache, caches
 from django.test import TestCase
 from django.urls import reverse
 
@@ -11,7 +15,12 @@ from borrowings.serializers import (
     BorrowingDetailSerializer,
     BorrowingListSerializer,
 )
+from books.models import Book
 from borrowings.models import Borrowing
+from payments.gateways import get_gateway
+from payments.models import Payment
+
+from throttling import UserRateThrottle
 
 from test_utils.book_samples import book_sample
 from test_utils.borrowing_samples import borrowing_sample
@@ -88,6 +97,145 @@ class AuthenticatedApiTests(TestCase):
         # After creation it redirects on Stripe hosted payment Session
         self.assertEqual(res.status_code, status.HTTP_302_FOUND)
 
+    def test_create_borrowing_decreases_book_inventory(self):
+        book = book_sample("Create Book", inventory=2)
+        data = {"expected_return_date": date.today(), "book": book.id}
+
+        self.client.post(BORROWING_LIST_URL, data)
+
+        book.refresh_from_db()
+        self.assertEqual(book.inventory, 1)
+
+    def test_create_borrowing_out_of_stock(self):
+        book = book_sample("Create Book", inventory=1)
+        # concurrent checkout took the last copy
+        self.assertTrue(Book.objects.reserve(book.id))
+        self.assertFalse(Book.objects.reserve(book.id))
+
+        data = {"expected_return_date": date.today(), "book": book.id}
+        res = self.client.post(BORROWING_LIST_URL, data)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Borrowing.objects.filter(book=book).exists())
+
+    def test_create_borrowing_with_unpaid_payment_forbidden(self):
+        borrowing_sample(
+            book=book_sample("Unpaid Book"),
+            user=self.user,
+            request=self.request_object()
+        )
+        book = book_sample("Create Book", inventory=2)
+        data = {"expected_return_date": date.today(), "book": book.id}
+
+        res = self.client.post(BORROWING_LIST_URL, data)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        book.refresh_from_db()
+        self.assertEqual(book.inventory, 2)
+
+    def test_create_borrowing_cancelled_when_stripe_fails(self):
+        book = book_sample("Create Book", inventory=2)
+        data = {"expected_return_date": date.today(), "book": book.id}
+
+        get_gateway().fail_next = 1
+        res = self.client.post(BORROWING_LIST_URL, data)
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        book.refresh_from_db()
+        self.assertEqual(book.inventory, 2)
+        self.assertFalse(Borrowing.objects.filter(book=book).exists())
+        self.assertFalse(Payment.objects.filter(borrowing__book=book).exists())
+
+    def test_create_borrowing_cancelled_on_unexpected_error(self):
+        book = book_sample("Create Book", inventory=2)
+        data = {"expected_return_date": date.today(), "book": book.id}
+
+        with mock.patch.object(
+            get_gateway(), "create_session", side_effect=RuntimeError
+        ):
+            with self.assertRaises(RuntimeError):
+                self.client.post(BORROWING_LIST_URL, data)
+
+        book.refresh_from_db()
+        self.assertEqual(book.inventory, 2)
+        self.assertFalse(Borrowing.objects.filter(book=book).exists())
+        self.assertFalse(Payment.objects.filter(borrowing__book=book).exists())
+
+    def test_create_borrowing_retried_with_idempotency_key(self):
+        book = book_sample("Create Book", inventory=2)
+        data = {"expected_return_date": date.today(), "book": book.id}
+        key = str(uuid.uuid4())
+
+        first = self.client.post(
+            BORROWING_LIST_URL, data, HTTP_IDEMPOTENCY_KEY=key
+        )
+        retry = self.client.post(
+            BORROWING_LIST_URL, data, HTTP_IDEMPOTENCY_KEY=key
+        )
+
+        self.assertEqual(retry.status_code, status.HTTP_302_FOUND)
+        self.assertEqual(retry["Location"], first["Location"])
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(Borrowing.objects.filter(book=book).count(), 1)
+        book.refresh_from_db()
+        self.assertEqual(book.inventory, 1)
+
+    def test_idempotency_key_reused_with_another_request(self):
+        key = str(uuid.uuid4())
+        for title in ("First Book", "Second Book"):
+            data = {
+                "expected_return_date": date.today(),
+                "book": book_sample(title).id,
+            }
+            res = self.client.post(
+                BORROWING_LIST_URL, data, HTTP_IDEMPOTENCY_KEY=key
+            )
+
+        self.assertEqual(
+            res.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+        self.assertFalse(
+            Borrowing.objects.filter(book__title="Second Book").exists()
+        )
+
+    def test_idempotency_key_in_progress_conflict(self):
+        book = book_sample("Create Book", inventory=2)
+        data = {"expected_return_date": date.today(), "book": book.id}
+        key = str(uuid.uuid4())
+        first = self.client.post(
+            BORROWING_LIST_URL, data, HTTP_IDEMPOTENCY_KEY=key
+        )
+        # first request is still running
+        cache_key = f"idempotency:{self.user.pk}:create:{key}"
+        cache.set(cache_key, {**cache.get(cache_key), "state": "in-progress"})
+
+        res = self.client.post(
+            BORROWING_LIST_URL, data, HTTP_IDEMPOTENCY_KEY=key
+        )
+
+        self.assertEqual(first.status_code, status.HTTP_302_FOUND)
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Borrowing.objects.filter(book=book).count(), 1)
+
+    def test_failed_request_releases_idempotency_key(self):
+        book = book_sample("Create Book", inventory=2)
+        data = {"expected_return_date": date.today(), "book": book.id}
+        key = str(uuid.uuid4())
+
+        get_gateway().fail_next = 1
+        failed = self.client.post(
+            BORROWING_LIST_URL, data, HTTP_IDEMPOTENCY_KEY=key
+        )
+        retry = self.client.post(
+            BORROWING_LIST_URL, data, HTTP_IDEMPOTENCY_KEY=key
+        )
+
+        self.assertEqual(
+            failed.status_code, status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+        self.assertEqual(retry.status_code, status.HTTP_302_FOUND)
+        self.assertNotIn("Idempotent-Replayed", retry)
+
     def assertEqualBorrowings(self, response, user, is_active=None):
         borrowings = self.get_user_borrowings(user)
 
@@ -130,6 +278,64 @@ class AuthenticatedApiTests(TestCase):
         res = self.client.get(BORROWING_LIST_URL, {"is_active": "False"})
         self.assertEqualBorrowings(res, self.user, is_active=False)
 
+    def test_filter_and_order_borrowings_by_overdue_in_sql(self):
+        on_time = borrowing_sample(
+            book=book_sample("On Time Book"),
+            user=self.user,
+            request=self.request_object()
+        )
+        overdue = borrowing_sample(
+            book=book_sample("Overdue Book"),
+            user=self.user,
+            request=self.request_object()
+        )
+        # save() validates expected_return_date is not in the past
+        Borrowing.objects.filter(id=overdue.id).update(
+            expected_return_date=date.today() - timedelta(days=3)
+        )
+
+        res = self.client.get(BORROWING_LIST_URL, {"is_overdue": "True"})
+        data = expect_data_pagination_or_not(res.data)
+        self.assertEqual([item["id"] for item in data], [overdue.id])
+        overdue.refresh_from_db()
+        self.assertEqual(data[0]["fee_price"], overdue.fee_price())
+
+        res = self.client.get(BORROWING_LIST_URL, {"ordering": "-fine_price"})
+        data = expect_data_pagination_or_not(res.data)
+        self.assertEqual(
+            [item["id"] for item in data], [overdue.id, on_time.id]
+        )
+
+    def test_filter_borrowings_by_min_overdue_days(self):
+        overdue = borrowing_sample(
+            book=book_sample("Overdue Book"),
+            user=self.user,
+            request=self.request_object()
+        )
+        Borrowing.objects.filter(id=overdue.id).update(
+            expected_return_date=date.today() - timedelta(days=3)
+        )
+        overdue.refresh_from_db()
+        overdue_days = overdue.num_of_overdue_days()
+
+        for min_overdue_days, expected in [
+            (overdue_days, [overdue.id]),
+            (overdue_days + 1, []),
+        ]:
+            res = self.client.get(
+                BORROWING_LIST_URL, {"min_overdue_days": min_overdue_days}
+            )
+            data = expect_data_pagination_or_not(res.data)
+            self.assertEqual([item["id"] for item in data], expected)
+
+    def test_filter_borrowings_by_invalid_min_overdue_days(self):
+        res = self.client.get(
+            BORROWING_LIST_URL, {"min_overdue_days": "three"}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("min_overdue_days", res.data)
+
     def test_filter_borrowings_list_by_user_id_not_available(self):
         user2 = self.create_user_and_borrowings(
             "TestUser2@gmail.com", "rvtquen", ["Test1", "Test2"]
@@ -161,6 +367,147 @@ class AuthenticatedApiTests(TestCase):
 
         self.assertEqual(res_data, serializer.data)
 
+    def test_borrowing_payment_summary(self):
+        borrowing = borrowing_sample(
+            book=book_sample("Summary Book"),
+            user=self.user,
+            request=self.request_object()
+        )
+        payment = borrowing.payments.get()
+
+        res = self.client.get(detail_url("borrowing", borrowing.id))
+
+        self.assertEqual(res.data["payment_status"], "PENDING")
+        self.assertIsNone(res.data["fine_status"])
+        self.assertEqual(res.data["payment_session_link"], payment.session_url)
+        self.assertIsNone(res.data["fine_payment_link"])
+        self.assertTrue(
+            res.data["success_url"].endswith(
+                reverse("payments:payment-success", args=[payment.id])
+            )
+        )
+
+    def overdue_borrowing(self, book_name):
+        borrowing = borrowing_sample(
+            book=book_sample(book_name),
+            user=self.user,
+            request=self.request_object()
+        )
+        Borrowing.objects.filter(pk=borrowing.pk).update(
+            borrow_date=date.today() - timedelta(days=10),
+            expected_return_date=date.today() - timedelta(days=3),
+        )
+        return borrowing
+
+    def test_borrowing_payment_summary_shows_latest_fine(self):
+        borrowing = self.overdue_borrowing("Fined Book")
+        for status_, url in [
+            ("EXPIRED", "https://checkout.stripe.com/old"),
+            ("PENDING", "https://checkout.stripe.com/new"),
+        ]:
+            Payment.objects.create(
+                borrowing=borrowing,
+                type="FINE",
+                status=status_,
+                session_url=url,
+                money_to_pay=10,
+            )
+
+        res = self.client.get(detail_url("borrowing", borrowing.id))
+
+        self.assertEqual(res.data["fine_status"], "PENDING")
+        self.assertEqual(
+            res.data["fine_payment_link"], "https://checkout.stripe.com/new"
+        )
+
+    def test_payment_summary_is_one_grouped_query(self):
+        borrowings = [
+            self.overdue_borrowing(f"Summary Book {index}")
+            for index in range(3)
+        ]
+        for borrowing in borrowings:
+            for status_ in ["PAID", "EXPIRED", "PENDING"]:
+                Payment.objects.create(
+                    borrowing=borrowing,
+                    type="FINE",
+                    status=status_,
+                    session_url=f"https://checkout.stripe.com/{status_}",
+                    money_to_pay=10,
+                )
+        ids = [borrowing.id for borrowing in borrowings]
+
+        # no correlated subquery per borrowing
+        query = str(Payment.objects.borrowing_summary(ids).query)
+        self.assertEqual(query.count("SELECT"), 1)
+        with self.assertNumQueries(1):
+            summary = Payment.objects.summary_by_borrowing(ids)
+
+        for borrowing in borrowings:
+            payment = borrowing.payments.get(type="PAYMENT")
+            self.assertEqual(
+                summary[borrowing.id],
+                {
+                    "pending_payment_id": payment.id,
+                    "payment_status": "PENDING",
+                    "fine_status": "PENDING",
+                    "payment_session_url": payment.session_url,
+                    "fine_session_url": "https://checkout.stripe.com/PENDING",
+                },
+            )
+
+    def test_return_overdue_borrowing_reuses_fine(self):
+        borrowing = self.overdue_borrowing("Fined Book")
+
+        first = self.client.post(return_borrowing(borrowing.id))
+        second = self.client.post(return_borrowing(borrowing.id))
+
+        self.assertEqual(first.status_code, status.HTTP_302_FOUND)
+        self.assertEqual(second["Location"], first["Location"])
+        fine = borrowing.payments.get(type="FINE")
+        self.assertEqual(fine.session_url, first["Location"])
+
+        # expired fine gets new session instead of new payment
+        fine.status = "EXPIRED"
+        fine.save()
+        third = self.client.post(return_borrowing(borrowing.id))
+
+        self.assertEqual(borrowing.payments.filter(type="FINE").count(), 1)
+        fine.refresh_from_db()
+        self.assertEqual(fine.status, "PENDING")
+        self.assertEqual(third["Location"], fine.session_url)
+        self.assertNotEqual(third["Location"], first["Location"])
+
+    def test_borrowings_list_number_of_queries_is_fixed(self):
+        # ETag aggregate, page count, page rows, grouped payments
+        list_queries = 4
+        borrowing_sample(
+            book=book_sample("Query Book"),
+            user=self.user,
+            request=self.request_object()
+        )
+        with self.assertNumQueries(list_queries):
+            self.client.get(BORROWING_LIST_URL)
+
+        for book_name in ["Query Book2", "Query Book3", "Query Book4"]:
+            borrowing_sample(
+                book=book_sample(book_name),
+                user=self.user,
+                request=self.request_object()
+            )
+        with self.assertNumQueries(list_queries):
+            res = self.client.get(BORROWING_LIST_URL)
+        self.assertEqual(len(expect_data_pagination_or_not(res.data)), 4)
+
+    def test_detail_borrowing_number_of_queries_is_fixed(self):
+        borrowing = borrowing_sample(
+            book=book_sample("Query Book"),
+            user=self.user,
+            request=self.request_object()
+        )
+        # ETag aggregate, borrowing row, grouped payments
+        with self.assertNumQueries(3):
+            self.client.get(detail_url("borrowing", borrowing.id))
+
     def test_return_borrowing(self):
         borrowing = borrowing_sample(
             book=book_sample("Detail Book"),
@@ -281,3 +628,47 @@ class AdminApi(TestCase):
         )
         res = self.client.get(detail_url("borrowing", borrowing.id))
         self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+
+@mock.patch.object(UserRateThrottle, "THROTTLE_RATES", {"user": "3/min"})
+class ThrottleTests(TestCase):
+    def setUp(self) -> None:
+        caches[settings.THROTTLE_CACHE].clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="Main@gmail.com", password="rvtquen"
+        )
+        self.client.force_authenticate(self.user)
+        self.now = 6000.0
+        timer = mock.patch.object(
+            UserRateThrottle, "timer", lambda throttle: self.now
+        )
+        timer.start()
+        self.addCleanup(timer.stop)
+
+    def get_list(self):
+        return self.client.get(BORROWING_LIST_URL)
+
+    def test_rate_is_limited_within_window(self):
+        for _ in range(3):
+            self.assertEqual(self.get_list().status_code, status.HTTP_200_OK)
+
+        res = self.get_list()
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(res["Retry-After"], "60")
+
+    def test_previous_window_is_weighted(self):
+        for _ in range(3):
+            self.get_list()
+
+        # half of previous window is inside sliding window: 1.5 requests
+        self.now += 90
+        self.assertEqual(self.get_list().status_code, status.HTTP_200_OK)
+        res = self.get_list()
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        # previous window weight falls to 1/3 in 10 seconds
+        self.assertEqual(res["Retry-After"], "10")
+        self.now += 10
+        self.assertEqual(self.get_list().status_code, status.HTTP_200_OK)
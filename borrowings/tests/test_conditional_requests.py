@@ -0,0 +1,107 @@
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from borrowings.models import Borrowing
+from payments.models import Payment
+
+from test_utils.book_samples import book_sample
+from test_utils.main_test_utils import detail_url
+
+BORROWING_LIST_URL = reverse("borrowings:borrowing-list")
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="Main@gmail.com", password="rvtquen"
+        )
+        self.client.force_authenticate(self.user)
+        self.book = book_sample("Conditional Book", inventory=10)
+        self.borrowing = self.create_borrowing()
+        self.old_payment = self.create_payment(self.borrowing, "PAYMENT")
+        self.new_payment = self.create_payment(self.borrowing, "FINE")
+
+    def create_borrowing(self) -> Borrowing:
+        return Borrowing.objects.create(
+            book=self.book,
+            user=self.user,
+            expected_return_date=date.today() + timedelta(days=3),
+        )
+
+    def create_payment(self, borrowing: Borrowing, type_: str) -> Payment:
+        return Payment.objects.create(
+            status="PAID",
+            type=type_,
+            borrowing=borrowing,
+            session_id=f"cs_{type_}_{borrowing.id}",
+            session_url="https://checkout/",
+            money_to_pay=500,
+        )
+
+    def assertNotModified(self, url: str) -> str:
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        etag = res["ETag"]
+
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res["ETag"], etag)
+        return etag
+
+    def assertModified(self, url: str, etag: str) -> None:
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res["ETag"], etag)
+
+    def test_list_not_modified_skips_serializers(self):
+        etag = self.assertNotModified(BORROWING_LIST_URL)
+
+        # rows of page and their MAX(updated_at) only
+        with self.assertNumQueries(3):
+            self.client.get(BORROWING_LIST_URL, HTTP_IF_NONE_MATCH=etag)
+
+    def test_list_modified_after_create(self):
+        etag = self.assertNotModified(BORROWING_LIST_URL)
+
+        self.create_borrowing()
+
+        self.assertModified(BORROWING_LIST_URL, etag)
+
+    def test_list_modified_after_update(self):
+        etag = self.assertNotModified(BORROWING_LIST_URL)
+
+        self.old_payment.status = "PENDING"
+        self.old_payment.save()
+
+        self.assertModified(BORROWING_LIST_URL, etag)
+
+    def test_list_modified_after_delete(self):
+        etag = self.assertNotModified(BORROWING_LIST_URL)
+
+        # MAX(updated_at) and rows of page stay the same
+        with self.captureOnCommitCallbacks(execute=True):
+            self.old_payment.delete()
+
+        self.assertModified(BORROWING_LIST_URL, etag)
+
+    def test_detail_modified_after_update_and_delete(self):
+        url = detail_url("borrowing", self.borrowing.id)
+        etag = self.assertNotModified(url)
+
+        self.borrowing.expected_return_date += timedelta(days=1)
+        self.borrowing.save()
+        self.assertModified(url, etag)
+
+        etag = self.assertNotModified(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.old_payment.delete()
+        self.assertModified(url, etag)
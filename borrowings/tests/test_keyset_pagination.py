@@ -0,0 +1,112 @@
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from borrowings.models import Borrowing
+
+from test_utils.book_samples import book_sample
+
+BORROWING_LIST_URL = reverse("borrowings:borrowing-list")
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="Main@gmail.com", password="rvtquen"
+        )
+        self.client.force_authenticate(self.user)
+        book = book_sample("Paged Book", inventory=100)
+        today = date.today()
+        for index in range(25):
+            borrowing = Borrowing.objects.create(
+                book=book,
+                user=self.user,
+                expected_return_date=today + timedelta(days=10),
+            )
+            # 3 distinct borrow dates, every one shared by many rows,
+            # every third borrowing is not returned yet
+            Borrowing.objects.filter(id=borrowing.id).update(
+                borrow_date=today - timedelta(days=index % 3),
+                actual_return_date=(
+                    None if index % 3 == 0
+                    else today - timedelta(days=index % 4)
+                ),
+            )
+        self.borrowings = list(Borrowing.objects.filter(user=self.user))
+
+    def walk(self, ordering: str = None) -> tuple:
+        """Follow next links to the end, then previous links back"""
+        params = {"pagination": "cursor"}
+        if ordering:
+            params["ordering"] = ordering
+        res = self.client.get(BORROWING_LIST_URL, params)
+        pages = [res.data]
+        while pages[-1]["next"]:
+            pages.append(self.client.get(pages[-1]["next"]).data)
+        forward = [row["id"] for page in pages for row in page["results"]]
+
+        backward_pages = [pages[-1]]
+        while backward_pages[-1]["previous"]:
+            backward_pages.append(
+                self.client.get(backward_pages[-1]["previous"]).data
+            )
+        backward = [
+            row["id"]
+            for page in reversed(backward_pages)
+            for row in page["results"]
+        ]
+        self.assertGreater(len(pages), 2)
+        return forward, backward
+
+    def assertPagedInOrder(self, ordering: str, key) -> None:
+        forward, backward = self.walk(ordering)
+        expected = [
+            borrowing.id for borrowing in sorted(self.borrowings, key=key)
+        ]
+        # no gaps and no duplicates in both directions
+        self.assertEqual(forward, expected)
+        self.assertEqual(backward, expected)
+
+    def test_default_descending_ordering_with_duplicate_dates(self):
+        self.assertPagedInOrder(
+            None,
+            lambda borrowing: (-borrowing.borrow_date.toordinal(),
+                               -borrowing.id),
+        )
+
+    def test_ascending_ordering_with_duplicate_dates(self):
+        self.assertPagedInOrder(
+            "borrow_date",
+            lambda borrowing: (borrowing.borrow_date, borrowing.id),
+        )
+
+    def test_nullable_ordering_keeps_nulls_last(self):
+        self.assertPagedInOrder(
+            "actual_return_date",
+            lambda borrowing: (
+                borrowing.actual_return_date is None,
+                borrowing.actual_return_date or date.min,
+                borrowing.id,
+            ),
+        )
+
+    def test_descending_nullable_ordering_keeps_nulls_last(self):
+        self.assertPagedInOrder(
+            "-actual_return_date",
+            lambda borrowing: (
+                borrowing.actual_return_date is None,
+                -(borrowing.actual_return_date or date.min).toordinal(),
+                -borrowing.id,
+            ),
+        )
+
+    def test_invalid_cursor_is_rejected(self):
+        res = self.client.get(BORROWING_LIST_URL, {"cursor": "not-a-cursor"})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
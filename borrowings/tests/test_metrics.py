@@ -0,0 +1,83 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from prometheus_client import REGISTRY
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from payments.tasks import check_stripe_session_status
+
+METRICS_URL = reverse("metrics")
+BORROWING_LIST_URL = reverse("borrowings:borrowing-list")
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class MetricsTests(TestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="Main@gmail.com", password="rvtquen"
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_request_is_recorded_by_view_action(self):
+        labels = {
+            "view": "BorrowingViewSet.list",
+            "method": "GET",
+            "status": "200",
+        }
+        requests = sample("http_request_duration_seconds_count", **labels)
+        queries = sample(
+            "http_request_db_queries_sum", view="BorrowingViewSet.list"
+        )
+
+        self.client.get(BORROWING_LIST_URL)
+
+        self.assertEqual(
+            sample("http_request_duration_seconds_count", **labels),
+            requests + 1,
+        )
+        self.assertGreater(
+            sample(
+                "http_request_db_queries_sum", view="BorrowingViewSet.list"
+            ),
+            queries,
+        )
+
+    def test_celery_task_duration_is_recorded(self):
+        labels = {
+            "task": "payments.tasks.check_stripe_session_status",
+            "state": "SUCCESS",
+        }
+        runs = sample("celery_task_duration_seconds_count", **labels)
+
+        check_stripe_session_status.apply()
+
+        self.assertEqual(
+            sample("celery_task_duration_seconds_count", **labels), runs + 1
+        )
+
+    def test_metrics_exposition(self):
+        self.client.get(BORROWING_LIST_URL)
+
+        res = self.client.get(METRICS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn(
+            b'http_request_duration_seconds_count{method="GET",'
+            b'status="200",view="BorrowingViewSet.list"}',
+            res.content,
+        )
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_metrics_token_is_required(self):
+        self.assertEqual(
+            self.client.get(METRICS_URL).status_code,
+            status.HTTP_403_FORBIDDEN,
+        )
+        res = self.client.get(METRICS_URL, HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
@@ -0,0 +1,194 @@
+import asyncio
+from datetime import date, timedelta
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from borrowings.models import Borrowing
+from borrowings.overdue_borrowing_scraper import (
+    TELEGRAM_MESSAGE_LIMIT,
+    async_overdue_borrowing_notification,
+    notify_overdue_borrowings,
+    notify_overdue_digests,
+)
+
+from test_utils.book_samples import book_sample
+
+SEND_MESSAGE = "borrowings.overdue_borrowing_scraper.send_telegram_notification"
+OVERDUE_DAY = "borrowings.overdue_borrowing_scraper.overdue_day"
+
+
+class FakeSender:
+    """Record sent messages and maximum number of concurrent sends"""
+
+    def __init__(self, ok: bool = True):
+        self.ok = ok
+        self.messages = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def __call__(self, bot_token, chat_id, text):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.001)
+        self.messages.append(text)
+        self.in_flight -= 1
+        return {"ok": True} if self.ok else None
+
+
+class OverdueBorrowingScanTests(TestCase):
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(
+            email="Main@gmail.com", password="rvtquen"
+        )
+
+    def create_overdue_borrowings(self, number: int, days: int = 3):
+        for index in range(number):
+            borrowing = Borrowing.objects.create(
+                book=book_sample(f"Overdue Book {index}"),
+                user=self.user,
+                expected_return_date=date.today() + timedelta(days=1),
+            )
+            # save() validates expected_return_date is not in the past
+            Borrowing.objects.filter(id=borrowing.id).update(
+                expected_return_date=date.today() - timedelta(days=days)
+            )
+
+    def test_overdue_scan_is_streamed_with_bounded_concurrency(self):
+        self.create_overdue_borrowings(25)
+        sender = FakeSender()
+
+        # book and user are selected with borrowings in one query
+        with mock.patch(SEND_MESSAGE, new=sender), self.assertNumQueries(1):
+            notified = async_to_sync(notify_overdue_borrowings)(
+                Borrowing.objects.due(date.today()), concurrency=3
+            )
+
+        self.assertEqual(notified, 25)
+        self.assertEqual(len(sender.messages), 25)
+        self.assertLessEqual(sender.max_in_flight, 3)
+        self.assertIn("Overdue Book 0", "".join(sender.messages))
+
+    def test_overdue_borrowings_are_packed_in_digests(self):
+        self.create_overdue_borrowings(120)
+        sender = FakeSender()
+
+        with mock.patch(SEND_MESSAGE, new=sender), self.assertNumQueries(1):
+            sent = async_to_sync(notify_overdue_digests)(
+                Borrowing.objects.due(date.today()), group_by="user"
+            )
+
+        digest = "".join(sender.messages)
+        self.assertEqual(sent, len(sender.messages))
+        self.assertLess(len(sender.messages), 10)
+        self.assertTrue(
+            all(len(m) <= TELEGRAM_MESSAGE_LIMIT for m in sender.messages)
+        )
+        for index in range(120):
+            self.assertIn(f"Overdue Book {index} ", digest)
+        # group header is repeated in every message of the group
+        for message in sender.messages:
+            self.assertIn(f"Borrower id {self.user.id}:", message)
+        self.assertNotIn(self.user.email, digest)
+
+    def run_notification(self, sender: FakeSender, day: date = None) -> int:
+        day = day or date.today() + timedelta(days=1)
+
+        async def overdue_day():
+            return day
+
+        with mock.patch(SEND_MESSAGE, new=sender), mock.patch(
+            OVERDUE_DAY, new=overdue_day
+        ):
+            return async_to_sync(async_overdue_borrowing_notification)(
+                mode="single"
+            )
+
+    def test_notified_borrowings_are_not_notified_again(self):
+        self.create_overdue_borrowings(3)
+
+        self.assertEqual(self.run_notification(FakeSender()), 3)
+        self.assertEqual(
+            Borrowing.objects.filter(overdue_stage=1).count(), 3
+        )
+
+        sender = FakeSender()
+        self.assertEqual(self.run_notification(sender), 0)
+        self.assertEqual(sender.messages, ["No new overdue borrowings today!"])
+
+    def test_borrowing_is_notified_again_on_next_stage(self):
+        self.create_overdue_borrowings(1, days=5)
+        self.run_notification(FakeSender())
+
+        # 2 days later borrowing is 7 days overdue from tomorrow
+        sender = FakeSender()
+        notified = self.run_notification(
+            sender, date.today() + timedelta(days=3)
+        )
+
+        self.assertEqual(notified, 1)
+        self.assertIn("STILL OVERDUE FOR 7+ DAYS", sender.messages[0])
+        self.assertEqual(Borrowing.objects.get().overdue_stage, 2)
+
+    def test_borrowing_skipping_stages_is_notified_once(self):
+        self.create_overdue_borrowings(1, days=40)
+        sender = FakeSender()
+
+        self.assertEqual(self.run_notification(sender), 1)
+        self.assertEqual(len(sender.messages), 1)
+        self.assertEqual(Borrowing.objects.get().overdue_stage, 3)
+
+    def test_borrowing_created_after_scan_is_notified(self):
+        self.run_notification(FakeSender())
+
+        # e.g. borrowing entered with due date before the scan
+        self.create_overdue_borrowings(1, days=10)
+        sender = FakeSender()
+
+        self.assertEqual(self.run_notification(sender), 1)
+        self.assertEqual(Borrowing.objects.get().overdue_stage, 2)
+
+    def test_undelivered_borrowings_are_retried(self):
+        self.create_overdue_borrowings(2)
+
+        self.assertEqual(self.run_notification(FakeSender(ok=False)), 0)
+        self.assertEqual(
+            Borrowing.objects.filter(overdue_stage=0).count(), 2
+        )
+
+        self.assertEqual(self.run_notification(FakeSender()), 2)
+
+    def test_extended_borrowing_is_notified_again_when_overdue(self):
+        self.create_overdue_borrowings(1, days=10)
+        self.run_notification(FakeSender())
+
+        borrowing = Borrowing.objects.get()
+        self.assertEqual(borrowing.overdue_stage, 2)
+        borrowing.expected_return_date = date.today() + timedelta(days=5)
+        borrowing.save(update_fields=["expected_return_date"])
+
+        borrowing.refresh_from_db()
+        self.assertEqual(borrowing.overdue_stage, 0)
+        self.assertIsNone(borrowing.overdue_notified_at)
+
+        # 3 days after the new due date
+        sender = FakeSender()
+        notified = self.run_notification(
+            sender, date.today() + timedelta(days=8)
+        )
+        self.assertEqual(notified, 1)
+        self.assertEqual(Borrowing.objects.get().overdue_stage, 1)
+
+    def test_saving_borrowing_keeps_stage_of_unchanged_due_date(self):
+        self.create_overdue_borrowings(1, days=10)
+        self.run_notification(FakeSender())
+
+        # overdue borrowing can't pass full_clean(), save it as returned
+        borrowing = Borrowing.objects.get()
+        borrowing.actual_return_date = date.today()
+        borrowing.save()
+
+        self.assertEqual(Borrowing.objects.get().overdue_stage, 2)
@@ -0,0 +1,109 @@
+import marshal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from profiling import is_cache_shared
+from test_utils.book_samples import book_sample
+from test_utils.borrowing_samples import borrowing_sample
+
+BORROWING_LIST_URL = reverse("borrowings:borrowing-list")
+
+
+def jwt_client(user) -> APIClient:
+    client = APIClient()
+    client.credentials(
+        HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}"
+    )
+    return client
+
+
+class ProfilerTests(TestCase):
+    def setUp(self) -> None:
+        self.admin = get_user_model().objects.create_superuser(
+            email="admin@gmail.com", password="rvtquen"
+        )
+        self.user = get_user_model().objects.create_user(
+            email="Main@gmail.com", password="rvtquen"
+        )
+        self.client = jwt_client(self.admin)
+        request = self.client.get(BORROWING_LIST_URL).wsgi_request
+        borrowing_sample(
+            book=book_sample("Profiled Book"),
+            user=self.user,
+            request=request,
+        )
+
+    def profile(self, client: APIClient) -> str:
+        res = client.get(
+            BORROWING_LIST_URL,
+            {"is_active": "True", "user_id": self.user.id},
+            HTTP_X_PROFILE="1",
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.get("X-Profile-Id")
+
+    def test_staff_request_is_profiled(self):
+        profile_id = self.profile(self.client)
+
+        res = self.client.get(reverse("profile", args=[profile_id]))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["request"]["status"], 200)
+        self.assertIn("user_id=", res.data["request"]["path"])
+        self.assertEqual(res.data["sql_count"], len(res.data["sql"]))
+        self.assertTrue(
+            any("borrowings_borrowing" in query["sql"]
+                for query in res.data["sql"])
+        )
+        self.assertTrue(res.data["functions"])
+
+        res = self.client.get(reverse("profile-pstats", args=[profile_id]))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsInstance(marshal.loads(res.content), dict)
+
+    def test_request_of_not_staff_user_is_not_profiled(self):
+        self.assertIsNone(self.profile(jwt_client(self.user)))
+
+    def test_profile_is_available_only_to_staff(self):
+        profile_id = self.profile(self.client)
+
+        res = jwt_client(self.user).get(reverse("profile", args=[profile_id]))
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_request_without_header_is_not_profiled(self):
+        res = self.client.get(BORROWING_LIST_URL)
+
+        self.assertNotIn("X-Profile-Id", res)
+        self.assertEqual(
+            self.client.get(reverse("profile", args=["missing"])).status_code,
+            status.HTTP_404_NOT_FOUND,
+        )
+
+    def test_profile_in_process_local_cache_is_logged(self):
+        with self.assertLogs("profiling", "WARNING") as logs:
+            profile_id = self.profile(self.client)
+
+        self.assertIn(profile_id, logs.output[0])
+
+    @override_settings(
+        CACHES={
+            "default": {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache"
+            },
+            "profiles": {
+                "BACKEND": "django.core.cache.backends.redis.RedisCache",
+                "LOCATION": "redis://localhost:6379",
+            },
+        },
+        PROFILER_CACHE="profiles",
+    )
+    def test_redis_profiler_cache_is_shared(self):
+        self.assertTrue(is_cache_shared())
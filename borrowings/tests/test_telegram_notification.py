@@ -0,0 +1,142 @@
+import asyncio
+import time
+import uuid
+from unittest import mock
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, override_settings
+
+from borrowings.tasks import (
+    initiate_notify_overdue_borrowings,
+    send_telegram_outbox,
+)
+from borrowings.telegram_notification import (
+    SharedRateLimit,
+    TelegramNotifier,
+    get_notifier,
+)
+
+from test_utils.fake_telegram_api import FakeTelegramApi
+
+
+class TelegramNotifierTests(SimpleTestCase):
+    def notifier(self, api: FakeTelegramApi, **kwargs) -> TelegramNotifier:
+        kwargs.setdefault("rate_limit", 1000)
+        kwargs.setdefault("chat_rate_limit", (1000, 1))
+        # rate limit counters are shared, don't count other tests
+        return TelegramNotifier(
+            f"{uuid.uuid4().hex}:token", api_url=api.url, **kwargs
+        )
+
+    def send_all(self, notifier: TelegramNotifier, messages: list) -> list:
+        async def send():
+            return await asyncio.gather(
+                *[
+                    notifier.send_message(chat_id, text)
+                    for chat_id, text in messages
+                ]
+            )
+
+        return notifier.run(send())
+
+    def test_messages_are_posted_over_pooled_connections(self):
+        with FakeTelegramApi() as api:
+            notifier = self.notifier(api)
+            for index in range(3):
+                responses = self.send_all(
+                    notifier, [("-100", f"Message {index}")] * 5
+                )
+                self.assertTrue(all(response["ok"] for response in responses))
+
+        self.assertEqual(len(api.requests), 15)
+        path, body = api.requests[0]
+        self.assertEqual(path, f"/bot{notifier.bot_token}/sendMessage")
+        self.assertEqual(body, {"chat_id": "-100", "text": "Message 0"})
+        # connections opened by first batch are reused by next ones
+        self.assertLessEqual(api.connections, 5)
+        self.assertEqual(notifier.stats()["sent"], 15)
+
+    def test_rate_limited_message_is_retried(self):
+        with FakeTelegramApi() as api:
+            api.rate_limit_next = 2
+            notifier = self.notifier(api)
+            response = self.send_all(notifier, [("-100", "Retry")])[0]
+
+        self.assertTrue(response["ok"])
+        self.assertEqual(len(api.requests), 3)
+        self.assertEqual(notifier.stats()["rate_limited"], 2)
+
+    def test_message_is_dropped_after_max_retries(self):
+        with FakeTelegramApi() as api:
+            api.rate_limit_next = 10
+            notifier = self.notifier(api, max_retries=1)
+            response = self.send_all(notifier, [("-100", "Dropped")])[0]
+
+        self.assertIsNone(response)
+        self.assertEqual(len(api.requests), 2)
+        self.assertEqual(notifier.stats()["failed"], 1)
+
+    def test_rate_limit_is_shared_by_workers(self):
+        key = uuid.uuid4().hex
+        # limiters of two worker processes
+        first, second = SharedRateLimit(key, 5), SharedRateLimit(key, 5)
+
+        with mock.patch("time.time", return_value=1000.5):
+            allowed = [
+                limit.try_acquire() for limit in [first, second] * 3
+            ]
+            self.assertEqual(allowed, [True] * 5 + [False])
+            self.assertTrue(SharedRateLimit(uuid.uuid4().hex, 5).try_acquire())
+
+        # half of previous window still counts
+        with mock.patch("time.time", return_value=1001.5):
+            allowed = [first.try_acquire() for _ in range(3)]
+        self.assertEqual(allowed, [True, True, False])
+
+    def test_acquire_waits_for_rate_limit(self):
+        limit = SharedRateLimit(uuid.uuid4().hex, 5, period=1)
+
+        async def acquire(times: int):
+            for _ in range(times):
+                await limit.acquire()
+
+        start = time.monotonic()
+        asyncio.run(acquire(5))
+        # burst up to rate is not delayed
+        self.assertLess(time.monotonic() - start, 0.1)
+
+        asyncio.run(acquire(2))
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+    def test_rate_limit_check_does_not_block_event_loop(self):
+        limit = SharedRateLimit(uuid.uuid4().hex, 5)
+        finished = []
+
+        def slow_try_acquire():
+            # like slow Redis call
+            time.sleep(0.2)
+            return True
+
+        async def other_send():
+            await asyncio.sleep(0.05)
+            finished.append("other")
+
+        async def acquire():
+            await limit.acquire()
+            finished.append("acquire")
+
+        async def run():
+            await asyncio.gather(acquire(), other_send())
+
+        with mock.patch.object(limit, "try_acquire", slow_try_acquire):
+            asyncio.run(run())
+
+        self.assertEqual(finished, ["other", "acquire"])
+
+    @override_settings(TELEGRAM_BOT_TOKEN=None)
+    def test_tasks_do_nothing_without_bot_token(self):
+        with self.assertRaises(ImproperlyConfigured):
+            get_notifier()
+
+        self.assertEqual(send_telegram_outbox(), {})
+        self.assertIsNone(initiate_notify_overdue_borrowings())
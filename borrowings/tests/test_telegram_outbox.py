@@ -0,0 +1,177 @@
+from datetime import date, timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from borrowings.models import Borrowing, TelegramNotification
+from borrowings.telegram_outbox import (
+    enqueue_borrowing_notification,
+    send_pending_notifications,
+    wake_outbox_worker,
+)
+from payments.gateways import get_gateway
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from test_utils.book_samples import book_sample
+
+SEND_MESSAGE = "borrowings.telegram_outbox.send_telegram_notification"
+GET_NOTIFIER = "borrowings.telegram_outbox.get_notifier"
+
+
+@override_settings(
+    TELEGRAM_BOT_TOKEN="token",
+    TELEGRAM_CHAT_ID="-100",
+    TELEGRAM_OUTBOX_MAX_ATTEMPTS=2,
+)
+class TelegramOutboxTests(TestCase):
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(
+            email="Main@gmail.com", password="rvtquen"
+        )
+
+    def create_borrowing(self, title="Outbox Book") -> Borrowing:
+        with transaction.atomic():
+            borrowing = Borrowing.objects.create(
+                book=book_sample(title),
+                user=self.user,
+                expected_return_date=date.today() + timedelta(days=4),
+            )
+            enqueue_borrowing_notification(borrowing)
+        return borrowing
+
+    def checkout(self) -> int:
+        client = APIClient()
+        client.force_authenticate(self.user)
+        book = book_sample("Outbox Book")
+        res = client.post(
+            reverse("borrowings:borrowing-list"),
+            {"expected_return_date": date.today(), "book": book.id},
+        )
+        return res.status_code
+
+    def test_borrowing_creation_enqueues_notification(self):
+        with mock.patch(SEND_MESSAGE) as send_message:
+            with self.captureOnCommitCallbacks() as callbacks:
+                self.assertEqual(self.checkout(), status.HTTP_302_FOUND)
+
+        notification = TelegramNotification.objects.get()
+        self.assertEqual(notification.status, "PENDING")
+        self.assertEqual(notification.chat_id, "-100")
+        self.assertIn("Outbox Book", notification.text)
+        # worker is woken only after commit, request sends nothing
+        self.assertIn(wake_outbox_worker, callbacks)
+        send_message.assert_not_called()
+
+    def test_cancelled_checkout_has_no_notification(self):
+        get_gateway().fail_next = 1
+
+        self.assertEqual(
+            self.checkout(), status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+        self.assertFalse(TelegramNotification.objects.exists())
+
+    def test_rolled_back_borrowing_has_no_notification(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.create_borrowing()
+                raise RuntimeError
+
+        self.assertFalse(TelegramNotification.objects.exists())
+
+    def test_send_pending_notifications(self):
+        for title in ["Book1", "Book2", "Book3"]:
+            self.create_borrowing(title)
+
+        with mock.patch(
+            SEND_MESSAGE, new=mock.AsyncMock(return_value={"ok": True})
+        ) as send_message:
+            sent = send_pending_notifications(batch_size=2)
+
+        self.assertEqual(sent, 3)
+        self.assertEqual(send_message.await_count, 3)
+        self.assertFalse(
+            TelegramNotification.objects.exclude(status="SENT").exists()
+        )
+
+    def test_failed_notification_is_retried_then_failed(self):
+        self.create_borrowing()
+
+        with mock.patch(SEND_MESSAGE, new=mock.AsyncMock(return_value=None)):
+            self.assertEqual(send_pending_notifications(), 0)
+            notification = TelegramNotification.objects.get()
+            self.assertEqual(notification.status, "PENDING")
+            self.assertEqual(notification.attempts, 1)
+
+            send_pending_notifications()
+
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, "FAILED")
+        self.assertEqual(notification.attempts, 2)
+
+    def test_message_is_claimed_while_it_is_sent(self):
+        self.create_borrowing()
+        statuses = []
+
+        def send_batch(coroutine):
+            coroutine.close()
+            statuses.append(
+                TelegramNotification.objects.values_list(
+                    "status", flat=True
+                ).get()
+            )
+            return [{"ok": True}]
+
+        with mock.patch(GET_NOTIFIER) as get_notifier:
+            get_notifier().run.side_effect = send_batch
+            self.assertEqual(send_pending_notifications(), 1)
+
+        self.assertEqual(statuses, ["SENDING"])
+        notification = TelegramNotification.objects.get()
+        self.assertEqual(notification.status, "SENT")
+        self.assertIsNone(notification.claimed_at)
+
+    @override_settings(TELEGRAM_OUTBOX_LEASE=60)
+    def test_expired_claim_is_reclaimed(self):
+        self.create_borrowing("Claimed Book")
+        self.create_borrowing("Abandoned Book")
+        claimed, abandoned = TelegramNotification.objects.order_by("id")
+        claimed.status = abandoned.status = "SENDING"
+        claimed.claimed_at = timezone.now()
+        abandoned.claimed_at = timezone.now() - timedelta(seconds=61)
+        TelegramNotification.objects.bulk_update(
+            [claimed, abandoned], ["status", "claimed_at"]
+        )
+
+        with mock.patch(
+            SEND_MESSAGE, new=mock.AsyncMock(return_value={"ok": True})
+        ):
+            self.assertEqual(send_pending_notifications(), 1)
+
+        claimed.refresh_from_db()
+        abandoned.refresh_from_db()
+        self.assertEqual(claimed.status, "SENDING")
+        self.assertEqual(abandoned.status, "SENT")
+
+    def test_result_of_reclaimed_message_is_not_saved(self):
+        self.create_borrowing()
+
+        def send_batch(coroutine):
+            coroutine.close()
+            # lease expired and another worker claimed the message
+            TelegramNotification.objects.update(
+                claimed_at=timezone.now() + timedelta(seconds=1)
+            )
+            return [None]
+
+        with mock.patch(GET_NOTIFIER) as get_notifier:
+            get_notifier().run.side_effect = send_batch
+            send_pending_notifications()
+
+        notification = TelegramNotification.objects.get()
+        self.assertEqual(notification.status, "SENDING")
+        self.assertEqual(notification.last_error, "")
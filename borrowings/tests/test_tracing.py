@@ -0,0 +1,147 @@
+import asyncio
+import json
+from unittest import mock
+
+import httpx
+from django.test import SimpleTestCase, override_settings
+from prometheus_client import REGISTRY
+
+from payments.session_sweep import retrieve_sessions
+from tracing import OtlpExporter, span, traced
+
+
+def span_count(name: str) -> float:
+    return (
+        REGISTRY.get_sample_value(
+            "span_duration_seconds_count", {"span": name}
+        )
+        or 0
+    )
+
+
+@traced("test.child")
+def child():
+    with span("test.orm", table="borrowing"):
+        pass
+
+
+@traced("test.async_child")
+async def async_child():
+    await asyncio.sleep(0)
+
+
+@override_settings(TRACING_SAMPLE_RATE=1, TRACING_EXPORTER="log")
+class TracingTests(SimpleTestCase):
+    def traces(self, logs) -> list:
+        return [json.loads(record.getMessage()) for record in logs.records]
+
+    def test_nested_sync_and_async_spans(self):
+        async def gather():
+            await asyncio.gather(async_child(), async_child())
+
+        with self.assertLogs("tracing", "INFO") as logs:
+            with span("test.root", user=1):
+                child()
+                asyncio.run(gather())
+
+        (trace,) = self.traces(logs)
+        self.assertEqual(trace["name"], "test.root")
+        self.assertEqual(trace["attributes"], {"user": 1})
+        self.assertEqual(
+            [item["name"] for item in trace["children"]],
+            ["test.child", "test.async_child", "test.async_child"],
+        )
+        self.assertEqual(
+            trace["children"][0]["children"][0]["attributes"],
+            {"table": "borrowing"},
+        )
+
+    def test_error_is_recorded(self):
+        with self.assertLogs("tracing", "INFO") as logs:
+            with self.assertRaises(ValueError):
+                with span("test.root"):
+                    raise ValueError("wrong")
+
+        self.assertEqual(self.traces(logs)[0]["error"], "ValueError: wrong")
+
+    @override_settings(TRACING_SAMPLE_RATE=0)
+    def test_not_sampled_spans_are_only_aggregated(self):
+        count = span_count("test.child")
+
+        with self.assertNoLogs("tracing", "INFO"):
+            with span("test.root"):
+                child()
+
+        self.assertEqual(span_count("test.child"), count + 1)
+
+    @override_settings(TRACING_EXPORTER="")
+    def test_otlp_exporter_posts_batches(self):
+        requests = []
+
+        def handler(request):
+            requests.append(json.loads(request.content))
+            return httpx.Response(200, json={})
+
+        exporter = OtlpExporter(
+            "http://collector/v1/traces",
+            interval=60,
+            batch_size=2,
+            transport=httpx.MockTransport(handler),
+        )
+        with span("test.root") as root:
+            child()
+        exporter.export(root)
+        exporter.flush()
+
+        spans = [
+            item
+            for request in requests
+            for item in request["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        ]
+        self.assertEqual(len(requests), 2)
+        self.assertEqual(
+            [item["name"] for item in spans],
+            ["test.root", "test.child", "test.orm"],
+        )
+        self.assertNotIn("parentSpanId", spans[0])
+        self.assertEqual(spans[1]["parentSpanId"], spans[0]["spanId"])
+        self.assertEqual(spans[2]["traceId"], spans[0]["traceId"])
+
+    def test_thread_pool_calls_are_children_of_current_span(self):
+        def retrieve_session(session_id):
+            with span("test.retrieve", session=session_id):
+                return session_id
+
+        with self.assertLogs("tracing", "INFO") as logs:
+            with span("test.root"), mock.patch(
+                "payments.session_sweep.retrieve_session", retrieve_session
+            ):
+                sessions = retrieve_sessions(["cs_1", "cs_2", "cs_3"], 2)
+
+        self.assertEqual(list(sessions), ["cs_1", "cs_2", "cs_3"])
+        (trace,) = self.traces(logs)
+        self.assertEqual(
+            sorted(
+                item["attributes"]["session"] for item in trace["children"]
+            ),
+            list(sessions),
+        )
+
+    @override_settings(TRACING_EXPORTER="")
+    def test_spans_over_queue_size_are_dropped_and_counted(self):
+        dropped = REGISTRY.get_sample_value("tracing_spans_dropped_total")
+        exporter = OtlpExporter(
+            "http://collector/v1/traces",
+            interval=60,
+            max_queue_size=1,
+            transport=httpx.MockTransport(lambda _: httpx.Response(200)),
+        )
+        with span("test.root") as root:
+            child()
+        exporter.export(root)
+
+        self.assertEqual(exporter.dropped, 2)
+        self.assertEqual(
+            REGISTRY.get_sample_value("tracing_spans_dropped_total"),
+            dropped + 2,
+        )
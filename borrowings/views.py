@@ -1,6 +1,8 @@
+from datetime import timedelta
+
 from django.utils import timezone
 from django.db import transaction
-from django.db.models import Subquery, OuterRef, QuerySet
+from django.db.models import QuerySet
 from django.shortcuts import redirect
 
 from rest_framework.response import Response
@@ -10,6 +12,7 @@ from rest_framework import (
     status,
 )
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.filters import SearchFilter, OrderingFilter
 
@@ -19,19 +22,28 @@ from drf_spectacular.utils import (
     OpenApiExample,
 )
 
+from books.cache import bump_catalog_version
+from books.models import Book
+from conditional_requests import ConditionalGetMixin
+from idempotency import IdempotentMixin
+from tracing import span
 from .models import Borrowing
 from .serializers import (
     BorrowingDetailSerializer,
     BorrowingListSerializer,
     BorrowingCreateSerializer,
 )
+from .telegram_outbox import enqueue_borrowing_notification
+from payments.models import Payment
+from payments.gateways import PaymentGatewayError
 from payments.stripe_api import (
     StripeSessionHandler,
 )
-from payments.models import Payment
 
 
 class BorrowingViewSet(
+    IdempotentMixin,
+    ConditionalGetMixin,
     mixins.ListModelMixin,
     mixins.RetrieveModelMixin,
     mixins.CreateModelMixin,
@@ -39,30 +51,48 @@ class BorrowingViewSet(
 ):
     queryset = Borrowing.objects.all()
     permission_classes = [IsAuthenticated]
+    # retried checkouts replay response, see idempotency.py
+    idempotent_actions = ("create", "renew_payment")
     serializer_class = BorrowingListSerializer
     filter_backends = [SearchFilter, OrderingFilter]
     search_fields = ["book__title", "book__author"]
-    ordering_fields = ["borrow_date", "actual_return_date"]
+    ordering_fields = [
+        "borrow_date",
+        "actual_return_date",
+        "fine_price",
+        "overdue_days",
+    ]
+    # seek columns for ?pagination=cursor, see paginations.KeysetPagination
+    cursor_ordering = ("-borrow_date", "-id")
+    conditional_fields = (
+        "updated_at",
+        "book__updated_at",
+        "payments__updated_at",
+    )
 
     def queryset_enhancement(self, queryset: QuerySet):
         """
-        Subquery is a way to include the result of a subquery
-        to main query 'queryset'
-        so for each borrowing we get it's payment and fine status
-        which we would later use in BorrowingListSerializer
+        Payment and fine status, pending payment and session links
+        are not joined here, PaymentSummaryListSerializer loads them
+        for the page rows only with one grouped query over payments,
+        so OFFSET rows and COUNT never touch payments table
         """
-        borrowing_payment_subquery = Payment.objects.filter(
-            borrowing=OuterRef("pk"), type="PAYMENT"
-        ).values("status")
-        borrowing_fine_subquery = Payment.objects.filter(
-            borrowing=OuterRef("pk"), type="FINE"
-        ).values("status")
-        queryset = queryset.select_related("book", "user").annotate(
-            payment_status=Subquery(borrowing_payment_subquery),
-            fine_status=Subquery(borrowing_fine_subquery),
-        )
+        return queryset.with_prices().select_related("book", "user")
 
-        return queryset
+    def get_etag_parts(self, request) -> list:
+        # is_overdue and fee_price change every day without row update
+        return super().get_etag_parts(request) + [timezone.now().date()]
+
+    def get_conditional_validators(self, request):
+        etag, last_modified = super().get_conditional_validators(request)
+        if last_modified is not None:
+            start_of_day = timezone.now().replace(
+                hour=0, minute=0, second=0, microsecond=0
+            )
+            last_modified = max(
+                last_modified, int(start_of_day.timestamp())
+            )
+        return etag, last_modified
 
     def get_queryset(self):
         user = self.request.user
@@ -73,6 +103,10 @@ class BorrowingViewSet(
         )
         queryset = self.queryset_enhancement(queryset)
         is_active = self.request.query_params.get("is_active", None)
+        is_overdue = self.request.query_params.get("is_overdue", None)
+        min_overdue_days = self.request.query_params.get(
+            "min_overdue_days", None
+        )
         user_id = self.request.query_params.get("user_id", None)
 
         # if is_active=True return active borrowings
@@ -82,12 +116,40 @@ class BorrowingViewSet(
         elif is_active == "False":
             queryset = queryset.filter(actual_return_date__isnull=False)
 
+        # overdue values are annotated by Borrowing.objects.with_prices()
+        if is_overdue == "True":
+            queryset = queryset.filter(overdue=True)
+        elif is_overdue == "False":
+            queryset = queryset.filter(overdue=False)
+
+        if min_overdue_days:
+            min_overdue_days = self.int_query_param(
+                "min_overdue_days", min_overdue_days
+            )
+            queryset = queryset.filter(overdue_days__gte=min_overdue_days)
+            if min_overdue_days > 0:
+                # overdue_days is CASE expression, redundant bound
+                # lets database use borrowing_active_due_idx
+                queryset = queryset.due(
+                    timezone.now().date()
+                    - timedelta(days=min_overdue_days - 1)
+                )
+
         if user.is_staff:
             if user_id:
-                queryset = queryset.filter(user_id=int(user_id))
+                queryset = queryset.filter(
+                    user_id=self.int_query_param("user_id", user_id)
+                )
 
         return queryset
 
+    @staticmethod
+    def int_query_param(name: str, value: str) -> int:
+        try:
+            return int(value)
+        except ValueError:
+            raise ValidationError({name: "A valid integer is required."})
+
     def get_serializer_class(self):
         self.serializer_class = {
             "list": BorrowingListSerializer,
@@ -115,8 +177,9 @@ class BorrowingViewSet(
             OpenApiParameter(
                 name="ordering",
                 description=(
-                    "Order borrowings by borrow date or actual return date"
-                    " ?ordering=borrow_date/actual_return_date"
+                    "Order borrowings by borrow date, actual return date,"
+                    " fine price or overdue days ?ordering=borrow_date/"
+                    "actual_return_date/fine_price/overdue_days"
                 ),
                 type=str,
                 required=False,
@@ -131,20 +194,47 @@ class BorrowingViewSet(
                         description="Order by actual return date",
                         value="actual_return_date",
                     ),
+                    OpenApiExample(
+                        "Example4",
+                        description="Biggest fines first",
+                        value="-fine_price",
+                    ),
                 ],
             ),
+            OpenApiParameter(
+                name="is_overdue",
+                description="Filter overdue borrowings ?is_overdue=True/False",
+                type=str,
+                required=False,
+            ),
+            OpenApiParameter(
+                name="min_overdue_days",
+                description=(
+                    "Borrowings overdue at least that number of days"
+                    " ?min_overdue_days=3"
+                ),
+                type=int,
+                required=False,
+            ),
         ]
     )
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
 
-    @transaction.atomic
     def create(self, request, *args, **kwargs):
-        borrowing_data = super().create(request, *args, **kwargs).data
-        borrowing = Borrowing.objects.get(id=borrowing_data["id"])
+        """
+        Two phase checkout: book is reserved, borrowing and PENDING
+        payment are committed in one short transaction, then Stripe
+        Session is created outside of it, so book row lock is never
+        held during Stripe call. If Stripe fails borrowing is
+        cancelled and book is released, otherwise new borrowing
+        is announced in Telegram
+        """
         # if user have at least 1 unpaid payment then
         # forbid to create new borrowing
-        pending_payments = borrowing.payments.filter(status="PENDING")
+        pending_payments = Payment.objects.filter(
+            borrowing__user=request.user, status="PENDING"
+        )
         if pending_payments.exists():
             return Response(
                 {"pending_payments_error": (
@@ -152,10 +242,35 @@ class BorrowingViewSet(
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        session_creator = StripeSessionHandler(
-            borrowing=borrowing, payment_type="PAYMENT"
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        with span("borrowings.checkout.reserve"), transaction.atomic():
+            self.perform_create(serializer)
+            borrowing = serializer.instance
+            session_creator = StripeSessionHandler(
+                borrowing=borrowing, payment_type="PAYMENT"
+            )
+            payment = session_creator.create_payment()
+
+        try:
+            session_url = session_creator.create_session(request, payment)
+        except PaymentGatewayError:
+            borrowing.cancel_checkout()
+            return self.payment_unavailable()
+        except Exception:
+            # unexpected failure must not keep book reserved, checkout
+            # of worker which died here is cancelled by session sweep
+            borrowing.cancel_checkout()
+            raise
+        enqueue_borrowing_notification(borrowing)
+        return redirect(session_url)
+
+    @staticmethod
+    def payment_unavailable() -> Response:
+        return Response(
+            {"payment": "Payment service is unavailable, try again later"},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
         )
-        return redirect(session_creator.create_checkout_session(request))
 
     @action(detail=True, methods=["post"])
     def renew_payment(self, request, *args, **kwargs):
@@ -171,11 +286,13 @@ class BorrowingViewSet(
         for payment in payments:
             session_creator = StripeSessionHandler(borrowing, payment.type)
             # pass payment to create_checkout_session, it will
-            # update session_url and session_d
-            session_creator.create_checkout_session(payment)
+            # update session_url and session_id
+            try:
+                session_creator.create_checkout_session(request, payment)
+            except PaymentGatewayError:
+                return self.payment_unavailable()
         return Response(status=status.HTTP_200_OK)
 
-    @transaction.atomic
     @action(
         methods=["post"],
         detail=True,
@@ -192,25 +309,53 @@ class BorrowingViewSet(
         borrowing = self.get_object()
 
         if borrowing.is_overdue:
+            # reuse unpaid fine, so repeated returns don't create
+            # a new FINE payment every call
+            fine = (
+                borrowing.payments.filter(
+                    type="FINE", status__in=("PENDING", "EXPIRED")
+                )
+                .order_by("-id")
+                .first()
+            )
+            if fine is not None and fine.status == "PENDING" and (
+                fine.session_url
+            ):
+                return redirect(fine.session_url)
+
             # Create Payment Session for paying fees for overdue
             session_creator = StripeSessionHandler(
                 borrowing=borrowing, payment_type="FINE"
             )
-            return redirect(session_creator.create_checkout_session(request))
+            try:
+                return redirect(
+                    session_creator.create_checkout_session(request, fine)
+                )
+            except PaymentGatewayError:
+                return self.payment_unavailable()
+
+        # set date when user has returned the book, conditional
+        # UPDATE so concurrent requests can't return it twice
+        return_date = timezone.now().date()
+        with transaction.atomic():
+            returned = Borrowing.objects.filter(
+                pk=borrowing.pk, actual_return_date__isnull=True
+            ).update(
+                actual_return_date=return_date, updated_at=timezone.now()
+            )
+            if returned:
+                # increase inventory
+                Book.objects.release(borrowing.book_id)
+                bump_catalog_version()
 
-        if borrowing.actual_return_date is not None:
+        if not returned:
             message = {"borrowing": (
                 "You have already return that book")
             }
             return Response(message, status=status.HTTP_400_BAD_REQUEST)
 
-        # increase inventory
-        book = borrowing.book
-        book.inventory += 1
-        book.save()
-        # set date when user has returned the book
-        borrowing.actual_return_date = timezone.now().date()
-        borrowing.save()
+        borrowing.book.inventory += 1
+        borrowing.actual_return_date = return_date
 
         serializer = self.get_serializer(borrowing)
         return Response(serializer.data, status=status.HTTP_204_NO_CONTENT)
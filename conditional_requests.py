@@ -0,0 +1,221 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Max
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+
+class NotModified(Exception):
+    """Raised when request preconditions say client copy is still valid"""
+
+    def __init__(self, response):
+        self.response = response
+
+
+def _cache():
+    return caches[settings.CONDITIONAL_CACHE]
+
+
+def _deleted_key(model) -> str:
+    return f"conditional:deleted:{model._meta.label_lower}"
+
+
+def mark_deleted(model) -> None:
+    """
+    Remember when row of model was deleted, after transaction
+    commits. Deletion doesn't change MAX(updated_at) of remaining
+    rows, so validators include this time. Call it from post_delete
+    receiver of every model in `conditional_fields`
+    """
+
+    def mark():
+        _cache().set(_deleted_key(model), time.time_ns(), timeout=None)
+
+    transaction.on_commit(mark)
+
+
+def get_deleted_times(models: list) -> list:
+    """Last deletion time (ns) of every model, in one cache call"""
+    keys = [_deleted_key(model) for model in models]
+    stored = _cache().get_many(keys)
+    times = []
+    for key in keys:
+        if key not in stored:
+            # unknown (first request or evicted) means "just now",
+            # so validators never go back in time
+            _cache().add(key, time.time_ns(), timeout=None)
+            stored[key] = _cache().get(key, time.time_ns())
+        times.append(stored[key])
+    return times
+
+
+class ConditionalGetMixin:
+    """
+    ETag / Last-Modified support for list and retrieve actions.
+
+    Validators are built from rows the action already fetched: page
+    of list (ids, pagination state) and retrieved object, plus one
+    small aggregate (MAX of `conditional_fields`) over those rows by
+    primary key and last deletion time of their models, so
+    `304 Not Modified` never touches serializers and no query runs
+    over the whole filtered list.
+
+    Views able to build validators without querying rows override
+    get_conditional_validators(), preconditions are then checked
+    before the handler runs.
+    """
+
+    conditional_actions = ("list", "retrieve")
+    # updated_at columns of every model rendered by the serializers
+    conditional_fields = ("updated_at",)
+
+    conditional = False
+    etag = None
+    last_modified = None
+
+    def get_conditional_validators(self, request):
+        """Return (etag, last_modified timestamp) or (None, None)"""
+        return None, None
+
+    def get_etag_parts(self, request) -> list:
+        """Extra values response depends on besides rows themselves"""
+        return [request.get_full_path(), request.user.pk]
+
+    def get_conditional_models(self) -> list:
+        model = self.get_queryset().model
+        models = []
+        for field in self.conditional_fields:
+            related = model
+            for name in field.split("__")[:-1]:
+                related = related._meta.get_field(name).related_model
+            if related not in models:
+                models.append(related)
+        return models
+
+    def get_rows_validators(self, request, ids: list, state: list):
+        """Validators of rows `ids` rendered in this order"""
+        if not ids:
+            # let the handler return empty list or 404
+            return None, None
+
+        model = self.get_queryset().model
+        aggregate = model._default_manager.filter(pk__in=ids).aggregate(
+            **{
+                f"max_{index}": Max(field)
+                for index, field in enumerate(self.conditional_fields)
+            }
+        )
+        deleted = get_deleted_times(self.get_conditional_models())
+        last_modified = max(
+            [
+                int(value.timestamp())
+                for value in aggregate.values()
+                if value is not None
+            ]
+            + [deleted_at // 10**9 for deleted_at in deleted]
+        )
+        etag = hashlib.md5(
+            ":".join(
+                str(part)
+                for part in [
+                    *[
+                        value.isoformat() if value is not None else ""
+                        for value in aggregate.values()
+                    ],
+                    *deleted,
+                    ",".join(str(pk) for pk in ids),
+                    *state,
+                    *self.get_etag_parts(request),
+                ]
+            ).encode()
+        ).hexdigest()
+        return etag, last_modified
+
+    def get_pagination_state(self) -> list:
+        """Values of pagination rendered besides rows"""
+        page = getattr(self.paginator, "page", None)
+        return [
+            self.paginator.get_next_link(),
+            self.paginator.get_previous_link(),
+            getattr(getattr(page, "paginator", None), "count", None),
+        ]
+
+    def check_preconditions(self, request, etag, last_modified) -> None:
+        self.etag, self.last_modified = etag, last_modified
+        if etag is None and last_modified is None:
+            return
+
+        response = get_conditional_response(
+            request,
+            etag=etag and quote_etag(etag),
+            last_modified=last_modified,
+        )
+        if response is not None:
+            self.set_validator_headers(response)
+            raise NotModified(response)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+
+        self.conditional = (
+            request.method in ("GET", "HEAD")
+            and self.action in self.conditional_actions
+        )
+        if self.conditional:
+            self.check_preconditions(
+                request, *self.get_conditional_validators(request)
+            )
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if self.conditional and self.etag is None:
+            if page is None:
+                ids, state = list(queryset.values_list("pk", flat=True)), []
+            else:
+                ids = [row.pk for row in page]
+                state = self.get_pagination_state()
+            self.check_preconditions(
+                self.request,
+                *self.get_rows_validators(self.request, ids, state),
+            )
+        return page
+
+    def get_object(self):
+        instance = super().get_object()
+        if (
+            self.conditional
+            and self.action == "retrieve"
+            and self.etag is None
+        ):
+            self.check_preconditions(
+                self.request,
+                *self.get_rows_validators(self.request, [instance.pk], []),
+            )
+        return instance
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def set_validator_headers(self, response):
+        if self.etag is not None:
+            response["ETag"] = quote_etag(self.etag)
+        if self.last_modified is not None:
+            response["Last-Modified"] = http_date(self.last_modified)
+        # response depends on authenticated user
+        patch_vary_headers(response, ["Authorization"])
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        if 200 <= response.status_code < 300 and (
+            self.etag is not None or self.last_modified is not None
+        ):
+            self.set_validator_headers(response)
+        return response
@@ -0,0 +1,137 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+
+from rest_framework import status
+from rest_framework.response import Response
+
+IN_PROGRESS = "in-progress"
+
+
+class IdempotentReplay(Exception):
+    """Raised when request repeats Idempotency-Key of earlier request"""
+
+    def __init__(self, response):
+        self.response = response
+
+
+class IdempotentMixin:
+    """
+    `Idempotency-Key` header support for unsafe actions.
+
+    First request with a key claims it with atomic cache.add(), its
+    successful (2xx or 3xx) response is stored for
+    IDEMPOTENCY_KEY_TTL and replayed to retries without running the
+    handler again. Retry while first request still runs gets
+    409 Conflict, key reused with another body gets 422. Failed
+    responses release the key so the request can be retried.
+    """
+
+    idempotent_actions = ("create",)
+    # response headers replayed with stored response
+    idempotent_headers = ("Location",)
+
+    idempotency_cache_key = None
+    idempotency_fingerprint = None
+
+    @property
+    def idempotency_cache(self):
+        return caches[settings.IDEMPOTENCY_CACHE]
+
+    def get_idempotency_cache_key(self, request, key: str) -> str:
+        # keys are scoped by user, clients generate them independently
+        return f"idempotency:{request.user.pk}:{self.action}:{key}"
+
+    def get_request_fingerprint(self, request) -> str:
+        # parsed data, multipart boundary differs between retries
+        return hashlib.sha256(
+            json.dumps(
+                [request.get_full_path(), request.data],
+                sort_keys=True,
+                default=str,
+            ).encode()
+        ).hexdigest()
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+
+        key = request.headers.get("Idempotency-Key")
+        if not key or self.action not in self.idempotent_actions:
+            return
+
+        cache_key = self.get_idempotency_cache_key(request, key)
+        fingerprint = self.idempotency_fingerprint = (
+            self.get_request_fingerprint(request)
+        )
+        claimed = self.idempotency_cache.add(
+            cache_key,
+            {"state": IN_PROGRESS, "fingerprint": fingerprint},
+            settings.IDEMPOTENCY_LOCK_TIMEOUT,
+        )
+        if claimed:
+            self.idempotency_cache_key = cache_key
+            return
+
+        stored = self.idempotency_cache.get(cache_key)
+        if stored is None:
+            # expired between add() and get(), client can retry
+            raise IdempotentReplay(self.conflict_response())
+        if stored["fingerprint"] != fingerprint:
+            raise IdempotentReplay(
+                Response(
+                    {"idempotency_key": (
+                        "Key was used with another request")},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                )
+            )
+        if stored["state"] == IN_PROGRESS:
+            raise IdempotentReplay(self.conflict_response())
+
+        response = Response(
+            stored["data"],
+            status=stored["status"],
+            headers=stored["headers"],
+        )
+        response["Idempotent-Replayed"] = "true"
+        raise IdempotentReplay(response)
+
+    @staticmethod
+    def conflict_response() -> Response:
+        return Response(
+            {"idempotency_key": "Request with this key is in progress"},
+            status=status.HTTP_409_CONFLICT,
+        )
+
+    def handle_exception(self, exc):
+        if isinstance(exc, IdempotentReplay):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        if self.idempotency_cache_key is None:
+            return response
+
+        if 200 <= response.status_code < 400:
+            self.idempotency_cache.set(
+                self.idempotency_cache_key,
+                {
+                    "state": "done",
+                    "fingerprint": self.idempotency_fingerprint,
+                    "status": response.status_code,
+                    "data": getattr(response, "data", None),
+                    "headers": {
+                        header: response[header]
+                        for header in self.idempotent_headers
+                        if response.has_header(header)
+                    },
+                },
+                settings.IDEMPOTENCY_KEY_TTL,
+            )
+        else:
+            self.idempotency_cache.delete(self.idempotency_cache_key)
+        return response
@@ -45,6 +45,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "rest_framework_simplejwt",
     "django_celery_beat",
@@ -60,6 +61,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "debug_toolbar.middleware.DebugToolbarMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -67,6 +69,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "profiling.ProfilerMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -170,7 +173,7 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 REST_FRAMEWORK = {
     "DATETIME_FORMAT": "%Y-%m-%d %H:%M:%S",
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "user.authentication.CachedJWTAuthentication",
     ),
     "DEFAULT_PAGINATION_CLASS": ("paginations.CustomPagination"),
     "DEFAULT_FILTER_BACKENDS": (
@@ -178,8 +181,8 @@ REST_FRAMEWORK = {
     ),
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
     "DEFAULT_THROTTLE_CLASSES": [
-        "rest_framework.throttling.AnonRateThrottle",
-        "rest_framework.throttling.UserRateThrottle",
+        "throttling.AnonRateThrottle",
+        "throttling.UserRateThrottle",
     ],
     "DEFAULT_THROTTLE_RATES": {"anon": "5000/day", "user": "10000/day"},
 }
@@ -204,14 +207,123 @@ SIMPLE_JWT = {
     "ROTATE_REFRESH_TOKENS": True,
 }
 
+# Cache, shared Redis is required when running several workers
+# so catalog version bumps are seen by every process
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("REDIS_URL"),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# Book catalog (BookViewSet.list) response cache
+BOOK_CATALOG_CACHE = "default"
+BOOK_CATALOG_CACHE_TIMEOUT = 60 * 15
+
+# Last deletion times of models in ETag/Last-Modified validators
+# (see conditional_requests.py)
+CONDITIONAL_CACHE = "default"
+
+# Idempotency-Key responses of checkout requests (see idempotency.py),
+# stored for a day like Stripe does, claim of running request
+# expires after lock timeout if worker dies before response
+IDEMPOTENCY_CACHE = "default"
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+IDEMPOTENCY_LOCK_TIMEOUT = 60
+
+# Users of JWT authenticated requests (see user.authentication),
+# short timeout bounds staleness of changes made without save()
+USER_AUTH_CACHE = "default"
+USER_AUTH_CACHE_TIMEOUT = 60
+
+# Throttle counters (see throttling.py), must be shared by workers
+THROTTLE_CACHE = "default"
+
+# Bearer token Prometheus sends to /metrics/, endpoint is open if empty
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# Tracing (see tracing.py): share of requests and task runs whose
+# spans are exported, durations of all spans go to metrics.
+# Exporter is "log" (JSON line to "tracing" logger), "otlp"
+# (OTLP/HTTP JSON to collector) or empty to export nothing
+TRACING_SAMPLE_RATE = float(os.getenv("TRACING_SAMPLE_RATE", "0.01"))
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "log")
+TRACING_OTLP_ENDPOINT = os.getenv(
+    "TRACING_OTLP_ENDPOINT", "http://localhost:4318/v1/traces"
+)
+TRACING_EXPORT_INTERVAL = 5
+TRACING_SERVICE_NAME = "library_service"
+
+# Staff requests with this header are profiled (see profiling.py),
+# profiles are kept in cache for a day. Profile is downloaded by
+# another request, with several workers cache must be shared (Redis)
+PROFILER_HEADER = "X-Profile"
+PROFILER_CACHE = "default"
+PROFILER_TTL = 24 * 60 * 60
+PROFILER_MAX_QUERIES = 10000
+PROFILER_TOP_FUNCTIONS = 50
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "tracing": {"handlers": ["console"], "level": "INFO"},
+        "borrowings": {"handlers": ["console"], "level": "INFO"},
+        "payments": {"handlers": ["console"], "level": "INFO"},
+    },
+}
+
+# tests use in-memory payment gateway, see test_utils.runner
+TEST_RUNNER = "test_utils.runner.OfflineTestRunner"
+
 # Celery Configuration Options
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL")
 CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND")
+# installed into django_celery_beat DatabaseScheduler on beat start
+CELERY_BEAT_SCHEDULE = {
+    # outbox is also drained right after every commit, periodic run
+    # retries failed messages and ones enqueued while broker was down
+    "send-telegram-outbox": {
+        "task": "borrowings.tasks.send_telegram_outbox",
+        "schedule": 60,
+    },
+}
 
 # Add Stripe API key to settings
 STRIPE_API_KEY = os.getenv("STRIPE_API_KEY")
+# Checkout provider, payments.gateways.FakeGateway keeps sessions
+# in memory for tests and local load tests (options: latency,
+# failure_rate, session_lifetime, seed)
+PAYMENT_GATEWAY = os.getenv(
+    "PAYMENT_GATEWAY", "payments.gateways.StripeGateway"
+)
+PAYMENT_GATEWAY_OPTIONS = {}
+
+# signing secret of /api/payments/webhook/ endpoint
+STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
+# Checkout Session expires 24 hours after creation by default,
+# pending payments are swept once their session is final
+STRIPE_SESSION_LIFETIME = 24 * 60 * 60
+STRIPE_SWEEP_BATCH_SIZE = 100
+# checkout whose pending payment got no session in this time (worker
+# died during Stripe call) is cancelled by sweep and book is released
+STRIPE_CHECKOUT_GRACE_PERIOD = 10 * 60
+STRIPE_SWEEP_CONCURRENCY = 10
+# success and cancel pages of pending payment refresh session
+# snapshot from payment gateway at most once per TTL seconds
+STRIPE_SESSION_REFRESH_TTL = 30
 
 # Multiplier for FINE type Payment
 FINE_MULTIPLIER = 2
@@ -219,6 +331,33 @@ FINE_MULTIPLIER = 2
 # Telegram bot configuration
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+# Bot API limits: about 30 messages per second per bot
+# and 20 messages per minute to one group or channel
+TELEGRAM_RATE_LIMIT = 30
+TELEGRAM_CHAT_RATE_LIMIT = (20, 60)
+# rate limit counters, must be shared by workers
+TELEGRAM_RATE_LIMIT_CACHE = "default"
+TELEGRAM_MAX_RETRIES = 3
+
+# Overdue borrowings scan, rows fetched per chunk
+# and notifications sent concurrently
+OVERDUE_SCAN_CHUNK_SIZE = 500
+OVERDUE_NOTIFICATION_CONCURRENCY = 10
+# "digest" packs overdue borrowings grouped by "user" or "due_date"
+# into few messages, "single" sends message per borrowing
+OVERDUE_NOTIFICATION_MODE = "digest"
+OVERDUE_DIGEST_GROUP_BY = "user"
+# days overdue (from tomorrow) at which borrowing is notified
+# again, each run notifies only borrowings which reached next stage
+OVERDUE_ESCALATION_DAYS = (0, 7, 30)
+# outbox messages sent per batch and tries before message is FAILED
+TELEGRAM_OUTBOX_BATCH_SIZE = 100
+TELEGRAM_OUTBOX_MAX_ATTEMPTS = 5
+# seconds claimed batch is owned by worker, other workers reclaim
+# it after that. Longer than sending a batch to one chat takes
+# (100 messages at 20 per minute) with retries
+TELEGRAM_OUTBOX_LEASE = 900
 
 # Cross-Origin Resource Sharing (CORS)
 CORS_ALLOWED_ORIGINS = os.getenv("CORS_ALLOWED_ORIGINS").split()
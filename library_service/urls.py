@@ -23,6 +23,9 @@ from drf_spectacular.views import (
     SpectacularSwaggerView,
 )
 
+from metrics import metrics_view
+from profiling import ProfileStatsView, ProfileView
+
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -38,4 +41,13 @@ urlpatterns = [
         name="swagger",
     ),
     path("__debug__/", include("debug_toolbar.urls")),
+    path("metrics/", metrics_view, name="metrics"),
+    path(
+        "profiles/<str:profile_id>/", ProfileView.as_view(), name="profile"
+    ),
+    path(
+        "profiles/<str:profile_id>/pstats/",
+        ProfileStatsView.as_view(),
+        name="profile-pstats",
+    ),
 ]
@@ -0,0 +1,187 @@
+import os
+import time
+from contextlib import contextmanager
+
+from celery.signals import task_postrun, task_prerun, worker_process_shutdown
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+from tracing import Span
+
+# Set PROMETHEUS_MULTIPROC_DIR (empty directory shared by processes
+# of one host, cleaned on start) for gunicorn and Celery prefork,
+# every process writes own files and /metrics aggregates them
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Time of request by view action",
+    ["view", "method", "status"],
+)
+HTTP_REQUEST_DB_QUERIES = Histogram(
+    "http_request_db_queries",
+    "Database queries made by request",
+    ["view"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500),
+)
+HTTP_REQUEST_DB_SECONDS = Histogram(
+    "http_request_db_duration_seconds",
+    "Time of database queries made by request",
+    ["view"],
+)
+EXTERNAL_CALL_SECONDS = Histogram(
+    "external_call_duration_seconds",
+    "Time of Stripe and Telegram API calls",
+    ["service", "operation"],
+)
+EXTERNAL_CALL_ERRORS = Counter(
+    "external_call_errors",
+    "Failed Stripe and Telegram API calls",
+    ["service", "operation"],
+)
+CELERY_TASK_SECONDS = Histogram(
+    "celery_task_duration_seconds",
+    "Time of Celery task run",
+    ["task", "state"],
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 1800, 3600),
+)
+
+
+def observe_external_call(
+    service: str, operation: str, seconds: float, error: bool = False
+) -> None:
+    EXTERNAL_CALL_SECONDS.labels(service, operation).observe(seconds)
+    if error:
+        EXTERNAL_CALL_ERRORS.labels(service, operation).inc()
+
+
+@contextmanager
+def external_call(service: str, operation: str):
+    """
+    Record time of the block, exception raised in it is an error,
+    block is traced as "<service>.<operation>" span
+    """
+    start = time.perf_counter()
+    error = True
+    try:
+        with Span(f"{service}.{operation}"):
+            yield
+        error = False
+    finally:
+        observe_external_call(
+            service, operation, time.perf_counter() - start, error
+        )
+
+
+def view_name(view_func, method: str) -> str:
+    """
+    "BookViewSet.list" for viewset actions, "StripeWebhookView.post"
+    for API views and module path for plain Django views
+    """
+    cls = getattr(view_func, "cls", None)
+    if cls is None:
+        return f"{view_func.__module__}.{view_func.__name__}"
+    actions = getattr(view_func, "actions", None) or {}
+    return f"{cls.__name__}.{actions.get(method, method)}"
+
+
+class QueryCounter:
+    """Database execute wrapper counting queries and their time"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+class MetricsMiddleware:
+    """
+    Record request time by view action with number and time
+    of database queries, requests which don't resolve to a view
+    are recorded as "unresolved". Request is root span of trace
+    named by view action
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.metrics_view = "unresolved"
+        counter = QueryCounter()
+        request_span = Span("http.request", {"method": request.method})
+        start = time.perf_counter()
+        with request_span, connection.execute_wrapper(counter):
+            response = self.get_response(request)
+            request_span.name = request.metrics_view
+            request_span.set(
+                status=response.status_code, db_queries=counter.count
+            )
+        elapsed = time.perf_counter() - start
+
+        view = request.metrics_view
+        HTTP_REQUEST_SECONDS.labels(
+            view, request.method, response.status_code
+        ).observe(elapsed)
+        HTTP_REQUEST_DB_QUERIES.labels(view).observe(counter.count)
+        HTTP_REQUEST_DB_SECONDS.labels(view).observe(counter.seconds)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics_view = view_name(view_func, request.method.lower())
+
+
+def get_registry():
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def metrics_view(request):
+    """Prometheus exposition, METRICS_TOKEN is required if it's set"""
+    token = settings.METRICS_TOKEN
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return HttpResponseForbidden()
+    return HttpResponse(
+        generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST
+    )
+
+
+_task_starts = {}
+
+
+@task_prerun.connect
+def start_task_timer(task_id, **kwargs):
+    _task_starts[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def observe_task(task_id, task, state=None, **kwargs):
+    start = _task_starts.pop(task_id, None)
+    if start is not None:
+        CELERY_TASK_SECONDS.labels(task.name, state or "UNKNOWN").observe(
+            time.perf_counter() - start
+        )
+
+
+@worker_process_shutdown.connect
+def mark_worker_dead(pid=None, **kwargs):
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(pid or os.getpid())
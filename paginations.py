@@ -1,6 +1,275 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+    Cursor,
+    CursorPagination,
+    PageNumberPagination,
+)
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination that seeks on every ordering column, so
+    ordering like ("author", "id") is filtered as
+    (author, id) > (last_author, last_id) instead of OFFSET.
+    Every page costs the same no matter how deep client pages.
+
+    Ordering is taken from OrderingFilter ?ordering= parameter,
+    then from view `cursor_ordering` attribute and "id"
+    is always added as tiebreaker to make position unique.
+    """
+
+    page_size = 10
+    max_page_size = 30
+    ordering = ("-id",)
+    tiebreaker = "id"
+
+    def get_ordering(self, request, queryset, view):
+        ordering = None
+        for backend in getattr(view, "filter_backends", []):
+            if hasattr(backend, "get_ordering"):
+                ordering = backend().get_ordering(request, queryset, view)
+                break
+
+        if not ordering:
+            ordering = getattr(view, "cursor_ordering", self.ordering)
+        if isinstance(ordering, str):
+            ordering = (ordering,)
+
+        ordering = [field for field in ordering if "__" not in field]
+        if not ordering:
+            ordering = list(self.ordering)
+
+        if ordering[-1].lstrip("-") not in (self.tiebreaker, "pk"):
+            direction = "-" if ordering[0].startswith("-") else ""
+            ordering.append(direction + self.tiebreaker)
+
+        return tuple(ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = self._decode_position(self.cursor)
+
+        queryset = queryset.order_by(
+            *[
+                self._order_by(queryset.model, field, reverse)
+                for field in self.ordering
+            ]
+        )
+        if position is not None:
+            queryset = queryset.filter(
+                self._seek_filter(queryset.model, position, reverse)
+            )
+
+        # fetch one extra row to know if there is a following page
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_following = len(results) > len(self.page)
+
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = position is not None
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+
+        if self.page:
+            position = self._get_position_from_instance(
+                self.page[-1], self.ordering
+            )
+        else:
+            position = self.cursor.position
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=False, position=position)
+        )
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+
+        if self.page:
+            position = self._get_position_from_instance(
+                self.page[0], self.ordering
+            )
+        else:
+            position = self.cursor.position
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=True, position=position)
+        )
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for field in ordering:
+            field_name = field.lstrip("-")
+            if isinstance(instance, dict):
+                value = instance[field_name]
+            else:
+                value = getattr(instance, field_name)
+            values.append(None if value is None else str(value))
+        return json.dumps(values)
+
+    def _decode_position(self, cursor: Cursor):
+        if cursor is None or cursor.position is None:
+            return None
+        try:
+            position = json.loads(cursor.position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if (
+            not isinstance(position, list)
+            or len(position) != len(self.ordering)
+        ):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    @staticmethod
+    def _is_nullable(model, field_name: str) -> bool:
+        try:
+            return model._meta.get_field(field_name).null
+        except FieldDoesNotExist:
+            # ordering by annotation, expect it can be NULL
+            return True
+
+    @classmethod
+    def _order_by(cls, model, field: str, reverse: bool):
+        """
+        NULLs are always kept at the end of forward pages,
+        so reversed pages have them at the beginning
+        """
+        field_name = field.lstrip("-")
+        expression = F(field_name)
+        nulls = {}
+        if cls._is_nullable(model, field_name):
+            nulls = {"nulls_first": True} if reverse else {"nulls_last": True}
+        if field.startswith("-") != reverse:
+            return expression.desc(**nulls)
+        return expression.asc(**nulls)
+
+    def _seek_filter(self, model, position: list, reverse: bool) -> Q:
+        """
+        Build row comparison (f1, f2, ...) > (v1, v2, ...) in the
+        page scan direction as (f1 > v1) OR (f1 = v1 AND f2 > v2) ...
+        """
+        seek = Q(pk__in=[])
+        equal_prefix = Q()
+
+        for field, value in zip(self.ordering, position):
+            field_name = field.lstrip("-")
+            nullable = self._is_nullable(model, field_name)
+            lookup = "lt" if field.startswith("-") != reverse else "gt"
+
+            if value is None:
+                # NULLs are last on forward and first on reverse pages
+                after = None
+                if reverse:
+                    after = Q(**{f"{field_name}__isnull": False})
+                equal = Q(**{f"{field_name}__isnull": True})
+            else:
+                after = Q(**{f"{field_name}__{lookup}": value})
+                if nullable and not reverse:
+                    after |= Q(**{f"{field_name}__isnull": True})
+                equal = Q(**{field_name: value})
+
+            if after is not None:
+                seek |= equal_prefix & after
+            equal_prefix &= equal
+
+        first_field, first_value = self.ordering[0], position[0]
+        first_name = first_field.lstrip("-")
+        if (
+            first_value is not None
+            and not self._is_nullable(model, first_name)
+        ):
+            # redundant bound on leading column lets database
+            # use index range scan for the whole row comparison
+            descending = first_field.startswith("-") != reverse
+            lookup = "lte" if descending else "gte"
+            seek &= Q(**{f"{first_name}__{lookup}": first_value})
+
+        return seek
 
 
 class CustomPagination(PageNumberPagination):
+    """
+    Page number pagination, ?pagination=cursor (or ?cursor=)
+    switches the request to KeysetPagination
+    """
+
     page_size = 10
     max_page_size = 30
+    pagination_query_param = "pagination"
+    keyset_pagination_class = KeysetPagination
+
+    keyset_paginator = None
+
+    def use_keyset(self, request) -> bool:
+        return (
+            request.query_params.get(self.pagination_query_param) == "cursor"
+            or self.keyset_pagination_class.cursor_query_param
+            in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_keyset(request):
+            self.keyset_paginator = self.keyset_pagination_class()
+            return self.keyset_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_next_link(self):
+        if self.keyset_paginator is not None:
+            return self.keyset_paginator.get_next_link()
+        return super().get_next_link()
+
+    def get_previous_link(self):
+        if self.keyset_paginator is not None:
+            return self.keyset_paginator.get_previous_link()
+        return super().get_previous_link()
+
+    def get_paginated_response(self, data):
+        if self.keyset_paginator is not None:
+            return self.keyset_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_html_context(self):
+        if self.keyset_paginator is not None:
+            return self.keyset_paginator.get_html_context()
+        return super().get_html_context()
+
+    def get_schema_operation_parameters(self, view):
+        return super().get_schema_operation_parameters(view) + [
+            {
+                "name": self.pagination_query_param,
+                "required": False,
+                "in": "query",
+                "description": (
+                    "Set to 'cursor' to use keyset pagination, "
+                    "response has no count and next/previous are cursors"
+                ),
+                "schema": {"type": "string", "enum": ["cursor"]},
+            },
+            *self.keyset_pagination_class().get_schema_operation_parameters(
+                view
+            ),
+        ]
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+
+@register()
+def stripe_webhook_secret_check(app_configs, **kwargs):
+    """Webhook can't verify events without STRIPE_WEBHOOK_SECRET"""
+    if settings.STRIPE_WEBHOOK_SECRET:
+        return []
+    return [
+        Warning(
+            "STRIPE_WEBHOOK_SECRET is not set.",
+            hint=(
+                "Stripe webhook answers 503 to every event until "
+                "it's set to signing secret of the endpoint."
+            ),
+            id="payments.W001",
+        )
+    ]
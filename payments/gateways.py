@@ -0,0 +1,249 @@
+import itertools
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass, replace
+
+import stripe
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from metrics import external_call
+
+
+class PaymentGatewayError(Exception):
+    """Payment provider is unavailable or rejected request"""
+
+
+@dataclass(frozen=True)
+class CheckoutSession:
+    id: str
+    url: str
+    # open, complete or expired
+    status: str
+    # paid or unpaid
+    payment_status: str
+    expires_at: int
+    currency: str
+    amount_total: int
+
+
+class PaymentGateway:
+    """
+    Hosted checkout provider. Amounts are in cents,
+    errors of provider are raised as PaymentGatewayError
+    """
+
+    def create_session(
+        self,
+        name: str,
+        amount: int,
+        message: str,
+        success_url: str,
+        cancel_url: str,
+        idempotency_key: str = None,
+    ) -> CheckoutSession:
+        """
+        Requests with the same `idempotency_key` return session
+        created by the first one instead of a new session
+        """
+        raise NotImplementedError
+
+    def retrieve_session(self, session_id: str) -> CheckoutSession:
+        raise NotImplementedError
+
+
+class StripeGateway(PaymentGateway):
+    """Stripe Checkout Sessions"""
+
+    def __init__(self, api_key: str = None):
+        self.api_key = api_key or settings.STRIPE_API_KEY
+
+    @staticmethod
+    def _session(session) -> CheckoutSession:
+        return CheckoutSession(
+            id=session["id"],
+            url=session["url"],
+            status=session["status"],
+            payment_status=session["payment_status"],
+            expires_at=session["expires_at"],
+            currency=session["currency"],
+            amount_total=session["amount_total"],
+        )
+
+    def create_session(
+        self,
+        name,
+        amount,
+        message,
+        success_url,
+        cancel_url,
+        idempotency_key=None,
+    ) -> CheckoutSession:
+        try:
+            with external_call("stripe", "create_session"):
+                session = stripe.checkout.Session.create(
+                    api_key=self.api_key,
+                    line_items=[
+                        {
+                            "price_data": {
+                                "currency": "usd",
+                                "unit_amount": amount,
+                                "product_data": {"name": name},
+                            },
+                            "quantity": 1,
+                        }
+                    ],
+                    mode="payment",
+                    success_url=success_url,
+                    cancel_url=cancel_url,
+                    custom_text={"submit": {"message": message}},
+                    idempotency_key=idempotency_key,
+                )
+        except stripe.error.StripeError as error:
+            raise PaymentGatewayError(str(error)) from error
+        return self._session(session)
+
+    def retrieve_session(self, session_id: str) -> CheckoutSession:
+        try:
+            with external_call("stripe", "retrieve_session"):
+                session = stripe.checkout.Session.retrieve(
+                    session_id, api_key=self.api_key
+                )
+        except stripe.error.StripeError as error:
+            raise PaymentGatewayError(str(error)) from error
+        return self._session(session)
+
+
+class FakeGateway(PaymentGateway):
+    """
+    Deterministic in-memory gateway for tests and local load tests.
+    `latency` seconds are slept on every call, `failure_rate` of calls
+    fail (with seeded random) and `fail_next` calls fail in a row.
+    Sessions expire after `session_lifetime`, move clock with advance()
+    and finish checkout with pay() or expire()
+    """
+
+    def __init__(
+        self,
+        latency: float = 0,
+        failure_rate: float = 0,
+        session_lifetime: int = None,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.session_lifetime = (
+            session_lifetime or settings.STRIPE_SESSION_LIFETIME
+        )
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.random = random.Random(self.seed)
+            # sessions of previous processes can be saved in database
+            self.prefix = f"cs_fake_{uuid.uuid4().hex[:8]}"
+            self.ids = itertools.count(1)
+            self.sessions = {}
+            self.idempotent_sessions = {}
+            self.fail_next = 0
+            self.time_offset = 0
+            self.calls = 0
+
+    def now(self) -> int:
+        return int(time.time() + self.time_offset)
+
+    def advance(self, seconds: int) -> None:
+        self.time_offset += seconds
+
+    def _call(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.calls += 1
+            if self.fail_next:
+                self.fail_next -= 1
+                raise PaymentGatewayError("Fake gateway failure")
+            if self.random.random() < self.failure_rate:
+                raise PaymentGatewayError("Fake gateway random failure")
+
+    def create_session(
+        self,
+        name,
+        amount,
+        message,
+        success_url,
+        cancel_url,
+        idempotency_key=None,
+    ) -> CheckoutSession:
+        self._call()
+        with self.lock:
+            if idempotency_key in self.idempotent_sessions:
+                return self.idempotent_sessions[idempotency_key]
+            session_id = f"{self.prefix}_{next(self.ids)}"
+            session = CheckoutSession(
+                id=session_id,
+                url=f"https://checkout.fake/pay/{session_id}",
+                status="open",
+                payment_status="unpaid",
+                expires_at=self.now() + self.session_lifetime,
+                currency="usd",
+                amount_total=amount,
+            )
+            self.sessions[session_id] = session
+            if idempotency_key:
+                self.idempotent_sessions[idempotency_key] = session
+        return session
+
+    def retrieve_session(self, session_id: str) -> CheckoutSession:
+        self._call()
+        with self.lock:
+            if session_id not in self.sessions:
+                raise PaymentGatewayError(f"No such session: {session_id}")
+            session = self.sessions[session_id]
+            if session.status == "open" and session.expires_at <= self.now():
+                session = self.sessions[session_id] = replace(
+                    session, status="expired"
+                )
+        return session
+
+    def pay(self, session_id: str) -> CheckoutSession:
+        with self.lock:
+            session = self.sessions[session_id] = replace(
+                self.sessions[session_id],
+                status="complete",
+                payment_status="paid",
+            )
+        return session
+
+    def expire(self, session_id: str) -> CheckoutSession:
+        with self.lock:
+            session = self.sessions[session_id] = replace(
+                self.sessions[session_id], status="expired"
+            )
+        return session
+
+
+_gateways = {}
+
+
+def get_gateway() -> PaymentGateway:
+    """Return PAYMENT_GATEWAY instance shared by process"""
+    path = settings.PAYMENT_GATEWAY
+    if path not in _gateways:
+        _gateways[path] = import_string(path)(
+            **settings.PAYMENT_GATEWAY_OPTIONS
+        )
+    return _gateways[path]
+
+
+@receiver(setting_changed)
+def reset_gateways(setting, **kwargs):
+    if setting in ("PAYMENT_GATEWAY", "PAYMENT_GATEWAY_OPTIONS"):
+        _gateways.clear()
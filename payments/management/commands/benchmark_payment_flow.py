@@ -0,0 +1,184 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from books.models import Book
+from payments.gateways import get_gateway
+
+from test_utils.stripe_webhooks import (
+    StripeEventReplayer,
+    checkout_session_event,
+)
+
+WEBHOOK_SECRET = "whsec_benchmark"
+
+
+def percentile(timings: list, percent: int) -> float:
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, len(timings) * percent // 100)]
+
+
+class Command(BaseCommand):
+    """
+    Drive borrow, pay (signed checkout.session.completed webhook)
+    and return requests through the API in process with in-memory
+    payment gateway, report flows and requests per second and
+    latency of every step. Throttling is disabled for the run
+    """
+
+    steps = ("borrow", "webhook", "return")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--flows", type=int, default=1000)
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0,
+            help="Simulated gateway call time in milliseconds",
+        )
+        parser.add_argument(
+            "--failure-rate",
+            type=float,
+            default=0,
+            help="Share of gateway calls which fail",
+        )
+
+    def handle(self, *args, **options):
+        rest_framework = {
+            **settings.REST_FRAMEWORK,
+            "DEFAULT_THROTTLE_CLASSES": [],
+        }
+        with override_settings(
+            PAYMENT_GATEWAY="payments.gateways.FakeGateway",
+            PAYMENT_GATEWAY_OPTIONS={
+                "latency": options["latency"] / 1000,
+                "failure_rate": options["failure_rate"],
+            },
+            STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET,
+            ALLOWED_HOSTS=["testserver"],
+            REST_FRAMEWORK=rest_framework,
+        ):
+            self.run(options["threads"], options["flows"])
+
+    def run(self, threads: int, flows: int):
+        run_id = uuid.uuid4().hex[:12]
+        book = Book.objects.create(
+            title=f"benchmark-{run_id}",
+            author="benchmark",
+            inventory=threads,
+            daily_fee=1,
+        )
+        users = [
+            get_user_model().objects.create_user(
+                email=f"benchmark-{run_id}-{index}@example.com",
+                password=run_id,
+            )
+            for index in range(threads)
+        ]
+
+        per_thread = [flows // threads] * threads
+        for index in range(flows % threads):
+            per_thread[index] += 1
+
+        start = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                results = list(
+                    executor.map(
+                        self.worker, users, per_thread, [book] * threads
+                    )
+                )
+            elapsed = time.perf_counter() - start
+        finally:
+            get_user_model().objects.filter(
+                id__in=[user.id for user in users]
+            ).delete()
+            book.delete()
+
+        completed = sum(result["completed"] for result in results)
+        unavailable = sum(result["unavailable"] for result in results)
+        requests = sum(
+            len(result[step]) for result in results for step in self.steps
+        )
+        self.stdout.write(
+            f"{completed}/{flows} flows by {threads} threads in "
+            f"{elapsed:.2f}s, {completed / elapsed:.0f} flows/s, "
+            f"{requests / elapsed:.0f} requests/s, "
+            f"{unavailable} payment unavailable, "
+            f"gateway calls {get_gateway().calls}"
+        )
+        for step in self.steps:
+            timings = [
+                timing for result in results for timing in result[step]
+            ]
+            if timings:
+                self.stdout.write(
+                    f"  {step}: p50 {percentile(timings, 50) * 1000:.1f} ms,"
+                    f" p99 {percentile(timings, 99) * 1000:.1f} ms"
+                )
+
+    def worker(self, user, flows: int, book: Book) -> dict:
+        client = APIClient()
+        client.force_authenticate(user)
+        replayer = StripeEventReplayer(client, WEBHOOK_SECRET)
+        result = {step: [] for step in self.steps}
+        result.update(completed=0, unavailable=0)
+        data = {
+            "book": book.id,
+            "expected_return_date": date.today() + timedelta(days=1),
+        }
+
+        def timed(step: str, request):
+            start = time.perf_counter()
+            response = request()
+            result[step].append(time.perf_counter() - start)
+            return response
+
+        try:
+            for _ in range(flows):
+                response = timed(
+                    "borrow",
+                    lambda: client.post(
+                        reverse("borrowings:borrowing-list"), data
+                    ),
+                )
+                if response.status_code != 302:
+                    result["unavailable"] += 1
+                    continue
+
+                # redirect to https://checkout.fake/pay/<session id>
+                session_id = response["Location"].rsplit("/", 1)[-1]
+                timed(
+                    "webhook",
+                    lambda: replayer.send(
+                        checkout_session_event(
+                            "checkout.session.completed", session_id
+                        )
+                    ),
+                )
+                borrowing_id = user.borrowings.latest("id").id
+                timed(
+                    "return",
+                    lambda: client.post(
+                        reverse(
+                            "borrowings:borrowing-return",
+                            args=[borrowing_id],
+                        )
+                    ),
+                )
+                result["completed"] += 1
+            return result
+        finally:
+            # every thread has it's own database connection
+            connection.close()
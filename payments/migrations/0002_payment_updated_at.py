@@ -0,0 +1,17 @@
+# Generated by Django 4.2.8 on 2026-10-18 18:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("payments", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="payment",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
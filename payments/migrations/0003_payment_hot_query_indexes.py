@@ -0,0 +1,26 @@
+# Generated by Django 4.2.8 on 2026-10-18 18:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("payments", "0002_payment_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(
+                fields=["borrowing", "type"], name="payment_borrowing_type_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(
+                condition=models.Q(("status", "PENDING")),
+                fields=["borrowing"],
+                name="payment_pending_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.8 on 2026-10-18 18:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("payments", "0003_payment_hot_query_indexes"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="payment",
+            name="session_id",
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True),
+        ),
+    ]
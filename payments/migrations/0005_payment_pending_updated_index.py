@@ -0,0 +1,20 @@
+# Generated by Django 4.2.8 on 2026-10-18 19:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("payments", "0004_payment_session_id_null"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(
+                condition=models.Q(("status", "PENDING")),
+                fields=["updated_at", "id"],
+                name="payment_pending_updated_idx",
+            ),
+        ),
+    ]
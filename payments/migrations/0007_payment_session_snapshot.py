@@ -0,0 +1,32 @@
+# Generated by Django 4.2.8 on 2026-10-18 19:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("payments", "0006_stripeevent"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="payment",
+            name="session_amount_total",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="payment",
+            name="session_checked_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="payment",
+            name="session_currency",
+            field=models.CharField(blank=True, max_length=3),
+        ),
+        migrations.AddField(
+            model_name="payment",
+            name="session_expires_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.8 on 2026-10-18 20:05
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_session_expires_at(apps, schema_editor):
+    """
+    Sessions created before snapshot was saved expire
+    session lifetime after payment was last updated
+    """
+    Payment = apps.get_model("payments", "Payment")
+    Payment.objects.filter(
+        session_id__isnull=False, session_expires_at__isnull=True
+    ).update(
+        session_expires_at=F("updated_at")
+        + timedelta(seconds=settings.STRIPE_SESSION_LIFETIME)
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("payments", "0007_payment_session_snapshot"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            backfill_session_expires_at, migrations.RunPython.noop
+        ),
+        migrations.RemoveIndex(
+            model_name="payment",
+            name="payment_pending_updated_idx",
+        ),
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(
+                condition=models.Q(("status", "PENDING")),
+                fields=["session_expires_at", "id"],
+                name="payment_pending_expires_idx",
+            ),
+        ),
+    ]
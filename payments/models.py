@@ -1,5 +1,58 @@
 from django.core.validators import URLValidator
 from django.db import models
+from django.db.models import CharField, Max, Min, Q, TextField, Value
+from django.db.models.functions import Cast, Concat, LPad, Substr
+
+# width of zero padded id prefix, bigint has at most 19 digits
+ID_WIDTH = 20
+
+
+def latest(field: str, payment_type: str) -> Substr:
+    """
+    Aggregate returning `field` of the latest payment of type in
+    group: MAX() of value prefixed with zero padded id picks row
+    with the biggest id, prefix is cut off, so group is read in
+    one pass without per row subqueries (works on every backend)
+    """
+    return Substr(
+        Max(
+            Concat(
+                LPad(Cast("id", CharField()), ID_WIDTH, Value("0")),
+                field,
+                output_field=TextField(),
+            ),
+            filter=Q(type=payment_type),
+        ),
+        ID_WIDTH + 1,
+    )
+
+
+class PaymentQuerySet(models.QuerySet):
+    def borrowing_summary(self, borrowing_ids):
+        """
+        Payment and fine status, pending payment id and session
+        links of given borrowings grouped by borrowing.
+        Borrowing can have several payments of one type (renewed
+        or repeated fines), status and link are of the latest one
+        """
+        return (
+            self.filter(borrowing_id__in=borrowing_ids)
+            .order_by()
+            .values("borrowing_id")
+            .annotate(
+                pending_payment_id=Min("id", filter=Q(status="PENDING")),
+                payment_status=latest("status", "PAYMENT"),
+                fine_status=latest("status", "FINE"),
+                payment_session_url=latest("session_url", "PAYMENT"),
+                fine_session_url=latest("session_url", "FINE"),
+            )
+        )
+
+    def summary_by_borrowing(self, borrowing_ids) -> dict:
+        return {
+            row.pop("borrowing_id"): row
+            for row in self.borrowing_summary(borrowing_ids)
+        }
 
 
 class Payment(models.Model):
@@ -28,11 +81,59 @@ class Payment(models.Model):
         related_name="payments",
     )
     session_url = models.TextField(validators=[URLValidator()] , max_length=2000)
-    session_id = models.CharField(max_length=255, unique=True)
+    # NULL until Stripe Session is created after checkout commits
+    session_id = models.CharField(
+        max_length=255, unique=True, null=True, blank=True
+    )
     money_to_pay = models.DecimalField(
         decimal_places=2,
         max_digits=20,
     )
+    # snapshot of checkout session served by success and cancel pages,
+    # pending ones are refreshed after STRIPE_SESSION_REFRESH_TTL
+    session_expires_at = models.DateTimeField(blank=True, null=True)
+    session_currency = models.CharField(max_length=3, blank=True)
+    session_amount_total = models.PositiveIntegerField(blank=True, null=True)
+    session_checked_at = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = PaymentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # payment or fine of borrowing, renew_payment
+            models.Index(
+                fields=["borrowing", "type"],
+                name="payment_borrowing_type_idx",
+            ),
+            # unpaid payments check on borrowing create,
+            # success_url and pending sessions status sweep
+            models.Index(
+                fields=["borrowing"],
+                condition=Q(status="PENDING"),
+                name="payment_pending_idx",
+            ),
+            # stripe sessions sweep of pending payments by expiry
+            models.Index(
+                fields=["session_expires_at", "id"],
+                condition=Q(status="PENDING"),
+                name="payment_pending_expires_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.borrowing}"
+
+
+class StripeEvent(models.Model):
+    """
+    Processed Stripe webhook event, unique event_id makes
+    redelivered events no-op (see payments.webhooks)
+    """
+
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.type} {self.event_id}"
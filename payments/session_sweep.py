@@ -0,0 +1,235 @@
+import contextvars
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, QuerySet
+from django.utils import timezone
+
+from tracing import span, traced
+from .gateways import PaymentGatewayError
+from .models import Payment
+from .stripe_api import StripeSessionHandler
+from .success_payment_nofication import send_success_payment_notification
+
+logger = logging.getLogger(__name__)
+
+
+def sweepable_payments(now=None) -> QuerySet:
+    """
+    PENDING payments whose Stripe Session has expired by it's
+    expires_at snapshot, such session is final (paid or expired)
+    and is checked once. Younger sessions can still be paid,
+    success_url handles them
+    """
+    now = now or timezone.now()
+    return Payment.objects.filter(
+        status=Payment.Status.PENDING,
+        session_id__isnull=False,
+        session_expires_at__lte=now,
+    )
+
+
+def abandoned_checkouts(now=None) -> QuerySet:
+    """
+    PENDING payments which got no Stripe Session in grace period,
+    checkout or fine request failed after payment was committed
+    """
+    now = now or timezone.now()
+    return Payment.objects.filter(
+        status=Payment.Status.PENDING,
+        session_id__isnull=True,
+        updated_at__lte=now - timedelta(
+            seconds=settings.STRIPE_CHECKOUT_GRACE_PERIOD
+        ),
+    )
+
+
+@traced("payments.cancel_abandoned_checkouts")
+def cancel_abandoned_checkouts(now=None) -> int:
+    """
+    Cancel borrowings of abandoned checkouts releasing their books
+    and delete abandoned fines. Return number of removed payments
+    """
+    with transaction.atomic():
+        payments = list(
+            abandoned_checkouts(now)
+            .select_related("borrowing")
+            .select_for_update(skip_locked=True, of=("self",))
+        )
+        for payment in payments:
+            if payment.type == Payment.Type.FINE:
+                payment.delete()
+            elif Payment.objects.filter(pk=payment.pk).exists():
+                # not deleted with borrowing of previous payment
+                payment.borrowing.cancel_checkout()
+    return len(payments)
+
+
+def retrieve_session(session_id: str):
+    try:
+        return StripeSessionHandler.get_checkout_session(session_id)
+    except PaymentGatewayError as error:
+        # session is retried on next sweep
+        logger.warning("Stripe Session %s error: %s", session_id, error)
+        return None
+
+
+def retrieve_sessions(session_ids: list, concurrency: int) -> dict:
+    """
+    Retrieve Stripe Sessions concurrently, return them by id.
+    Every call runs in copy of caller context, so it's spans
+    are children of current span
+    """
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [
+            executor.submit(
+                contextvars.copy_context().run, retrieve_session, session_id
+            )
+            for session_id in session_ids
+        ]
+        return {
+            session_id: future.result()
+            for session_id, future in zip(session_ids, futures)
+        }
+
+
+def session_status(session) -> str:
+    """Return new Payment status of final session or None"""
+    if session is None:
+        return None
+    if session.status == "expired":
+        return Payment.Status.EXPIRED
+    if session.payment_status == "paid":
+        return Payment.Status.PAID
+    return None
+
+
+def save_changed(changed: list, fields: tuple = ()) -> list:
+    """
+    Write changed statuses (and `fields`) with bulk_update, skip
+    payments which were updated meanwhile (like paid by webhook)
+    and queue success notification for paid ones.
+    Return saved payments
+    """
+    with transaction.atomic():
+        pending = set(
+            Payment.objects.filter(
+                id__in=[payment.id for payment in changed],
+                status=Payment.Status.PENDING,
+            )
+            .select_for_update()
+            .values_list("id", flat=True)
+        )
+        changed = [payment for payment in changed if payment.id in pending]
+        # bulk_update doesn't set auto_now fields
+        now = timezone.now()
+        for payment in changed:
+            payment.updated_at = now
+
+        Payment.objects.bulk_update(
+            changed, ["status", *fields, "updated_at"]
+        )
+        for payment in changed:
+            if payment.status == Payment.Status.PAID:
+                send_success_payment_notification(payment.borrowing)
+
+    return changed
+
+
+@traced("payments.sweep_stripe_sessions")
+def sweep_stripe_sessions(
+    batch_size: int = None, concurrency: int = None
+) -> dict:
+    """
+    Cancel abandoned checkouts and update status of PENDING
+    payments from their final Stripe Sessions, fetched
+    `concurrency` at a time in batches. Return number of
+    cancelled checkouts, checked sessions, changes and run time
+    """
+    batch_size = batch_size or settings.STRIPE_SWEEP_BATCH_SIZE
+    concurrency = concurrency or settings.STRIPE_SWEEP_CONCURRENCY
+    start = time.perf_counter()
+    stats = {"checked": 0, "expired": 0, "paid": 0}
+    stats["cancelled"] = cancel_abandoned_checkouts()
+    payments = (
+        sweepable_payments()
+        .select_related("borrowing__book", "borrowing__user")
+        .order_by("session_expires_at", "id")
+    )
+    # seek on payment_pending_expires_idx, every payment is checked
+    # once per run, failed lookups are retried next run
+    last = Q()
+
+    while True:
+        with span("payments.sweep_batch.select"):
+            batch = list(payments.filter(last)[:batch_size])
+        if not batch:
+            break
+
+        last_expires_at, last_id = batch[-1].session_expires_at, batch[-1].id
+        last = Q(session_expires_at__gt=last_expires_at) | Q(
+            session_expires_at=last_expires_at, id__gt=last_id
+        )
+        sessions = retrieve_sessions(
+            [payment.session_id for payment in batch], concurrency
+        )
+        changed = []
+        for payment in batch:
+            session = sessions[payment.session_id]
+            new_status = session_status(session)
+            if new_status:
+                payment.status = new_status
+                StripeSessionHandler.snapshot_session(payment, session)
+                changed.append(payment)
+
+        with span("payments.sweep_batch.save", changed=len(changed)):
+            saved = save_changed(
+                changed, StripeSessionHandler.snapshot_fields
+            )
+        for payment in saved:
+            stats[payment.status.lower()] += 1
+        stats["checked"] += len(batch)
+
+    stats["seconds"] = round(time.perf_counter() - start, 3)
+    return stats
+
+
+def refresh_payment_session(payment: Payment) -> Payment:
+    """
+    Refresh session snapshot of PENDING payment at most once per
+    STRIPE_SESSION_REFRESH_TTL and apply paid or expired status
+    if webhook hasn't yet. Final payments and gateway errors are
+    served from snapshot
+    """
+    now = timezone.now()
+    if (
+        payment.status != Payment.Status.PENDING
+        or not payment.session_id
+        or (
+            payment.session_checked_at
+            and now - payment.session_checked_at
+            < timedelta(seconds=settings.STRIPE_SESSION_REFRESH_TTL)
+        )
+    ):
+        return payment
+
+    session = retrieve_session(payment.session_id)
+    if session is None:
+        return payment
+
+    StripeSessionHandler.snapshot_session(payment, session)
+    new_status = session_status(session)
+    if new_status:
+        payment.status = new_status
+        if not save_changed([payment], StripeSessionHandler.snapshot_fields):
+            # webhook has changed it meanwhile
+            payment.refresh_from_db()
+    else:
+        payment.save(
+            update_fields=[*StripeSessionHandler.snapshot_fields, "updated_at"]
+        )
+    return payment
@@ -0,0 +1,10 @@
+from django.dispatch import receiver
+from django.db.models.signals import post_delete
+
+from conditional_requests import mark_deleted
+from .models import Payment
+
+
+@receiver(post_delete, sender=Payment)
+def mark_payment_deleted(sender, instance: Payment, **kwargs):
+    mark_deleted(Payment)
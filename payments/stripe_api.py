@@ -1,19 +1,25 @@
-from typing_extensions import Literal
+from datetime import datetime, timezone as dt_timezone
 
-import stripe
-from stripe.checkout import Session
+from typing_extensions import Literal
 
-from django.conf import settings
-from django.db import transaction
 from django.shortcuts import reverse
+from django.utils import timezone
 
+from payments.gateways import (
+    CheckoutSession,
+    PaymentGatewayError,
+    get_gateway,
+)
 from payments.models import Payment
 from borrowings.models import Borrowing
 
-stripe.api_key = settings.STRIPE_API_KEY
-
 
 class StripeSessionHandler:
+    """
+    Checkout Sessions of borrowing payments, sessions are created
+    by settings.PAYMENT_GATEWAY (Stripe or in-memory fake)
+    """
+
     def __init__(
         self,
         borrowing: Borrowing,
@@ -37,68 +43,97 @@ class StripeSessionHandler:
                     f"{self.borrowing.book.title} - "
                     f"{self.borrowing.book.author}")
 
-    @transaction.atomic
-    def create_checkout_session(self, request, payment: Payment = None) -> str:
+    def create_payment(self) -> Payment:
+        """Create PENDING Payment, Stripe Session is added later"""
+        return Payment.objects.create(
+            status="PENDING",
+            type=self.payment_type,
+            borrowing=self.borrowing,
+            money_to_pay=self._get_price(),
+        )
+
+    def create_session(self, request, payment: Payment) -> str:
         """
-        Create new Payment and Stripe Session to it but if
-        payment parameter was provided then create new Stripe
-        Session for current payment and return session url
+        Create checkout session for payment and return session url.
+        It's a network call, so don't run it inside transaction
+        which holds row locks
         """
         book = self.borrowing.book
-        price = self._get_price()
-
-        if not isinstance(payment, Payment):
-            payment = Payment.objects.create(
-                status="PENDING",
-                type=self.payment_type,
-                borrowing=self.borrowing,
-                money_to_pay=price,
-            )
-        payment = payment
-
-        checkout_session = stripe.checkout.Session.create(
-            line_items=[
-                {
-                    "price_data": {
-                        "currency": "usd",
-                        "unit_amount": price,
-                        "product_data": {
-                            "name": f"{book.author} - {book.title}"
-                        },
-                    },
-                    "quantity": 1,
-                }
-            ],
-            mode="payment",
+
+        checkout_session = get_gateway().create_session(
+            name=f"{book.author} - {book.title}",
+            amount=self._get_price(),
+            message=self._get_message(),
             success_url=request.build_absolute_uri(
                 reverse("payments:payment-success", args=[payment.id])
             ),
             cancel_url=request.build_absolute_uri(
                 reverse("payments:payment-cancel", args=[payment.id])
             ),
-            custom_text={"submit": {"message": self._get_message()}},
+            idempotency_key=self.idempotency_key(payment),
         )
 
+        payment.status = Payment.Status.PENDING
         payment.session_id = checkout_session.id
         payment.session_url = checkout_session.url
-        payment.save()
+        self.snapshot_session(payment, checkout_session)
+        payment.save(
+            update_fields=[
+                "status",
+                "session_id",
+                "session_url",
+                *self.snapshot_fields,
+                "updated_at",
+            ]
+        )
 
         return checkout_session.url
 
     @staticmethod
-    def get_checkout_session(session_id: str) -> Session:
-        """Return Stripe Checkout Session"""
-        return stripe.checkout.Session.retrieve(session_id)
+    def idempotency_key(payment: Payment) -> str:
+        """
+        Gateway idempotency key of payment session, retried call
+        gets the same session, renewed payment (with expired
+        session_id) gets a new one
+        """
+        return f"payment-{payment.id}-after-{payment.session_id or 'none'}"
 
-    @staticmethod
-    def session_is_expired(payment: Payment) -> bool:
+    def create_checkout_session(self, request, payment: Payment = None) -> str:
         """
-        If session is expired then update Payment status to
-        EXPIRED and return True either False
+        Create new Payment and Stripe Session to it but if
+        payment parameter was provided then create new Stripe
+        Session for current payment and return session url.
+        New Payment is deleted if session can't be created
         """
-        session = StripeSessionHandler.get_checkout_session(payment.session_id)
-        if session["status"] == "expired":
-            payment.status = "EXPIRED"
-            payment.save()
-            return True
-        return False
+        created = not isinstance(payment, Payment)
+        if created:
+            payment = self.create_payment()
+
+        try:
+            return self.create_session(request, payment)
+        except Exception:
+            if created:
+                payment.delete()
+            raise
+
+    snapshot_fields = (
+        "session_expires_at",
+        "session_currency",
+        "session_amount_total",
+        "session_checked_at",
+    )
+
+    @staticmethod
+    def snapshot_session(payment: Payment, session: CheckoutSession) -> None:
+        """Copy session fields shown by success and cancel pages"""
+        payment.session_expires_at = datetime.fromtimestamp(
+            session.expires_at, tz=dt_timezone.utc
+        )
+        payment.session_currency = session.currency
+        payment.session_amount_total = session.amount_total
+        payment.session_checked_at = timezone.now()
+
+    @staticmethod
+    def get_checkout_session(session_id: str) -> CheckoutSession:
+        """Return checkout session from payment gateway"""
+        return get_gateway().retrieve_session(session_id)
@@ -1,13 +1,14 @@
-import asyncio
-
 from django.conf import settings
 
-from borrowings.telegram_notification import send_telegram_notification
 from borrowings.models import Borrowing
+from borrowings.telegram_outbox import enqueue_telegram_notification
 
 
 def send_success_payment_notification(borrowing: Borrowing):
-    """Send Telegram successful payment message"""
+    """
+    Send Telegram successful payment message, call it in the
+    transaction which marks payment as paid
+    """
     book = borrowing.book
     price_no_fines = borrowing.num_of_borrowing_days() * book.daily_fee
     price_with_fines = price_no_fines + (
@@ -25,10 +26,4 @@ Book author: {book.author}
 Borrower id: {user.id}
     """
 
-    return asyncio.run(
-        send_telegram_notification(
-            bot_token=settings.TELEGRAM_BOT_TOKEN,
-            chat_id=settings.TELEGRAM_CHAT_ID,
-            text=message,
-        )
-    )
+    return enqueue_telegram_notification(message)
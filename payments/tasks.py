@@ -1,13 +1,18 @@
+import logging
+
 from celery import shared_task
 
-from .models import Payment
-from .stripe_api import StripeSessionHandler
+from .session_sweep import sweep_stripe_sessions
+
+logger = logging.getLogger(__name__)
 
 
 @shared_task
-def check_stripe_session_status():
-    payments = Payment.objects.all()
-    # session_is_expired returns True if expired
-    # and updates the payment status else return False
-    for payment in payments:
-        StripeSessionHandler.session_is_expired(payment)
+def check_stripe_session_status() -> dict:
+    stats = sweep_stripe_sessions()
+    logger.info(
+        "Checked %s Stripe Sessions in %s seconds",
+        stats["checked"],
+        stats["seconds"],
+    )
+    return stats
@@ -0,0 +1,82 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from payments.gateways import get_gateway
+from payments.models import Payment
+
+from test_utils.book_samples import book_sample
+from test_utils.borrowing_samples import borrowing_sample
+
+
+class PaymentPagesTests(TestCase):
+    def setUp(self) -> None:
+        self.gateway = get_gateway()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="Main@gmail.com", password="rvtquen"
+        )
+        self.client.force_authenticate(self.user)
+        request = self.client.get(reverse("payments:payment-list"))
+        borrowing = borrowing_sample(
+            book=book_sample("Snapshot Book"),
+            user=self.user,
+            request=request.wsgi_request,
+        )
+        self.payment = Payment.objects.get(borrowing=borrowing)
+        self.gateway.calls = 0
+
+    def success(self):
+        res = self.client.get(
+            reverse("payments:payment-success", args=[self.payment.id])
+        )
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        return res
+
+    def test_session_snapshot_is_saved_with_session(self):
+        session = self.gateway.sessions[self.payment.session_id]
+
+        res = self.success()
+
+        self.assertEqual(self.payment.session_currency, "usd")
+        self.assertEqual(
+            self.payment.session_amount_total, session.amount_total
+        )
+        self.assertEqual(res.data["total_price"], session.amount_total / 100)
+        self.assertEqual(res.data["payment_status"], "unpaid")
+        # snapshot is fresh, gateway isn't called
+        self.assertEqual(self.gateway.calls, 0)
+
+    def test_pending_payment_is_refreshed_after_ttl(self):
+        self.gateway.pay(self.payment.session_id)
+        Payment.objects.filter(id=self.payment.id).update(
+            session_checked_at=timezone.now() - timedelta(minutes=5)
+        )
+
+        res = self.success()
+
+        self.assertEqual(res.data["payment_status"], "paid")
+        self.assertEqual(self.gateway.calls, 1)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, "PAID")
+
+        # paid payment is served from snapshot
+        self.success()
+        self.assertEqual(self.gateway.calls, 1)
+
+    def test_snapshot_is_served_when_gateway_fails(self):
+        Payment.objects.filter(id=self.payment.id).update(
+            session_checked_at=timezone.now() - timedelta(minutes=5)
+        )
+        self.gateway.fail_next = 1
+
+        res = self.success()
+
+        self.assertEqual(res.data["payment_status"], "unpaid")
+        self.assertEqual(self.gateway.calls, 1)
@@ -0,0 +1,141 @@
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+
+from borrowings.models import Borrowing
+from payments.gateways import get_gateway
+from payments.models import Payment
+from payments.session_sweep import (
+    cancel_abandoned_checkouts,
+    sweep_stripe_sessions,
+)
+
+from test_utils.book_samples import book_sample
+
+
+class StripeSessionSweepTests(TestCase):
+    def setUp(self) -> None:
+        self.gateway = get_gateway()
+        self.gateway.reset()
+        self.user = get_user_model().objects.create_user(
+            email="Main@gmail.com", password="rvtquen"
+        )
+        self.borrowing = Borrowing.objects.create(
+            book=book_sample("Sweep Book"),
+            user=self.user,
+            expected_return_date=date.today() + timedelta(days=3),
+        )
+
+    def create_payment(
+        self, status: str = "PENDING", hours_ago: int = 25
+    ) -> Payment:
+        session = self.gateway.create_session(
+            name="Anon - Sweep Book",
+            amount=1500,
+            message="",
+            success_url="https://library/success",
+            cancel_url="https://library/cancel",
+        )
+        return Payment.objects.create(
+            status=status,
+            type="PAYMENT",
+            borrowing=self.borrowing,
+            session_id=session.id,
+            session_url=session.url,
+            money_to_pay=1500,
+            # sessions live 24 hours
+            session_expires_at=(
+                timezone.now() + timedelta(hours=24 - hours_ago)
+            ),
+        )
+
+    def test_final_sessions_of_pending_payments_are_swept(self):
+        failed = self.create_payment()
+        expired = self.create_payment()
+        paid = self.create_payment()
+        self.create_payment(status="PAID")
+        self.create_payment(hours_ago=1)
+        self.gateway.pay(paid.session_id)
+        # session lifetime has passed for payments created 25 hours ago
+        self.gateway.advance(25 * 60 * 60)
+        self.gateway.calls = 0
+        self.gateway.fail_next = 1
+
+        stats = sweep_stripe_sessions(batch_size=2, concurrency=1)
+
+        # paid and young sessions are not retrieved
+        self.assertEqual(self.gateway.calls, 3)
+        self.assertEqual(stats["checked"], 3)
+        self.assertEqual(stats["expired"], 1)
+        self.assertEqual(stats["paid"], 1)
+        self.assertIn("seconds", stats)
+
+        expired.refresh_from_db()
+        paid.refresh_from_db()
+        failed.refresh_from_db()
+        self.assertEqual(expired.status, "EXPIRED")
+        self.assertEqual(paid.status, "PAID")
+        # first retrieved session failed and is retried next run
+        self.assertEqual(failed.status, "PENDING")
+
+    def test_swept_payments_are_not_checked_again(self):
+        self.create_payment()
+        self.gateway.advance(25 * 60 * 60)
+
+        sweep_stripe_sessions()
+        stats = sweep_stripe_sessions()
+
+        self.assertEqual(stats["checked"], 0)
+
+    def test_recently_updated_payment_with_expired_session_is_swept(self):
+        payment = self.create_payment()
+        # unrelated change doesn't make session younger
+        payment.save()
+        self.gateway.advance(25 * 60 * 60)
+
+        stats = sweep_stripe_sessions()
+
+        self.assertEqual(stats["checked"], 1)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, "EXPIRED")
+
+    def create_payment_without_session(
+        self, borrowing: Borrowing, payment_type: str, minutes_ago: int
+    ) -> Payment:
+        payment = Payment.objects.create(
+            status="PENDING",
+            type=payment_type,
+            borrowing=borrowing,
+            money_to_pay=1500,
+        )
+        Payment.objects.filter(id=payment.id).update(
+            updated_at=timezone.now() - timedelta(minutes=minutes_ago)
+        )
+        return payment
+
+    def test_abandoned_checkout_is_cancelled(self):
+        book = book_sample("Abandoned Book", inventory=1)
+        abandoned = Borrowing.objects.create(
+            book=book,
+            user=self.user,
+            expected_return_date=date.today() + timedelta(days=3),
+        )
+        self.create_payment_without_session(abandoned, "PAYMENT", 11)
+        # checkout still waiting for Stripe
+        self.create_payment_without_session(self.borrowing, "PAYMENT", 1)
+        fine = self.create_payment_without_session(
+            self.borrowing, "FINE", 11
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            stats = sweep_stripe_sessions()
+
+        self.assertEqual(stats["cancelled"], 2)
+        self.assertFalse(Borrowing.objects.filter(id=abandoned.id).exists())
+        self.assertFalse(Payment.objects.filter(id=fine.id).exists())
+        self.assertTrue(self.borrowing.payments.exists())
+        book.refresh_from_db()
+        self.assertEqual(book.inventory, 2)
+        self.assertEqual(cancel_abandoned_checkouts(), 0)
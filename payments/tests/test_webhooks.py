@@ -0,0 +1,142 @@
+from datetime import date, timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from borrowings.models import Borrowing, TelegramNotification
+from payments.gateways import get_gateway
+from payments.models import Payment, StripeEvent
+
+from test_utils.book_samples import book_sample
+from test_utils.stripe_webhooks import (
+    StripeEventReplayer,
+    checkout_session_event,
+)
+
+WEBHOOK_SECRET = "whsec_test"
+
+
+@override_settings(
+    STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET, TELEGRAM_CHAT_ID="-100"
+)
+class StripeWebhookTests(TestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.replayer = StripeEventReplayer(self.client, WEBHOOK_SECRET)
+        self.user = get_user_model().objects.create_user(
+            email="Main@gmail.com", password="rvtquen"
+        )
+        self.borrowing = Borrowing.objects.create(
+            book=book_sample("Webhook Book"),
+            user=self.user,
+            expected_return_date=date.today() + timedelta(days=3),
+        )
+
+    def create_payment(self, session_id: str) -> Payment:
+        return Payment.objects.create(
+            status="PENDING",
+            type="PAYMENT",
+            borrowing=self.borrowing,
+            session_id=session_id,
+            session_url="https://checkout.stripe.com/pay",
+            money_to_pay=1500,
+        )
+
+    def test_completed_and_expired_events_update_payments(self):
+        paid = self.create_payment("cs_paid")
+        expired = self.create_payment("cs_expired")
+        notifications = TelegramNotification.objects.count()
+
+        responses = self.replayer.replay(
+            [
+                checkout_session_event("checkout.session.completed", "cs_paid"),
+                checkout_session_event(
+                    "checkout.session.expired", "cs_expired", "unpaid"
+                ),
+            ]
+        )
+
+        self.assertTrue(
+            all(res.status_code == status.HTTP_200_OK for res in responses)
+        )
+        paid.refresh_from_db()
+        expired.refresh_from_db()
+        self.assertEqual(paid.status, "PAID")
+        self.assertEqual(expired.status, "EXPIRED")
+        # success payment message
+        self.assertEqual(
+            TelegramNotification.objects.count(), notifications + 1
+        )
+
+    def test_redelivered_event_is_applied_once(self):
+        self.create_payment("cs_paid")
+        event = checkout_session_event("checkout.session.completed", "cs_paid")
+        notifications = TelegramNotification.objects.count()
+
+        self.replayer.replay([event, event])
+
+        self.assertEqual(StripeEvent.objects.count(), 1)
+        self.assertEqual(
+            TelegramNotification.objects.count(), notifications + 1
+        )
+
+    def test_unpaid_completed_session_stays_pending(self):
+        payment = self.create_payment("cs_async")
+
+        self.replayer.send(
+            checkout_session_event(
+                "checkout.session.completed", "cs_async", "unpaid"
+            )
+        )
+
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, "PENDING")
+
+    def test_event_with_invalid_signature_is_rejected(self):
+        payment = self.create_payment("cs_paid")
+
+        res = self.replayer.send(
+            checkout_session_event("checkout.session.completed", "cs_paid"),
+            secret="whsec_wrong",
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, "PENDING")
+        self.assertFalse(StripeEvent.objects.exists())
+
+    @override_settings(STRIPE_WEBHOOK_SECRET=None)
+    def test_event_without_configured_secret_is_retried(self):
+        payment = self.create_payment("cs_paid")
+
+        res = self.replayer.send(
+            checkout_session_event("checkout.session.completed", "cs_paid")
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, "PENDING")
+        self.assertFalse(StripeEvent.objects.exists())
+
+    def test_success_page_does_not_call_stripe(self):
+        payment = self.create_payment("cs_paid")
+        self.replayer.send(
+            checkout_session_event("checkout.session.completed", "cs_paid")
+        )
+        self.client.force_authenticate(self.user)
+
+        with mock.patch.object(
+            get_gateway(), "retrieve_session", side_effect=AssertionError
+        ):
+            res = self.client.get(
+                reverse("payments:payment-success", args=[payment.id])
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(res.data["payment_status"], "paid")
+        self.assertEqual(res.data["total_price"], 15)
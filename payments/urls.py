@@ -1,10 +1,18 @@
+from django.urls import path
+
 from rest_framework.routers import DefaultRouter
 
-from .views import PaymentViewSet
+from .views import PaymentViewSet, StripeWebhookView
 
 router = DefaultRouter()
 router.register("payments", PaymentViewSet)
 
-urlpatterns = router.urls
+urlpatterns = [
+    path(
+        "payments/webhook/",
+        StripeWebhookView.as_view(),
+        name="stripe-webhook",
+    ),
+] + router.urls
 
 app_name = "payments"
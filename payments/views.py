@@ -1,6 +1,8 @@
-from stripe.checkout import Session
+from datetime import timedelta
 
-from django.utils.timezone import datetime
+import stripe
+
+from django.conf import settings
 from django.utils import timezone
 
 from rest_framework import (
@@ -8,22 +10,24 @@ from rest_framework import (
     mixins,
     status,
 )
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from conditional_requests import ConditionalGetMixin
 
 from .serializers import (
     PaymentDetailSerializer,
     PaymentListSerializer,
 )
 from .models import Payment
-from .stripe_api import (
-    StripeSessionHandler,
-)
-from .success_payment_nofication import send_success_payment_notification
+from .session_sweep import refresh_payment_session
+from .webhooks import apply_session_events, construct_event
 
 
 class PaymentViewSet(
+    ConditionalGetMixin,
     mixins.ListModelMixin,
     mixins.RetrieveModelMixin,
     viewsets.GenericViewSet,
@@ -32,6 +36,9 @@ class PaymentViewSet(
     serializer_class = PaymentListSerializer
     permission_classes = [IsAuthenticated]
     filterset_fields = ["status", "type"]
+    # seek columns for ?pagination=cursor, see paginations.KeysetPagination
+    cursor_ordering = ("-id",)
+    conditional_fields = ("updated_at", "borrowing__book__updated_at")
 
     def get_queryset(self):
         user = self.request.user
@@ -52,51 +59,44 @@ class PaymentViewSet(
         }
         return self.serializer_class[self.action]
 
-    def _message(self, checkout_session: Session) -> dict:
-        # expire date which expressed in Unix timestamp
-        expire_date_seconds = checkout_session.get("expires_at")
-        # convert to Coordinated Universal Time (UTC)
-        expire_date_utc = datetime.utcfromtimestamp(expire_date_seconds)
-        # convert to local date
-        expire_date_local = expire_date_utc.astimezone(
-            timezone.get_current_timezone()
+    def _message(self, payment: Payment) -> dict:
+        """
+        Session information from payment session snapshot, PENDING
+        payment refreshes it from payment gateway after TTL
+        """
+        payment = refresh_payment_session(payment)
+        # payments saved before snapshot fields were added
+        expire_date = payment.session_expires_at or (
+            payment.updated_at
+            + timedelta(seconds=settings.STRIPE_SESSION_LIFETIME)
         )
-        formatted_expire_date = expire_date_local.strftime(
+        formatted_expire_date = timezone.localtime(expire_date).strftime(
             "%Y-%m-%d %H:%M:%S %Z"
         )
+        amount_total = payment.session_amount_total
+        if amount_total is None:
+            # money_to_pay is in cents like Stripe unit_amount
+            amount_total = payment.money_to_pay
 
         return {
             "expire_date": formatted_expire_date,
-            "payment_status": checkout_session.get("payment_status"),
-            "currency": checkout_session.get("currency"),
-            "total_price": checkout_session.get("amount_total") / 100,
+            "payment_status": (
+                "paid" if payment.status == Payment.Status.PAID else "unpaid"
+            ),
+            "currency": payment.session_currency or "usd",
+            "total_price": amount_total / 100,
         }
 
     @action(detail=True, methods=["get"])
     def success(self, request, *args, **kwargs):
         """
-        if payment was paid update Payment status
-        ot not.
+        Inform user about payment, it's marked as PAID by
+        checkout.session.completed webhook or here if webhook
+        hasn't arrived yet
         """
         payment = self.get_object()
-        checkout_session = StripeSessionHandler.get_checkout_session(
-            payment.session_id
-        )
-        # check if payment is already paid then there is no
-        # need to update and send telegram notification
-        if (
-            checkout_session.get("payment_status") == "paid"
-            and payment.status != "PAID"
-        ):
-            payment.status = "PAID"
-            payment.save()
-            send_success_payment_notification(payment.borrowing)
-            return Response(
-                self._message(checkout_session),
-                status=status.HTTP_204_NO_CONTENT
-            )
         return Response(
-            self._message(checkout_session), status=status.HTTP_204_NO_CONTENT
+            self._message(payment), status=status.HTTP_204_NO_CONTENT
         )
 
     @action(detail=True, methods=["get"])
@@ -105,10 +105,7 @@ class PaymentViewSet(
         Just inform user about payment can be paid later
         """
         payment = self.get_object()
-        checkout_session = StripeSessionHandler.get_checkout_session(
-            payment.session_id
-        )
-        message = self._message(checkout_session)
+        message = self._message(payment)
         message.update(
             {
                 "info": (
@@ -118,3 +115,38 @@ class PaymentViewSet(
             }
         )
         return Response(message, status=status.HTTP_204_NO_CONTENT)
+
+
+class StripeWebhookView(APIView):
+    """
+    Receive Stripe checkout.session.completed and
+    checkout.session.expired events and update payment status.
+    Stripe retries event until it gets 2xx response, so events
+    sent while STRIPE_WEBHOOK_SECRET isn't set are answered
+    with 503 and delivered again once it's configured
+    """
+
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    throttle_classes = []
+    schema = None
+
+    def post(self, request, *args, **kwargs):
+        if not settings.STRIPE_WEBHOOK_SECRET:
+            return Response(
+                {"detail": "Stripe webhook secret is not configured."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+
+        try:
+            event = construct_event(
+                request.body, request.headers.get("Stripe-Signature", "")
+            )
+        except (ValueError, stripe.error.SignatureVerificationError):
+            return Response(
+                {"detail": "Invalid Stripe event signature."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        apply_session_events([event])
+        return Response(status=status.HTTP_200_OK)
@@ -0,0 +1,86 @@
+import stripe
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Payment, StripeEvent
+from .success_payment_nofication import send_success_payment_notification
+
+
+def construct_event(payload: bytes, signature: str) -> stripe.Event:
+    """
+    Verify Stripe-Signature header and return event, raise
+    ValueError or stripe.error.SignatureVerificationError
+    """
+    return stripe.Webhook.construct_event(
+        payload.decode("utf-8"), signature, settings.STRIPE_WEBHOOK_SECRET
+    )
+
+
+def event_status(event) -> str:
+    """Return Payment status event moves its session to or None"""
+    session = event["data"]["object"]
+    if event["type"] == "checkout.session.expired":
+        return Payment.Status.EXPIRED
+    if (
+        event["type"] in (
+            "checkout.session.completed",
+            "checkout.session.async_payment_succeeded",
+        )
+        and session["payment_status"] == "paid"
+    ):
+        return Payment.Status.PAID
+    return None
+
+
+def record_events(events: list) -> list:
+    """Save event ids, return events which weren't processed before"""
+    new_events = []
+    for event in events:
+        try:
+            with transaction.atomic():
+                StripeEvent.objects.create(
+                    event_id=event["id"], type=event["type"]
+                )
+        except IntegrityError:
+            # redelivered event
+            continue
+        new_events.append(event)
+    return new_events
+
+
+def apply_session_events(events: list) -> int:
+    """
+    Update PENDING payments of event sessions with one UPDATE per
+    status and queue success notification for paid ones, in one
+    transaction with saved event ids, so each event is applied
+    once. Return number of updated payments
+    """
+    with transaction.atomic():
+        session_ids = {}
+        for event in record_events(events):
+            status = event_status(event)
+            if status:
+                session_ids.setdefault(status, []).append(
+                    event["data"]["object"]["id"]
+                )
+
+        updated = 0
+        for status, ids in session_ids.items():
+            payments = list(
+                Payment.objects.filter(
+                    session_id__in=ids, status=Payment.Status.PENDING
+                )
+                .select_related("borrowing__book", "borrowing__user")
+                .select_for_update(of=("self",))
+            )
+            updated += Payment.objects.filter(
+                id__in=[payment.id for payment in payments]
+            ).update(status=status, updated_at=timezone.now())
+
+            if status == Payment.Status.PAID:
+                for payment in payments:
+                    send_success_payment_notification(payment.borrowing)
+
+    return updated
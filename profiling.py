@@ -0,0 +1,197 @@
+import cProfile
+import logging
+import marshal
+import pstats
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection
+from django.http import Http404, HttpResponse
+
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from user.authentication import CachedJWTAuthentication
+
+logger = logging.getLogger(__name__)
+
+
+def _cache():
+    return caches[settings.PROFILER_CACHE]
+
+
+def is_cache_shared() -> bool:
+    """
+    Profile is downloaded by another request which can be served
+    by any worker, so PROFILER_CACHE must be shared by them
+    """
+    return not isinstance(_cache(), (LocMemCache, DummyCache))
+
+
+def _profile_key(profile_id: str) -> str:
+    return f"profiler:{profile_id}"
+
+
+class SqlRecorder:
+    """Database execute wrapper keeping every query with it's time"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.queries = []
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            if len(self.queries) < self.limit:
+                self.queries.append(
+                    {
+                        "sql": sql,
+                        "params": repr(params),
+                        "many": many,
+                        "ms": round((time.perf_counter() - start) * 1000, 3),
+                    }
+                )
+
+
+def is_staff_request(request) -> bool:
+    """
+    Staff session (admin) or staff JWT, authenticated before view
+    so profiling is never started for other users
+    """
+    user = getattr(request, "user", None)
+    if user is not None and user.is_staff:
+        return True
+    try:
+        authenticated = CachedJWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return False
+    return authenticated is not None and authenticated[0].is_staff
+
+
+def top_functions(profiler: cProfile.Profile, limit: int) -> list:
+    stats = pstats.Stats(profiler).sort_stats("cumulative")
+    functions = []
+    for function in stats.fcn_list[:limit]:
+        primitive_calls, calls, total, cumulative, _ = stats.stats[function]
+        filename, line, name = function
+        functions.append(
+            {
+                "function": f"{filename}:{line}({name})",
+                "calls": calls,
+                "total_ms": round(total * 1000, 3),
+                "cumulative_ms": round(cumulative * 1000, 3),
+            }
+        )
+    return functions
+
+
+class ProfilerMiddleware:
+    """
+    Profile request of staff user which sends PROFILER_HEADER with
+    cProfile and record all it's SQL queries with their time.
+    Profile is stored in PROFILER_CACHE for PROFILER_TTL, it's id is
+    returned in X-Profile-Id header, download it from
+    /profiles/<id>/ (summary and SQL) and /profiles/<id>/pstats/.
+    Requests without header only pay for header lookup
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if settings.PROFILER_HEADER not in request.headers:
+            return self.get_response(request)
+        if not is_staff_request(request):
+            return self.get_response(request)
+
+        recorder = SqlRecorder(settings.PROFILER_MAX_QUERIES)
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        elapsed = time.perf_counter() - start
+
+        profile_id = uuid.uuid4().hex
+        profiler.create_stats()
+        _cache().set(
+            _profile_key(profile_id),
+            {
+                "request": {
+                    "method": request.method,
+                    "path": request.get_full_path(),
+                    "status": response.status_code,
+                    "ms": round(elapsed * 1000, 3),
+                },
+                "sql_count": recorder.count,
+                "sql_ms": round(
+                    sum(query["ms"] for query in recorder.queries), 3
+                ),
+                "sql": recorder.queries,
+                "functions": top_functions(
+                    profiler, settings.PROFILER_TOP_FUNCTIONS
+                ),
+                "pstats": marshal.dumps(profiler.stats),
+            },
+            timeout=settings.PROFILER_TTL,
+        )
+        response["X-Profile-Id"] = profile_id
+        if not is_cache_shared():
+            logger.warning(
+                "Profile %s is stored in PROFILER_CACHE %r local to this "
+                "process, other workers can't serve it. Set REDIS_URL or "
+                "point PROFILER_CACHE to a shared cache",
+                profile_id,
+                settings.PROFILER_CACHE,
+            )
+        return response
+
+
+def get_profile(profile_id: str) -> dict:
+    profile = _cache().get(_profile_key(profile_id))
+    if profile is None:
+        raise Http404("Profile expired or doesn't exist")
+    return profile
+
+
+class ProfileView(APIView):
+    """Stored request profile: timings, SQL and slowest functions"""
+
+    permission_classes = (IsAdminUser,)
+    schema = None
+
+    def get(self, request, profile_id):
+        profile = get_profile(profile_id)
+        return Response(
+            {key: value for key, value in profile.items() if key != "pstats"}
+        )
+
+
+class ProfileStatsView(APIView):
+    """Stored request profile as pstats file (snakeviz, pstats)"""
+
+    permission_classes = (IsAdminUser,)
+    schema = None
+
+    def get(self, request, profile_id):
+        response = HttpResponse(
+            get_profile(profile_id)["pstats"],
+            content_type="application/octet-stream",
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="{profile_id}.prof"'
+        )
+        return response
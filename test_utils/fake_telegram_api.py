@@ -0,0 +1,77 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    # keep-alive connections like real Bot API
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        self.answer(url.path, dict(parse_qsl(url.query)))
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.answer(self.path, json.loads(body))
+
+    def answer(self, path: str, payload: dict):
+        with self.server.lock:
+            self.server.requests.append((path, payload))
+            rate_limited = bool(self.server.rate_limit_next)
+            if rate_limited:
+                self.server.rate_limit_next -= 1
+
+        if rate_limited:
+            status, data = 429, {
+                "ok": False,
+                "error_code": 429,
+                "description": "Too Many Requests: retry after 0",
+                "parameters": {"retry_after": 0},
+            }
+        else:
+            status, data = 200, {"ok": True, "result": {"message_id": 1}}
+
+        content = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeTelegramApi(ThreadingHTTPServer):
+    """
+    Local Bot API which accepts every sendMessage, set
+    `rate_limit_next` to answer that many requests with 429
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeTelegramHandler)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.connections = 0
+        self.rate_limit_next = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,22 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class OfflineTestRunner(DiscoverRunner):
+    """
+    Run tests with in-memory payment gateway, no Stripe calls,
+    and without exporting sampled traces
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.gateway_settings = override_settings(
+            PAYMENT_GATEWAY="payments.gateways.FakeGateway",
+            PAYMENT_GATEWAY_OPTIONS={},
+            TRACING_EXPORTER="",
+        )
+        self.gateway_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.gateway_settings.disable()
+        super().teardown_test_environment(**kwargs)
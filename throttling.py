@@ -0,0 +1,77 @@
+from django.conf import settings
+from django.core.cache import caches
+
+from rest_framework import throttling
+
+
+class SlidingWindowRateThrottle(throttling.SimpleRateThrottle):
+    """
+    Sliding window counter throttle. Requests are counted per fixed
+    window with atomic cache.incr() in THROTTLE_CACHE (Redis shared
+    by workers in production), rate is estimated as count of current
+    window plus count of previous window weighted by its part still
+    inside sliding window. Every check is 3 cache calls whatever
+    the rate is, instead of rewriting list of request timestamps
+    """
+
+    @property
+    def cache(self):
+        return caches[settings.THROTTLE_CACHE]
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        window, offset = divmod(self.now, self.duration)
+        self.elapsed = offset
+        current_key = f"{self.key}:{int(window)}"
+
+        # counter lives for current and next window, where
+        # it's used as previous one
+        self.cache.add(current_key, 0, timeout=self.duration * 2)
+        try:
+            self.current = self.cache.incr(current_key)
+        except ValueError:
+            # evicted between add() and incr()
+            self.cache.add(current_key, 1, timeout=self.duration * 2)
+            self.current = 1
+        self.previous = self.cache.get(f"{self.key}:{int(window) - 1}", 0)
+
+        weight = (self.duration - self.elapsed) / self.duration
+        if self.previous * weight + self.current > self.num_requests:
+            # rejected requests are not counted like in SimpleRateThrottle
+            self.cache.decr(current_key)
+            self.current -= 1
+            return self.throttle_failure()
+        return self.throttle_success()
+
+    def throttle_success(self):
+        return True
+
+    def wait(self):
+        # count next request can add to current window
+        available = self.num_requests - self.current - 1
+        if available <= 0 or not self.previous:
+            return self.duration - self.elapsed
+        # previous window weight decreases to zero at the window end
+        passes_at = (
+            self.duration * (self.previous - available) / self.previous
+        )
+        return max(passes_at - self.elapsed, 0)
+
+
+class AnonRateThrottle(
+    SlidingWindowRateThrottle, throttling.AnonRateThrottle
+):
+    pass
+
+
+class UserRateThrottle(
+    SlidingWindowRateThrottle, throttling.UserRateThrottle
+):
+    pass
@@ -0,0 +1,315 @@
+import atexit
+import inspect
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+import httpx
+from django.conf import settings
+from prometheus_client import Counter, Histogram
+
+logger = logging.getLogger("tracing")
+
+SPAN_SECONDS = Histogram(
+    "span_duration_seconds",
+    "Time of traced code blocks",
+    ["span"],
+    buckets=(
+        0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+        1, 2.5, 5, 10, 30, 60, 300, 900,
+    ),
+)
+
+SPANS_DROPPED = Counter(
+    "tracing_spans_dropped",
+    "Sampled spans dropped because export queue was full",
+)
+
+_current_span = ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    Timed block of code. Every span is observed in
+    span_duration_seconds histogram, sampled traces (sampling is
+    decided by root span) keep their children and are exported
+    when root span ends
+    """
+
+    def __init__(self, name: str, attributes: dict = None):
+        self.name = name
+        self.attributes = attributes or {}
+        self.children = []
+        self.error = None
+        self.parent = None
+        self.token = None
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def start(self) -> "Span":
+        self.parent = _current_span.get()
+        if self.parent is None:
+            self.trace_id = random.getrandbits(128)
+            self.sampled = random.random() < settings.TRACING_SAMPLE_RATE
+        else:
+            self.trace_id = self.parent.trace_id
+            self.sampled = self.parent.sampled
+        self.span_id = random.getrandbits(64)
+        self.token = _current_span.set(self)
+        self.start_ns = time.time_ns()
+        self.started = time.perf_counter()
+        return self
+
+    def finish(self, error: BaseException = None) -> None:
+        self.duration = time.perf_counter() - self.started
+        self.end_ns = self.start_ns + int(self.duration * 1e9)
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        _current_span.reset(self.token)
+
+        SPAN_SECONDS.labels(self.name).observe(self.duration)
+        if not self.sampled:
+            return
+        if self.parent is not None:
+            self.parent.children.append(self)
+        else:
+            get_exporter().export(self)
+
+    def __enter__(self) -> "Span":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        self.finish(exc)
+
+    def walk(self):
+        """Yield span and all it's descendants"""
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "ms": round(self.duration * 1000, 3),
+            **({"attributes": self.attributes} if self.attributes else {}),
+            **({"error": self.error} if self.error else {}),
+            **(
+                {"children": [child.as_dict() for child in self.children]}
+                if self.children
+                else {}
+            ),
+        }
+
+
+def span(name: str, **attributes) -> Span:
+    """
+    Time block as child of current span:
+        with span("borrowings.checkout", book=book_id):
+            ...
+    Works in sync code and coroutines, spans of tasks
+    started inside the block are its children
+    """
+    return Span(name, attributes)
+
+
+def current_span():
+    return _current_span.get()
+
+
+def traced(name: str = None):
+    """Decorator running sync or async function in span"""
+
+    def decorator(func):
+        span_name = name or f"{func.__module__}.{func.__qualname__}"
+
+        if inspect.iscoroutinefunction(func):
+
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with Span(span_name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with Span(span_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class NullExporter:
+    def export(self, root: Span) -> None:
+        pass
+
+
+class LogExporter:
+    """Write sampled trace as one JSON line to "tracing" logger"""
+
+    def export(self, root: Span) -> None:
+        logger.info(
+            json.dumps(
+                {"trace_id": f"{root.trace_id:032x}", **root.as_dict()},
+                default=str,
+            )
+        )
+
+
+class OtlpExporter:
+    """
+    Send sampled traces to OpenTelemetry collector with OTLP/HTTP
+    JSON encoding. Spans are queued and posted in batches by
+    background thread, so traced code never waits for collector
+    and spans are dropped if queue is full
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        interval: float = 5,
+        batch_size: int = 512,
+        max_queue_size: int = 10000,
+        transport: httpx.BaseTransport = None,
+    ):
+        self.endpoint = endpoint
+        self.interval = interval
+        self.batch_size = batch_size
+        self.queue = queue.Queue(max_queue_size)
+        self.client = httpx.Client(timeout=10, transport=transport)
+        self.thread = None
+        self.lock = threading.Lock()
+        self.dropped = 0
+        atexit.register(self.flush)
+
+    def export(self, root: Span) -> None:
+        self._start()
+        for item in root.walk():
+            try:
+                self.queue.put_nowait(item)
+            except queue.Full:
+                self.dropped += 1
+                SPANS_DROPPED.inc()
+
+    def _start(self) -> None:
+        if self.thread is not None and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                # threads don't survive fork of Celery prefork children
+                self.thread = threading.Thread(
+                    target=self._run, name="otlp-exporter", daemon=True
+                )
+                self.thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def flush(self) -> None:
+        while not self.queue.empty():
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch:
+                self.post(batch)
+
+    def post(self, spans: list) -> None:
+        try:
+            self.client.post(self.endpoint, json=otlp_payload(spans))
+        except httpx.HTTPError as error:
+            logger.warning(
+                "OTLP export of %s spans failed: %s", len(spans), error
+            )
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: dict) -> list:
+    return [
+        {"key": key, "value": _otlp_value(value)}
+        for key, value in attributes.items()
+    ]
+
+
+def otlp_payload(spans: list) -> dict:
+    """ExportTraceServiceRequest in OTLP JSON encoding"""
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": _otlp_attributes(
+                        {
+                            "service.name": settings.TRACING_SERVICE_NAME,
+                            "process.pid": os.getpid(),
+                        }
+                    )
+                },
+                "scopeSpans": [
+                    {
+                        "scope": {"name": "tracing"},
+                        "spans": [_otlp_span(item) for item in spans],
+                    }
+                ],
+            }
+        ]
+    }
+
+
+def _otlp_span(item: Span) -> dict:
+    data = {
+        "traceId": f"{item.trace_id:032x}",
+        "spanId": f"{item.span_id:016x}",
+        "name": item.name,
+        # SPAN_KIND_INTERNAL
+        "kind": 1,
+        "startTimeUnixNano": str(item.start_ns),
+        "endTimeUnixNano": str(item.end_ns),
+        "attributes": _otlp_attributes(item.attributes),
+    }
+    if item.parent is not None:
+        data["parentSpanId"] = f"{item.parent.span_id:016x}"
+    if item.error:
+        # STATUS_CODE_ERROR
+        data["status"] = {"code": 2, "message": item.error}
+    return data
+
+
+_exporters = {}
+
+
+def get_exporter():
+    """Return TRACING_EXPORTER ("log", "otlp" or "") of process"""
+    name = settings.TRACING_EXPORTER
+    if name not in _exporters:
+        if name == "log":
+            _exporters[name] = LogExporter()
+        elif name == "otlp":
+            _exporters[name] = OtlpExporter(
+                settings.TRACING_OTLP_ENDPOINT,
+                interval=settings.TRACING_EXPORT_INTERVAL,
+            )
+        else:
+            _exporters[name] = NullExporter()
+    return _exporters[name]
@@ -0,0 +1,52 @@
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import (
+    AuthenticationFailed,
+    InvalidToken,
+)
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .cache import get_cached_user
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication which loads token user through user cache
+    (see user.cache) instead of querying database on every request.
+    Saved or deleted user is reloaded on next request, changes made
+    with QuerySet.update() are seen after USER_AUTH_CACHE_TIMEOUT.
+    Cached user has no password hash, with CHECK_REVOKE_TOKEN
+    it's loaded from database for every request
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(
+                _("Token contained no recognizable user identification")
+            )
+
+        user = get_cached_user(user_id)
+        if user is None:
+            raise AuthenticationFailed(
+                _("User not found"), code="user_not_found"
+            )
+
+        if not user.is_active:
+            raise AuthenticationFailed(
+                _("User is inactive"), code="user_inactive"
+            )
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."),
+                    code="password_changed",
+                )
+
+        return user
@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+
+from versioned_cache import bump_version, start_version
+
+
+def _cache():
+    return caches[settings.USER_AUTH_CACHE]
+
+
+def _version_key(user_id) -> str:
+    return f"user:auth:version:{user_id}"
+
+
+def _user_key(user_id) -> str:
+    return f"user:auth:{user_id}"
+
+
+def get_cached_user(user_id):
+    """
+    Return user by id from cache or database, None if there is
+    no such user. Entry is stored with user version read before
+    database query and is served only while version is the same,
+    so user saved during the query is not cached stale.
+    Password hash is not loaded (nor cached), it's read from
+    database when accessed, saving user without it keeps it
+    """
+    version_key, user_key = _version_key(user_id), _user_key(user_id)
+    cached = _cache().get_many([version_key, user_key])
+    version = cached.get(version_key)
+    entry = cached.get(user_key)
+    if version is not None and entry is not None and entry[0] == version:
+        return entry[1]
+
+    if version is None:
+        version = start_version(_cache(), version_key)
+
+    user = (
+        get_user_model().objects.defer("password").filter(pk=user_id).first()
+    )
+    if user is not None:
+        _cache().set(
+            user_key, (version, user), timeout=settings.USER_AUTH_CACHE_TIMEOUT
+        )
+    return user
+
+
+def invalidate_cached_user(user_id) -> None:
+    """Make cached user stale after current transaction commits"""
+    bump_version(_cache(), _version_key(user_id))
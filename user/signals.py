@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalidate_cached_user
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_user_cache(sender, instance, **kwargs):
+    """
+    Saved (deactivated, promoted, password changed) or deleted
+    user is reloaded
+    """
+    invalidate_cached_user(instance.pk)
@@ -1,3 +1,109 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from rest_framework import status
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from test_utils.book_samples import book_sample
+
+ME_URL = reverse("user:manage")
+BOOK_LIST_URL = reverse("book:book-list")
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(
+            email="Main@gmail.com", password="rvtquen"
+        )
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+
+    def test_user_is_loaded_once(self):
+        self.client.get(ME_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["email"], "Main@gmail.com")
+
+    def test_cached_catalog_needs_no_queries(self):
+        book_sample("Cached Book")
+        self.client.get(BOOK_LIST_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(BOOK_LIST_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_saved_user_is_reloaded(self):
+        self.client.get(ME_URL)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                ME_URL, {"first_name": "Renamed", "password": "rvtquen"}
+            )
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.data["first_name"], "Renamed")
+
+    def test_deactivated_user_is_rejected(self):
+        self.client.get(ME_URL)
+
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_user_is_rejected(self):
+        self.client.get(ME_URL)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_hash_is_not_cached(self):
+        self.client.get(ME_URL)
+
+        _, user = caches[settings.USER_AUTH_CACHE].get(
+            f"user:auth:{self.user.pk}"
+        )
+        self.assertNotIn("password", user.__dict__)
+        # deferred hash is loaded when needed
+        self.assertEqual(user.password, self.user.password)
+
+    def test_password_change_reloads_user(self):
+        self.client.get(ME_URL)
+
+        self.user.set_password("changed")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+
+        with self.assertNumQueries(1):
+            self.client.get(ME_URL)
+        self.assertTrue(
+            get_user_model().objects.get().check_password("changed")
+        )
+
+    def test_saving_cached_user_keeps_password(self):
+        self.client.get(ME_URL)
+        _, user = caches[settings.USER_AUTH_CACHE].get(
+            f"user:auth:{self.user.pk}"
+        )
+
+        user.first_name = "Renamed"
+        user.save()
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, "Renamed")
+        self.assertTrue(self.user.check_password("rvtquen"))
@@ -1,7 +1,7 @@
 from rest_framework import generics
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from rest_framework_simplejwt.authentication import JWTAuthentication
 
+from .authentication import CachedJWTAuthentication
 from .serializers import UserSerializer
 
 
@@ -16,7 +16,7 @@ class ManagerUserView(generics.RetrieveUpdateAPIView):
     """Return current user and authentication is required"""
 
     serializer_class = UserSerializer
-    authentication_classes = (JWTAuthentication,)
+    authentication_classes = (CachedJWTAuthentication,)
     permission_classes = (IsAuthenticated,)
 
     def get_object(self):
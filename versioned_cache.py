@@ -0,0 +1,39 @@
+import time
+
+from django.db import transaction
+
+
+def start_version(cache, key: str) -> int:
+    """
+    Store version under key if it's missing (first call or
+    evicted) and return current one. Version starts from current
+    time so it never goes back to a number used before
+    """
+    cache.add(key, time.time_ns(), timeout=None)
+    return cache.get(key, time.time_ns())
+
+
+def get_version(cache, key: str) -> int:
+    """
+    Return current version, cached entries are stored under
+    the version they were built from
+    """
+    version = cache.get(key)
+    if version is None:
+        version = start_version(cache, key)
+    return version
+
+
+def bump_version(cache, key: str) -> None:
+    """
+    Make entries of current version stale after current transaction
+    commits, so no reader caches not committed data
+    """
+
+    def bump():
+        try:
+            cache.incr(key)
+        except ValueError:
+            start_version(cache, key)
+
+    transaction.on_commit(bump)